@@ -1,116 +1,218 @@
 # App.py
 import os
-import tensorflow as tf
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, request, jsonify, send_from_directory, Response, stream_with_context, abort, g, has_request_context
 from flask_cors import CORS
 import uuid
 import numpy as np
-from PIL import Image
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+import cv2
 import io
 import base64
+import hashlib
+import re
+import json
+import zipfile
+import time
+import tempfile
+import importlib.util
+import functools
+import hmac
+import gzip
+import signal
+import threading
+from contextlib import contextmanager
+from concurrent.futures import wait, FIRST_COMPLETED, ALL_COMPLETED
+from batching import MicroBatcher
+from cascade import ModelCascade
+from charts import render_chart, CHART_KINDS
+from embedding_index import EmbeddingIndex
+from backends import load_backend, converted_model_path
+from ingest import decode_image_bytes
+from jobs import JobQueue, QueueFull
+from labels import class_labels, organ_categories, readable_class_names, taxonomy
+from metrics import MetricsRegistry, StageTimings, timed, resident_memory_bytes
+from model_registry import ModelRegistry, ModelVersion
+from prediction_cache import PredictionCache
+from runtime_profile import DEFAULT_PROFILE_PATH, apply_environment, load_profile
+from slides import SlideReader, predict_slide
+from startup import StartupTracker
+from storage import StorageManager
+from taxonomy import Taxonomy
 
 # ============= GPU MEMORY MANAGEMENT =============
-# Set memory growth to avoid OOM errors
-physical_devices = tf.config.list_physical_devices('GPU')
-if physical_devices:
-    # Allow memory growth - prevents allocating all memory at once
-    for device in physical_devices:
+def configure_devices():
+    """GPU memory growth and limits, or CPU-only mode when no GPU is present"""
+    global DEVICE
+    if INFERENCE_DEVICE != 'gpu':
+        # CPU fleet: CUDA stays hidden (see apply_environment) and is never probed
+        print("Inference device: CPU")
+        return
+
+    # Set memory growth to avoid OOM errors
+    physical_devices = tf.config.list_physical_devices('GPU')
+    if physical_devices:
+        # Allow memory growth - prevents allocating all memory at once
+        for device in physical_devices:
+            try:
+                tf.config.experimental.set_memory_growth(device, True)
+                print(f"Memory growth enabled for {device}")
+            except Exception as e:
+                print(f"Error setting memory growth: {e}")
+    
+        # Optional: Limit GPU memory to a specific amount (in MB)
         try:
-            tf.config.experimental.set_memory_growth(device, True)
-            print(f"Memory growth enabled for {device}")
+            tf.config.set_logical_device_configuration(
+                physical_devices[0],
+                [tf.config.LogicalDeviceConfiguration(memory_limit=4096)]  # Limit to 4GB
+            )
+            print("GPU memory limited to 4GB")
         except Exception as e:
-            print(f"Error setting memory growth: {e}")
-    
-    # Optional: Limit GPU memory to a specific amount (in MB)
-    try:
-        tf.config.set_logical_device_configuration(
-            physical_devices[0],
-            [tf.config.LogicalDeviceConfiguration(memory_limit=4096)]  # Limit to 4GB
-        )
-        print("GPU memory limited to 4GB")
-    except Exception as e:
-        print(f"Error limiting GPU memory: {e}")
-else:
-    print("No GPU found, using CPU")
-    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'  # Force CPU usage
+            print(f"Error limiting GPU memory: {e}")
+        DEVICE = '/GPU:0'
+    else:
+        print("No GPU found, using CPU")
+        os.environ['CUDA_VISIBLE_DEVICES'] = '-1'  # Force CPU usage
+
+class SizeLimitedRequest(Request):
+    """Request whose body limit can be set per endpoint (Flask 2.3's max_content_length is read-only)"""
+    body_limit = None
+
+    @property
+    def max_content_length(self):
+        return self.body_limit if self.body_limit is not None else super().max_content_length
 
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = SizeLimitedRequest
 CORS(app)  # Enable CORS for all routes
 
 # Configuration
+# Runtime profile (threads, oneDNN, affinity, batch size), written by
+# autotune.py; explicit environment variables override its values
+RUNTIME_PROFILE = os.environ.get('RUNTIME_PROFILE', DEFAULT_PROFILE_PATH)
+runtime_profile = load_profile(RUNTIME_PROFILE)
+# 'cpu' (default) never touches CUDA; 'gpu' runs configure_devices() and predicts on the first GPU
+INFERENCE_DEVICE = os.environ.get('INFERENCE_DEVICE', runtime_profile["device"])
+apply_environment(runtime_profile, INFERENCE_DEVICE)  # before TensorFlow is imported
+DEVICE = '/CPU:0'
 UPLOAD_FOLDER = 'uploads'
 VISUALIZATION_FOLDER = 'visualizations'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tiff'}
-MODEL_PATH = 'model/resnet152V2_model.keras'
+EXTENSION_CODES = sorted(ALLOWED_EXTENSIONS)  # compact extension ids in the similar-case index
+MODEL_PATH = os.environ.get('MODEL_PATH', 'model/resnet152V2_model.keras')
+# Model runtime: 'keras' (full precision), 'tflite-fp16', 'tflite-int8' or 'onnx'
+# (converted files are created with convert_model.py)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'keras')
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0)) or runtime_profile["intra_op_threads"]
+INFERENCE_INTER_OP_THREADS = (int(os.environ.get('INFERENCE_INTER_OP_THREADS', 0))
+                              or runtime_profile["inter_op_threads"])
+# tflite-int8 only: run without XNNPACK so the weights are read in place from the
+# mapped file and shared by all serve.py workers (much less memory, slower inference)
+TFLITE_SHARED_WEIGHTS = os.environ.get('TFLITE_SHARED_WEIGHTS', '0') == '1'
+# 'eager' loads the model while App.py is imported; 'background' starts
+# serving immediately and loads/warms up the model on a separate thread
+# (see /api/health/live and /api/health/ready)
+MODEL_LOADING = os.environ.get('MODEL_LOADING', 'eager')
+# Keep a copy of each original upload (written asynchronously, off the request path)
+SAVE_UPLOADS = os.environ.get('SAVE_UPLOADS', '1') != '0'
+
+# Charts: 'server' returns lazily rendered PNG URLs, 'client' leaves drawing to the frontend
+CHART_RENDERING = os.environ.get('CHART_RENDERING', 'server')
+CHART_MAX_AGE = 7 * 24 * 3600  # rendered charts never change for a given id
+CHART_FILENAME_RE = re.compile(r'([0-9a-f-]+)_(' + '|'.join(CHART_KINDS) + r')\.png')
+
+# Class metadata (/api/classes) only changes with a deploy; clients revalidate by ETag
+CLASSES_MAX_AGE = int(os.environ.get('CLASSES_MAX_AGE', 30 * 24 * 3600))
+# ?format=compact predictions: classes listed in top_indices, and smallest body worth gzipping
+COMPACT_TOP_K = 4
+GZIP_MIN_BYTES = 256
+
+# Prediction cache: in-memory LRU plus an optional size-capped disk tier
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 1024))
+PREDICTION_CACHE_DIR = os.environ.get('PREDICTION_CACHE_DIR')  # unset disables the disk tier
+PREDICTION_CACHE_DISK_MB = int(os.environ.get('PREDICTION_CACHE_DISK_MB', 512))
+
+# Asynchronous job API
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 8))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 64))
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 600))  # seconds finished jobs are kept
+# Directory shared by all worker processes, so any worker can answer polls and
+# event streams of a job (serve.py sets it); unset keeps job state in memory
+JOB_STATE_DIR = os.environ.get('JOB_STATE_DIR')
+SSE_HEARTBEAT_SECONDS = 15
+
+# Grad-CAM explanations
+MAX_EXPLAIN_IMAGES = 8
+MAX_EXPLAIN_TOP_K = 5
+# The Grad-CAM graph is traced on the first /api/explain. GRADCAM_WARM_UP=1
+# traces it in the background once the model serves, which makes that first
+# call fast at the cost of the graph's memory in every worker.
+GRADCAM_WARM_UP = os.environ.get('GRADCAM_WARM_UP', '0') == '1'
+
+# Instrumentation: /api/metrics is always on; SERVER_TIMING=1 adds a
+# per-request Server-Timing header with the stage breakdown
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+
+# Optional two-stage cascade: a small first-stage model answers images whose
+# top-1 probability is at least CASCADE_THRESHOLD (and whose margin over the
+# runner-up is at least CASCADE_MIN_MARGIN); the rest escalate to the full
+# model. Pick the values with calibrate_cascade.py. Unset CASCADE_MODEL_PATH
+# disables the cascade.
+CASCADE_MODEL_PATH = os.environ.get('CASCADE_MODEL_PATH')
+CASCADE_BACKEND = os.environ.get('CASCADE_BACKEND', 'keras')
+CASCADE_THRESHOLD = float(os.environ.get('CASCADE_THRESHOLD', 0.9))
+CASCADE_MIN_MARGIN = float(os.environ.get('CASCADE_MIN_MARGIN', 0.0))
 
-# Create necessary directories
-for folder in [UPLOAD_FOLDER, VISUALIZATION_FOLDER]:
-    if not os.path.exists(folder):
-        os.makedirs(folder)
+# Similar-case search: the penultimate (pooled) features of every full-model
+# prediction come out of the same forward pass and are appended to a
+# memory-mapped index (Keras backend only; an empty value disables it)
+SIMILAR_INDEX_DIR = os.environ.get('SIMILAR_INDEX_DIR', 'embeddings')
+EMBEDDINGS_ENABLED = bool(SIMILAR_INDEX_DIR) and INFERENCE_BACKEND == 'keras'
+MAX_SIMILAR_K = 50
+
+# Whole-slide TIFFs (/api/predict/slide, needs the optional tifffile package):
+# read region by region, background tiles skipped with a tissue mask and the
+# tissue tiles batched through the model. SLIDE_DIR (unset disables) lets
+# clients name slides already on the server instead of uploading them.
+SLIDE_DIR = os.environ.get('SLIDE_DIR')
+SLIDE_MAX_SIZE = int(os.environ.get('SLIDE_MAX_MB', 4096)) * 1024 * 1024
+SLIDE_TILE_SIZE = int(os.environ.get('SLIDE_TILE_SIZE', 224))  # tile side in full-resolution pixels
+SLIDE_MIN_TISSUE = float(os.environ.get('SLIDE_MIN_TISSUE', 0.25))  # tissue fraction for a tile to be scored
+SLIDE_JOB_WORKERS = int(os.environ.get('SLIDE_JOB_WORKERS', 1))
+SLIDE_JOB_QUEUE_SIZE = int(os.environ.get('SLIDE_JOB_QUEUE_SIZE', 8))
+
+# Micro-batching: concurrent requests share one forward pass
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 0)) or runtime_profile["batch_size"] or 16
+MAX_BATCH_WAIT_MS = float(os.environ.get('MAX_BATCH_WAIT_MS', 10))
+
+# Storage lifecycle for uploads/ and visualizations/: size caps, and a TTL
+# counted from last access ('lru') or creation ('fifo')
+UPLOAD_MAX_MB = int(os.environ.get('UPLOAD_MAX_MB', 2048))
+VISUALIZATION_MAX_MB = int(os.environ.get('VISUALIZATION_MAX_MB', 512))
+STORAGE_TTL_HOURS = float(os.environ.get('STORAGE_TTL_HOURS', 72))  # 0 keeps files until evicted for size
+STORAGE_EVICTION = os.environ.get('STORAGE_EVICTION', 'lru')
+STORAGE_SWEEP_SECONDS = float(os.environ.get('STORAGE_SWEEP_SECONDS', 60))
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['VISUALIZATION_FOLDER'] = VISUALIZATION_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB max upload
-
-# Class labels and category grouping
-class_labels = [
-    'all_benign', 'all_early', 'all_pre', 'all_pro',
-    'brain_glioma', 'brain_menin', 'brain_notumor', 'brain_tumor',
-    'breast_benign', 'breast_malignant',
-    'cervix_dyk', 'cervix_koc', 'cervix_mep', 'cervix_pab', 'cervix_sfi',
-    'colon_aca', 'colon_bnt',
-    'kidney_normal', 'kidney_tumor',
-    'lung_aca', 'lung_bnt', 'lung_scc',
-    'lymph_cll', 'lymph_fl', 'lymph_mcl',
-    'oral_normal', 'oral_scc'
-]
 
-# Organ categories
-organ_categories = {
-    'Brain': ['brain_glioma', 'brain_menin', 'brain_notumor', 'brain_tumor'],
-    'Breast': ['breast_benign', 'breast_malignant'],
-    'Cervix': ['cervix_dyk', 'cervix_koc', 'cervix_mep', 'cervix_pab', 'cervix_sfi'],
-    'Colon': ['colon_aca', 'colon_bnt'],
-    'Kidney': ['kidney_normal', 'kidney_tumor'],
-    'Lung': ['lung_aca', 'lung_bnt', 'lung_scc'],
-    'Lymph': ['lymph_cll', 'lymph_fl', 'lymph_mcl'],
-    'Oral': ['oral_normal', 'oral_scc'],
-    'General': ['all_benign', 'all_early', 'all_pre', 'all_pro']
-}
-
-# Readable class names
-readable_class_names = {
-    'all_benign': 'Benign (General)',
-    'all_early': 'Early Stage Cancer',
-    'all_pre': 'Pre-cancerous',
-    'all_pro': 'Progressive Cancer',
-    'brain_glioma': 'Brain Glioma',
-    'brain_menin': 'Brain Meningioma',
-    'brain_notumor': 'Brain - No Tumor',
-    'brain_tumor': 'Brain Tumor',
-    'breast_benign': 'Breast - Benign',
-    'breast_malignant': 'Breast - Malignant',
-    'cervix_dyk': 'Cervix Dyskeratosis',
-    'cervix_koc': 'Cervix Koilocytosis',
-    'cervix_mep': 'Cervix Metaplasia',
-    'cervix_pab': 'Cervix Parabasal',
-    'cervix_sfi': 'Cervix Superficial',
-    'colon_aca': 'Colon Adenocarcinoma',
-    'colon_bnt': 'Colon - Benign',
-    'kidney_normal': 'Kidney - Normal',
-    'kidney_tumor': 'Kidney Tumor',
-    'lung_aca': 'Lung Adenocarcinoma',
-    'lung_bnt': 'Lung - Benign',
-    'lung_scc': 'Lung Squamous Cell Carcinoma',
-    'lymph_cll': 'Lymphoma CLL',
-    'lymph_fl': 'Lymphoma Follicular',
-    'lymph_mcl': 'Lymphoma Mantle Cell',
-    'oral_normal': 'Oral - Normal',
-    'oral_scc': 'Oral Squamous Cell Carcinoma'
+# Sharded stores with background eviction (they create their folders)
+upload_storage = StorageManager(UPLOAD_FOLDER, max_bytes=UPLOAD_MAX_MB * 1024 * 1024,
+                                ttl=STORAGE_TTL_HOURS * 3600 or None, policy=STORAGE_EVICTION,
+                                sweep_interval=STORAGE_SWEEP_SECONDS)
+visualization_storage = StorageManager(VISUALIZATION_FOLDER, max_bytes=VISUALIZATION_MAX_MB * 1024 * 1024,
+                                       ttl=STORAGE_TTL_HOURS * 3600 or None, policy=STORAGE_EVICTION,
+                                       sweep_interval=STORAGE_SWEEP_SECONDS)
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB max single-image upload
+MAX_BATCH_UPLOAD_SIZE = int(os.environ.get('MAX_BATCH_UPLOAD_MB', 512)) * 1024 * 1024
+# Total decompressed size of the zip archives in one batch upload (zip bomb guard)
+MAX_BATCH_UNCOMPRESSED_SIZE = int(os.environ.get('MAX_BATCH_UNCOMPRESSED_MB', 2048)) * 1024 * 1024
+# Request body limits, enforced while the body is read (also for chunked uploads
+# without Content-Length): single images by default, larger for these endpoints
+app.config['MAX_CONTENT_LENGTH'] = MAX_IMAGE_SIZE
+ENDPOINT_BODY_LIMITS = {
+    'predict_batch': MAX_BATCH_UPLOAD_SIZE,
+    'submit_slide': SLIDE_MAX_SIZE,
+    'explain': MAX_EXPLAIN_IMAGES * MAX_IMAGE_SIZE,
 }
 
 # NEW: Cancer information database with details about each cancer type
@@ -279,161 +381,808 @@ cancer_information = {
     }
 }
 
-# Load the CNN model
-print("Loading CNN model...")
-try:
-    # Try loading with GPU first
-    model = tf.keras.models.load_model(MODEL_PATH)
-    print("Model loaded successfully with GPU")
-except (tf.errors.ResourceExhaustedError, tf.errors.InternalError) as e:
-    print(f"Failed to load model with GPU: {e}")
-    print("Attempting to load model with CPU only...")
-    
-    # Force CPU usage
-    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'  
-    model = tf.keras.models.load_model(MODEL_PATH)
-    print("Model loaded successfully with CPU")
+# Model runtime, filled in by the loading steps below. TensorFlow itself is
+# imported there, so with MODEL_LOADING=background the HTTP server answers
+# probes while it loads.
+tf = None
+first_stage_backend = None
+
+def import_tensorflow():
+    global tf
+    import tensorflow
+    tf = tensorflow
+
+    # Per-process thread budget (serve.py sets it for each worker); must be
+    # applied before TensorFlow runs its first op
+    if INFERENCE_THREADS:
+        tf.config.threading.set_intra_op_parallelism_threads(INFERENCE_THREADS)
+    if INFERENCE_INTER_OP_THREADS:
+        tf.config.threading.set_inter_op_parallelism_threads(INFERENCE_INTER_OP_THREADS)
+
+def load_keras_model(path):
+    """Load a CNN model file (only the Keras backend needs the full Keras weights in memory)"""
+    print(f"Loading CNN model {path}...")
+    try:
+        # Try loading with GPU first
+        keras_model = tf.keras.models.load_model(path)
+        print("Model loaded successfully with GPU")
+    except (tf.errors.ResourceExhaustedError, tf.errors.InternalError) as e:
+        print(f"Failed to load model with GPU: {e}")
+        print("Attempting to load model with CPU only...")
+
+        # Force CPU usage
+        os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+        keras_model = tf.keras.models.load_model(path)
+        print("Model loaded successfully with CPU")
+    return keras_model
+
+def model_version_from_file(path):
+    """Identify a model file by name, size and modification time"""
+    stat = os.stat(path)
+    fingerprint = f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:12]
+
+def cache_version_for(version):
+    """Cache namespace of a model version (cached results also depend on the cascade)"""
+    if not CASCADE_MODEL_PATH:
+        return version
+    cascade_fingerprint = (f"{version}:{model_version_from_file(CASCADE_MODEL_PATH)}:"
+                           f"{CASCADE_THRESHOLD}:{CASCADE_MIN_MARGIN}")
+    return hashlib.sha1(cascade_fingerprint.encode('utf-8')).hexdigest()[:12]
+
+def make_inference_engine(backend, stage_name='forward'):
+    """Micro-batching engine over one backend; request handlers submit single images to it"""
+    def run_inference_batch(batch):
+        # Softmax batch, or (softmax, embeddings) when the backend extracts embeddings
+        batch_size_observed.observe(len(batch))
+        with timed(stage_latency, stage_name), tf.device(DEVICE):
+            return backend.predict(batch)
+
+    return MicroBatcher(run_inference_batch, MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS)
+
+def load_serving_model(path, version=None, role='active'):
+    """
+    Load one model version and prepare everything that serves with it.
+
+    The Keras backend compiles a tf.function with a fixed input signature once
+    and reuses it for every batch; memory stays bounded by the single traced
+    graph and MAX_BATCH_SIZE rather than by clearing Keras global state.
+
+    Args:
+        path: .keras model file (converted backends load the file next to it)
+        version: Version id (default: fingerprint of the model file)
+        role: 'active', or 'shadow' for a version that only mirrors traffic
+            (no embeddings, separate latency stage)
+
+    Returns:
+        ModelVersion with backend, engine, classifier, keras_model,
+        gradcam_layer, similar_index and cache_version components
+    """
+    from inference import warm_up
+
+    version = version or (os.environ.get('MODEL_VERSION') if path == MODEL_PATH else None) or model_version_from_file(
+        converted_model_path(path, INFERENCE_BACKEND))
+    keras_model = load_keras_model(path) if INFERENCE_BACKEND == 'keras' else None
+    gradcam_layer = None
+    if keras_model is not None:
+        from gradcam import find_last_conv_layer
+        gradcam_layer = find_last_conv_layer(keras_model)  # output of the convolutional trunk
+
+    print(f"Loading {INFERENCE_BACKEND} inference backend for model version {version}...")
+    with tf.device(DEVICE):
+        backend = load_backend(INFERENCE_BACKEND, path, keras_model, num_threads=INFERENCE_THREADS,
+                               with_embeddings=EMBEDDINGS_ENABLED and role == 'active',
+                               max_batch_size=MAX_BATCH_SIZE, shared_weights=TFLITE_SHARED_WEIGHTS)
+        # TFLite allocates one interpreter per batch bucket; create them all before serving
+        warm_up(backend.predict, batch_sizes=getattr(backend, 'batch_buckets', (1, MAX_BATCH_SIZE)))
+    print("Inference backend warmed up")
+
+    # Embeddings of different versions are not comparable, so each version has its own index
+    similar_index = None
+    if backend.embedding_dim:
+        index_dir = os.path.join(SIMILAR_INDEX_DIR, version)
+        similar_index = EmbeddingIndex(index_dir, backend.embedding_dim)
+        print(f"Similar-case index: {len(similar_index)} embeddings in {index_dir}")
+
+    engine = make_inference_engine(backend, 'forward' if role == 'active' else 'forward_shadow')
+    # Request handlers classify through the cascade (plain full-model inference when disabled)
+    classifier = ModelCascade(first_stage_engine, engine, CASCADE_THRESHOLD, CASCADE_MIN_MARGIN,
+                              on_decision=cascade_decisions.inc)
+    served = ModelVersion(version, path, backend=backend, engine=engine, classifier=classifier,
+                          keras_model=keras_model, gradcam_layer=gradcam_layer, similar_index=similar_index,
+                          cache_version=cache_version_for(version), retired=False)
+    if GRADCAM_WARM_UP and keras_model is not None and role == 'active':
+        threading.Thread(target=warm_up_explanations, args=(served,), name='gradcam-warm-up', daemon=True).start()
+    return served
+
+def warm_up_explanations(served):
+    """Trace the default Grad-CAM function after readiness is reported (GRADCAM_WARM_UP=1)"""
+    from gradcam import release_model, warm_up as warm_up_gradcam
+
+    startup.wait()
+    if served.retired:
+        return
+    try:
+        with tf.device(DEVICE):
+            warm_up_gradcam(served.keras_model, served.gradcam_layer)
+    except Exception as e:
+        print(f"Grad-CAM warm-up failed: {e}")
+    if served.retired:
+        # Replaced while tracing; drop the graph retire_serving_model() could not see yet
+        release_model(served.keras_model)
+
+def retire_serving_model(served):
+    """Release a replaced version once its in-flight requests have finished"""
+    served.retired = True
+    served.engine.close()
+    if served.keras_model is not None:
+        # Cached Grad-CAM graphs hold the model and are keyed by id(), which may be reused
+        from gradcam import release_model
+        release_model(served.keras_model)
+    print(f"Model version {served.version} retired")
+
+def record_shadow_result(served_version, shadow_version, agreed):
+    shadow_comparisons.inc(served_version, shadow_version)
+    if not agreed:
+        shadow_disagreements.inc(served_version, shadow_version)
+
+# Versions live next to MODEL_PATH; the active/shadow choice is kept in
+# MODEL_STATE_FILE so restarts and sibling workers serve the same versions
+# (set it empty to always load MODEL_PATH, as the offline tools do)
+MODEL_DIR = os.path.dirname(os.path.abspath(MODEL_PATH))
+MODEL_STATE_FILE = os.environ.get('MODEL_STATE_FILE', os.path.join(MODEL_DIR, 'active_model.json')) or None
+# Shared secret for the /api/models admin routes (unset disables them)
+MODEL_ADMIN_TOKEN = os.environ.get('MODEL_ADMIN_TOKEN')
+MODEL_DRAIN_SECONDS = float(os.environ.get('MODEL_DRAIN_SECONDS', 300))
+
+model_registry = ModelRegistry(load_serving_model, on_retire=retire_serving_model, on_shadow=record_shadow_result,
+                               state_path=MODEL_STATE_FILE, drain_timeout=MODEL_DRAIN_SECONDS)
+
+def load_initial_model():
+    # The saved choice (from an earlier hot-swap) wins over MODEL_PATH
+    if model_registry.read_state() is not None:
+        model_registry.sync()
+    else:
+        model_registry.load(MODEL_PATH)
+
+def load_first_stage():
+    global first_stage_backend
+    if not CASCADE_MODEL_PATH:
+        return
+
+    from inference import warm_up
+
+    print(f"Loading first-stage {CASCADE_BACKEND} model {CASCADE_MODEL_PATH}...")
+    with tf.device(DEVICE):
+        first_stage_backend = load_backend(CASCADE_BACKEND, CASCADE_MODEL_PATH, num_threads=INFERENCE_THREADS,
+                                           max_batch_size=MAX_BATCH_SIZE)
+        warm_up(first_stage_backend.predict,
+                batch_sizes=getattr(first_stage_backend, 'batch_buckets', (1, MAX_BATCH_SIZE)))
+    print("First-stage model warmed up")
+
+MODEL_LOADING_STEPS = [
+    ('import_tensorflow', import_tensorflow),
+    ('configure_devices', configure_devices),
+    ('load_first_stage', load_first_stage),
+    ('load_model', load_initial_model),
+]
+startup = StartupTracker([name for name, _ in MODEL_LOADING_STEPS])
+
+# Per-process metrics, served in Prometheus text format at /api/metrics
+metrics = MetricsRegistry()
+requests_total = metrics.counter('http_requests_total', 'HTTP requests by method, route and status',
+                                 ('method', 'route', 'status'))
+request_latency = metrics.histogram('http_request_duration_seconds',
+                                    'Time to produce the response headers, by route', ('route',))
+stage_latency = metrics.histogram('prediction_stage_duration_seconds',
+                                  'Latency of each prediction pipeline stage', ('stage',))
+errors_total = metrics.counter('prediction_errors_total', 'Failed predictions by exception type', ('type',))
+batch_size_observed = metrics.histogram('inference_batch_size', 'Images per forward pass', (),
+                                        buckets=(1, 2, 4, 8, 16, 32, 64))
+metrics.gauge('inference_queue_depth', 'Images waiting for the micro-batcher',
+              lambda: model_registry.active.engine.queue_depth if model_registry.active else 0)
+cascade_decisions = metrics.counter('cascade_decisions_total',
+                                    'Images answered by the first stage or escalated to the full model',
+                                    ('stage',))
+shadow_comparisons = metrics.counter('shadow_comparisons_total',
+                                     'Served predictions also scored by the shadow model version',
+                                     ('served_version', 'shadow_version'))
+shadow_disagreements = metrics.counter('shadow_disagreements_total',
+                                       'Shadow comparisons whose top-1 class differed',
+                                       ('served_version', 'shadow_version'))
+metrics.gauge('job_queue_depth', 'Jobs waiting for a job worker', lambda: prediction_jobs.queue_depth)
+metrics.gauge('slide_job_queue_depth', 'Slide jobs waiting for a slide worker', lambda: slide_jobs.queue_depth)
+metrics.gauge('process_resident_memory_bytes', 'Resident memory of this process', resident_memory_bytes)
+
+def stage(name):
+    """Time a pipeline stage into stage_latency and, within a request, its Server-Timing"""
+    return timed(stage_latency, name, g.get('timings') if has_request_context() else None)
+
+def record_error(error):
+    errors_total.inc(type(error).__name__)
+
+@contextmanager
+def serving_version():
+    """Serve one request with the active model version (reported in the X-Model-Version header)"""
+    with model_registry.use() as served:
+        if has_request_context():
+            g.model_version = served.version
+        yield served
+
+def run_model_batch(batch):
+    """Softmax outputs of the active model version for a stacked batch of preprocessed images"""
+    batch_size_observed.observe(len(batch))
+    with model_registry.use() as served, timed(stage_latency, 'forward'), tf.device(DEVICE):
+        outputs = served.backend.predict(batch)
+    return outputs[0] if isinstance(outputs, tuple) else outputs
+
+def run_first_stage_batch(batch):
+    """Forward pass of the cascade's first-stage model"""
+    with timed(stage_latency, 'forward_first_stage'), tf.device(DEVICE):
+        return first_stage_backend.predict(batch)
+
+# The first stage is shared by all versions of the full model
+first_stage_engine = (MicroBatcher(run_first_stage_batch, MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS)
+                      if CASCADE_MODEL_PATH else None)
+
+# Results are keyed by upload content and by the model version that produced them
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_SIZE,
+    disk_dir=PREDICTION_CACHE_DIR,
+    disk_max_bytes=PREDICTION_CACHE_DISK_MB * 1024 * 1024
+)
+
+if MODEL_LOADING == 'background':
+    startup.run_in_background(MODEL_LOADING_STEPS)
+else:
+    startup.run(MODEL_LOADING_STEPS)
 
 # Helper functions
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def preprocess_image(image_path, target_size=(224, 224)):
-    """Preprocess image for model prediction"""
-    img = Image.open(image_path).convert("RGB")
-    img = img.resize(target_size)
-    img_array = np.array(img)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = img_array / 255.0  # Normalize
-    return img_array
+def preprocess_image(image, target_size=(224, 224)):
+    """Preprocess image for model prediction (raw encoded bytes or a file path)"""
+    if not isinstance(image, (bytes, bytearray)):
+        with open(image, 'rb') as f:
+            image = f.read()
+    img_array = decode_image_bytes(image, target_size)
+    # Raw uint8 pixels: the serving graph normalizes them, so queued images
+    # stay 1 byte per channel and no float copy is made here
+    return np.expand_dims(img_array, axis=0)
 
 def get_organ_from_class(class_name):
     """Get the organ category for a given class"""
-    for organ, classes in organ_categories.items():
-        if class_name in classes:
-            return organ
-    return "Other"
+    return taxonomy.organ_of(class_name)
 
-def create_visualization(prediction_data, filename_base):
-    """Create visualization charts for prediction results"""
-    visualizations = {}
-
-    # 1. Top 5 Bar Chart
-    plt.figure(figsize=(10, 6))
-    top_indices = np.argsort(list(prediction_data['all_confidences'].values()))[-5:]
-    top_classes = [class_labels[i] for i in top_indices]
-    top_values = [prediction_data['all_confidences'][cls] for cls in top_classes]
-    top_readable = [readable_class_names.get(cls, cls) for cls in top_classes]
-
-    plt.barh(top_readable, top_values, color='skyblue')
-    plt.xlabel('Confidence')
-    plt.title('Top 5 Predictions')
-    plt.tight_layout()
-
-    # Save to binary stream
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    bar_vis_path = os.path.join(app.config['VISUALIZATION_FOLDER'], f"{filename_base}_bar.png")
-    with open(bar_vis_path, 'wb') as f:
-        f.write(buf.read())
-    plt.close()
-
-    # 2. Organ-wise Grouped Bar Chart
-    plt.figure(figsize=(12, 8))
-
-    # Group predictions by organ
-    organs = {}
-    for cls, conf in prediction_data['all_confidences'].items():
-        organ = get_organ_from_class(cls)
-        if organ not in organs:
-            organs[organ] = []
-        organs[organ].append((cls, conf))
-
-    # Flatten for plotting
-    organs_list = []
-    organ_confs = []
-    colors = []
-
-    for organ, class_confs in organs.items():
-        max_conf_class, max_conf = max(class_confs, key=lambda x: x[1])
-        organs_list.append(organ)
-        organ_confs.append(max_conf)
-        colors.append('crimson' if max_conf_class in ['all_early', 'all_pre', 'all_pro',
-                                                    'brain_glioma', 'brain_menin', 'brain_tumor',
-                                                    'breast_malignant', 'cervix_dyk', 'cervix_koc',
-                                                    'colon_aca', 'kidney_tumor', 'lung_aca', 'lung_scc',
-                                                    'lymph_cll', 'lymph_fl', 'lymph_mcl',
-                                                    'oral_scc'] else 'forestgreen')
-
-    plt.barh(organs_list, organ_confs, color=colors)
-    plt.xlabel('Max Confidence')
-    plt.title('Organ-wise Highest Confidence')
-    plt.tight_layout()
-
-    # Save to binary stream
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    organ_vis_path = os.path.join(app.config['VISUALIZATION_FOLDER'], f"{filename_base}_organ.png")
-    with open(organ_vis_path, 'wb') as f:
-        f.write(buf.read())
-    plt.close()
-
-    # 3. Pie Chart for Malignant vs Benign
-    plt.figure(figsize=(8, 8))
-
-    # Calculate total malignant vs benign probability
-    benign_classes = ['all_benign', 'brain_notumor', 'breast_benign', 'colon_bnt',
-                    'kidney_normal', 'lung_bnt', 'oral_normal']
-
-    benign_prob = sum(
-        prediction_data['all_confidences'][cls] for cls in benign_classes if cls in prediction_data['all_confidences'])
-    malignant_prob = sum(prediction_data['all_confidences'][cls] for cls in class_labels
-                        if cls not in benign_classes and cls in prediction_data['all_confidences'])
-
-    # Normalize to ensure they sum to 1
+def build_chart_data(prediction, summary=None):
+    """
+    Raw numbers behind the three result charts, for server- or client-side rendering.
+
+    Args:
+        prediction: Softmax vector of one image
+        summary: This image's row of taxonomy.summarize(), when already computed for a batch
+    """
+    if summary is None:
+        summary = Taxonomy.row(taxonomy.summarize(prediction), 0)
+
+    # Top 5 classes, lowest first (bar chart order)
+    top_indices = np.argsort(prediction)[-5:]
+    top5 = [{
+        "class": class_labels[i],
+        "readable_name": readable_class_names.get(class_labels[i], class_labels[i]),
+        "confidence": float(prediction[i])
+    } for i in top_indices]
+
+    # Highest-confidence class per organ
+    organ_data = [{
+        "organ": organ,
+        "class": class_labels[summary["organ_argmax"][i]],
+        "confidence": float(summary["organ_max"][i]),
+        "is_malignant": bool(taxonomy.confirmed_malignant_mask[summary["organ_argmax"][i]])
+    } for i, organ in enumerate(taxonomy.organs)]
+
+    # Total benign vs malignant probability, normalized to sum to 1
+    benign_prob = float(summary["benign"])
+    malignant_prob = float(summary["malignant"])
     total = benign_prob + malignant_prob
     if total > 0:
         benign_prob /= total
         malignant_prob /= total
 
-    plt.pie([benign_prob, malignant_prob], labels=['Benign', 'Malignant/Abnormal'],
-            colors=['forestgreen', 'crimson'], autopct='%1.1f%%', startangle=90)
-    plt.axis('equal')
-    plt.title('Benign vs Malignant Assessment')
-
-    # Save to binary stream
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    pie_vis_path = os.path.join(app.config['VISUALIZATION_FOLDER'], f"{filename_base}_pie.png")
-    with open(pie_vis_path, 'wb') as f:
-        f.write(buf.read())
-    plt.close()
-
-    # Return all visualization paths
-    visualizations = {
+    return {
+        "top5": top5,
+        "organs": organ_data,
+        "benign_vs_malignant": {"benign": benign_prob, "malignant": malignant_prob}
+    }
+
+def create_visualization(prediction_data, filename_base):
+    """
+    Register the charts for a prediction and return their filenames.
+
+    Only the confidence vector is stored here; each PNG is rendered from it on
+    the first GET of its /visualizations URL and then served from disk.
+    """
+    confidences = np.array([prediction_data['all_confidences'][cls] for cls in class_labels], dtype=np.float32)
+    buffer = io.BytesIO()
+    np.save(buffer, confidences)
+    visualization_storage.put(f"{filename_base}.npy", buffer.getvalue())
+
+    return {
         'bar_chart': f"{filename_base}_bar.png",
         'organ_chart': f"{filename_base}_organ.png",
         'pie_chart': f"{filename_base}_pie.png"
     }
 
-    return visualizations
+def restore_artifacts(result, image_bytes):
+    """
+    Re-register the files a cached result points to.
+
+    The storage sweep may have evicted the upload or the chart payload since the
+    result was cached; both are rebuilt under the same names so its URLs stay valid.
+    """
+    if SAVE_UPLOADS:
+        # put() is a no-op (plus an LRU touch) when the upload is still on disk
+        upload_storage.put_async(result["filename"], image_bytes)
+    charts = result.get("visualizations")
+    if charts:
+        chart_id = CHART_FILENAME_RE.fullmatch(charts["bar_chart"]).group(1)
+        if visualization_storage.exists(f"{chart_id}.npy"):
+            visualization_storage.touch(f"{chart_id}.npy")
+        else:
+            create_visualization(result, chart_id)
+
+def index_embedding(similar_index, cache_key, embedding, prediction, extension):
+    """Add a full-model embedding to a version's similar-case index (no-op without one)"""
+    if similar_index is None or embedding is None:
+        return
+    try:
+        similar_index.add(cache_key, embedding, int(np.argmax(prediction)), EXTENSION_CODES.index(extension))
+    except Exception as e:
+        print(f"Could not index embedding: {e}")
+
+def wants_compact():
+    """Whether this request asked for compact results (?format=compact|full)"""
+    return request.args.get('format', 'full') == 'compact'
+
+def compact_result(result):
+    """
+    Compact form of a prediction result: only the numbers that vary per image.
+
+    'probabilities' is ordered like class_labels (GET /api/classes) and
+    'top_indices' lists the COMPACT_TOP_K most likely classes, best first;
+    names and medical texts are joined on the client from /api/classes.
+    """
+    probabilities = np.array([result["all_confidences"][label] for label in class_labels], dtype=np.float32)
+    compact = {
+        # Float32 precision: str() gives the shortest repr that round-trips (~9 digits instead of ~17)
+        "probabilities": [float(str(p)) for p in probabilities],
+        "top_indices": np.argsort(-probabilities, kind='stable')[:COMPACT_TOP_K].tolist(),
+        "model_version": result["meta"].get("model_version"),
+        "cascade_stage": result["meta"].get("cascade_stage"),
+        "filename": result["filename"],
+        "classes_etag": class_metadata_etag
+    }
+    if "visualizations" in result:
+        compact["visualizations"] = result["visualizations"]
+    return compact
+
+def encoded_response(body, mimetype='application/json', status=200):
+    """Response for a serialized body, gzipped when the client accepts it and it is worth it"""
+    response = Response(body, status=status, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    if len(body) >= GZIP_MIN_BYTES and request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def wants_server_charts():
+    """Whether this request should get server-rendered chart URLs (?charts=server|client)"""
+    return request.args.get('charts', CHART_RENDERING) != 'client'
+
+def build_prediction_result(prediction, filename, summary=None, cascade_stage='full', model_version=None):
+    """
+    Assemble the response object for one image's softmax vector.
+
+    Args:
+        summary: This image's row of taxonomy.summarize(), when already computed for a batch
+        cascade_stage: Model that produced prediction ('first' stage or 'full' model)
+        model_version: Version of the full model serving the request
+    """
+    if summary is None:
+        summary = Taxonomy.row(taxonomy.summarize(prediction), 0)
+    top_index = int(summary["top_index"])
+    top_class = class_labels[top_index]
+    top_organ = taxonomy.organs[summary["top_organ"]]
+    top_confidence = float(prediction[top_index])
+
+    class_confidences = {label: float(pred) for label, pred in zip(class_labels, prediction)}
+
+    # Create base result object
+    result = {
+        "prediction": {
+            "class": top_class,
+            "confidence": top_confidence,
+            "readable_name": readable_class_names.get(top_class, top_class),
+            "organ": top_organ
+        },
+        "all_confidences": class_confidences,
+        "filename": filename,
+        "meta": {
+            "organ": top_organ,
+            "is_malignant": bool(summary["top_is_malignant"]),
+            "cascade_stage": cascade_stage,
+            "model_version": model_version
+        }
+    }
+
+    # Add medical information for the predicted class
+    if top_class in cancer_information:
+        result["cancer_info"] = cancer_information[top_class]
+    else:
+        result["cancer_info"] = {
+            "description": "Information not available for this classification.",
+            "details": "Please consult with a healthcare professional for more information.",
+            "patient_implications": "A medical professional should interpret these results.",
+            "common_treatments": "Treatment options should be discussed with your healthcare provider."
+        }
+
+    # Add top 3 alternative predictions with their information
+    top3_indices = np.argsort(prediction)[-4:-1][::-1]  # Get indices of top 3 after the best one
+    top3_classes = [class_labels[i] for i in top3_indices]
+    top3_confidences = [float(prediction[i]) for i in top3_indices]
+
+    result["alternatives_info"] = []
+    for cls, conf in zip(top3_classes, top3_confidences):
+        alt_info = {
+            "class": cls,
+            "confidence": conf,
+            "readable_name": readable_class_names.get(cls, cls),
+            "organ": get_organ_from_class(cls)
+        }
+
+        if cls in cancer_information:
+            alt_info["brief_info"] = cancer_information[cls]["description"]
+        else:
+            alt_info["brief_info"] = "Information not available for this classification."
+
+        result["alternatives_info"].append(alt_info)
+
+    result["chart_data"] = build_chart_data(prediction, summary)
+
+    return result
+
+# Request instrumentation
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.timings = StageTimings()
 
-def clear_session_after_predict():
-    """Clear TF session to free memory after prediction"""
-    tf.keras.backend.clear_session()
+@app.before_request
+def limit_request_body():
+    # Must run before anything touches request.files / form, which read the body
+    request.body_limit = ENDPOINT_BODY_LIMITS.get(request.endpoint)
+
+@app.errorhandler(413)
+def request_too_large(error):
+    limit = request.max_content_length
+    message = f"Upload too large. Maximum size allowed is {limit // (1024 * 1024)}MB"
+    if request.endpoint == 'predict':
+        message += " (use /api/predict/slide for whole-slide TIFFs)"
+    return jsonify({"error": message}), 413
+
+@app.after_request
+def record_request(response):
+    # Streaming responses are measured up to their headers, not their last byte
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    elapsed = time.perf_counter() - g.request_started
+    requests_total.inc(request.method, route, str(response.status_code))
+    request_latency.observe(elapsed, route)
+    if SERVER_TIMING:
+        g.timings.add('total', elapsed)
+        response.headers['Server-Timing'] = g.timings.header()
+    model_version = g.get('model_version') or (model_registry.active.version if model_registry.active else None)
+    if model_version is not None:
+        response.headers['X-Model-Version'] = model_version
+    return response
+
+# Routes that need the model answer 503 until loading has finished
+MODEL_ENDPOINTS = {'predict', 'submit_job', 'predict_batch', 'explain', 'similar', 'submit_slide',
+                   'activate_model', 'shadow_model'}
+
+@app.before_request
+def require_model():
+    if request.endpoint in MODEL_ENDPOINTS and not startup.ready:
+        status = startup.snapshot()
+        response = jsonify({"error": "Model is not loaded yet" if not startup.failed else "Model failed to load",
+                            "startup": status})
+        response.status_code = 503
+        if not startup.failed:
+            response.headers['Retry-After'] = '5'
+        return response
 
 # API Routes
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """API health check endpoint"""
-    return jsonify({"status": "ok", "model_loaded": model is not None})
+    return jsonify({"status": "ok", "model_loaded": startup.ready,
+                    "backend": INFERENCE_BACKEND, "startup": startup.snapshot(),
+                    "model_version": model_registry.active.version if model_registry.active else None,
+                    "shadow_version": model_registry.shadow.version if model_registry.shadow else None,
+                    "cascade": {"enabled": first_stage_engine is not None, "threshold": CASCADE_THRESHOLD,
+                                "min_margin": CASCADE_MIN_MARGIN},
+                    "runtime": {"device": DEVICE, "intra_op_threads": INFERENCE_THREADS,
+                                "inter_op_threads": INFERENCE_INTER_OP_THREADS,
+                                "onednn": os.environ.get('TF_ENABLE_ONEDNN_OPTS'),
+                                "max_batch_size": MAX_BATCH_SIZE}})
+
+@app.route('/api/health/live', methods=['GET'])
+def liveness():
+    """Liveness probe: the process serves requests (fails only if model loading failed)"""
+    if startup.failed:
+        return jsonify({"status": "failed", "error": startup.error}), 500
+    return jsonify({"status": "ok"})
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 with progress before"""
+    status = startup.snapshot()
+    return jsonify(status), 200 if startup.ready else 503
+
+# Static per-class metadata, serialized (and gzipped) once; the ETag is a hash of the content
+class_metadata_body = json.dumps({
+    "class_labels": class_labels,
+    "readable_class_names": readable_class_names,
+    "organ_categories": organ_categories,
+    "cancer_information": cancer_information
+}, sort_keys=True, separators=(',', ':')).encode('utf-8')
+class_metadata_gzip = gzip.compress(class_metadata_body, compresslevel=9, mtime=0)
+class_metadata_etag = hashlib.sha256(class_metadata_body).hexdigest()[:32]
+
+@app.route('/api/classes', methods=['GET'])
+def classes():
+    """
+    Class labels (in probability order), readable names, organs and medical information.
+
+    Clients fetch this once and join it with compact predictions
+    (?format=compact). Served with a strong ETag and a long max-age; a
+    matching If-None-Match gets 304.
+    """
+    gzipped = bool(request.accept_encodings['gzip'])
+    # Each content coding is a different representation, so it gets its own strong ETag
+    etag = f"{class_metadata_etag}-gzip" if gzipped else class_metadata_etag
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(class_metadata_gzip if gzipped else class_metadata_body, mimetype='application/json')
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = CLASSES_MAX_AGE
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Prediction cache hit/miss counters and sizes"""
+    return jsonify(prediction_cache.stats())
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/storage', methods=['GET'])
+def storage_stats():
+    """Disk usage and eviction counters of the upload and chart stores"""
+    return jsonify({"uploads": upload_storage.stats(),
+                    "visualizations": visualization_storage.stats()})
+
+# Model version admin: list, hot-swap and shadow versions without a restart
+def require_admin():
+    """403 response unless the request carries MODEL_ADMIN_TOKEN (None when authorized)"""
+    token = request.headers.get('X-Admin-Token', '')
+    if not MODEL_ADMIN_TOKEN or not hmac.compare_digest(token.encode('utf-8'), MODEL_ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({"error": "Model administration requires a valid X-Admin-Token"}), 403
+    return None
+
+def model_file_from_request():
+    """
+    Model file named in the JSON body ({"model": "<file in MODEL_DIR>"}).
+
+    Returns:
+        (path, version, None), or (None, None, error response)
+    """
+    body = request.get_json(silent=True) or {}
+    name = body.get("model")
+    if not isinstance(name, str) or os.path.basename(name) != name or not name.endswith('.keras'):
+        return None, None, (jsonify({"error": "Provide the .keras file name of a model in MODEL_DIR"}), 400)
+    path = os.path.join(MODEL_DIR, name)
+    if not os.path.exists(converted_model_path(path, INFERENCE_BACKEND)):
+        return None, None, (jsonify({"error": f"Model not found: {name}"}), 404)
+    version = body.get("version")
+    # Versions name directories (similar-case index, cache), so '.' and '..' must not pass
+    if version is not None and not re.fullmatch(r'[A-Za-z0-9][\w.-]{0,63}', str(version)):
+        return None, None, (jsonify({"error": "version must start with a letter or digit and may only contain "
+                                              "letters, digits, '.', '_' and '-'"}), 400)
+    return path, version, None
+
+def publish_model_state():
+    """Persist the chosen versions and have sibling workers load them too"""
+    model_registry.save_state()
+    master_pid = os.environ.get('SERVE_MASTER_PID')
+    if master_pid:
+        # serve.py forwards SIGHUP to every worker, which then syncs from MODEL_STATE_FILE
+        os.kill(int(master_pid), signal.SIGHUP)
+
+def start_model_load(path, version, role, fraction=0.0):
+    try:
+        model_registry.load_in_background(path, version, role, fraction, on_done=publish_model_state)
+    except RuntimeError as e:
+        return jsonify({"error": str(e), "models": model_registry.snapshot()}), 409
+    return jsonify({"status": "loading", "models": model_registry.snapshot()}), 202
+
+@app.route('/api/models', methods=['GET'])
+def list_models():
+    """Active and shadow model versions, swap history and the model files available in MODEL_DIR"""
+    denied = require_admin()
+    if denied:
+        return denied
+    available = []
+    for name in sorted(os.listdir(MODEL_DIR)):
+        if name.endswith('.keras') and os.path.exists(converted_model_path(os.path.join(MODEL_DIR, name),
+                                                                          INFERENCE_BACKEND)):
+            path = converted_model_path(os.path.join(MODEL_DIR, name), INFERENCE_BACKEND)
+            available.append({"model": name, "version": model_version_from_file(path)})
+    return jsonify({**model_registry.snapshot(), "available": available})
+
+@app.route('/api/models/activate', methods=['POST'])
+def activate_model():
+    """
+    Hot-swap the serving model.
+
+    The model ({"model": "<file in MODEL_DIR>", "version": optional id}) is
+    loaded and warmed up in the background while the current version keeps
+    serving; new requests then switch to it and the old version is released
+    once its in-flight requests have finished. Poll GET /api/models for the
+    outcome.
+    """
+    denied = require_admin()
+    if denied:
+        return denied
+    path, version, error = model_file_from_request()
+    if error:
+        return error
+    return start_model_load(path, version, 'active')
+
+@app.route('/api/models/shadow', methods=['POST', 'DELETE'])
+def shadow_model():
+    """
+    Start (POST {"model", "fraction"}) or stop (DELETE) shadowing traffic.
+
+    A sampled fraction of full-model predictions is also scored by the shadow
+    version in the background; only the active version's answer is returned.
+    Top-1 disagreements are counted in GET /api/models and in the
+    shadow_disagreements_total metric.
+    """
+    denied = require_admin()
+    if denied:
+        return denied
+    if request.method == 'DELETE':
+        model_registry.set_shadow(None, 0.0)
+        publish_model_state()
+        return jsonify(model_registry.snapshot())
+
+    path, version, error = model_file_from_request()
+    if error:
+        return error
+    try:
+        fraction = float((request.get_json(silent=True) or {}).get("fraction", 0.1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "fraction must be a number"}), 400
+    if not 0.0 < fraction <= 1.0:
+        return jsonify({"error": "fraction must be in (0, 1]"}), 400
+    return start_model_load(path, version, 'shadow', fraction)
+
+def sync_model_state(signum, frame):
+    """SIGHUP: load the versions recorded in MODEL_STATE_FILE (another worker switched)"""
+    if not startup.ready:
+        return
+    threading.Thread(target=model_registry.sync, name='model-sync', daemon=True).start()
+
+if threading.current_thread() is threading.main_thread() and hasattr(signal, 'SIGHUP'):
+    signal.signal(signal.SIGHUP, sync_model_state)
+
+def run_prediction(image_bytes, extension, server_charts=True, report=None):
+    """
+    Full prediction pipeline for one uploaded image.
+
+    Args:
+        image_bytes: Encoded image bytes
+        extension: Lower-case file extension of the upload
+        server_charts: Include lazily rendered chart URLs in the result
+        report: Optional callable receiving the current stage name
+
+    Returns:
+        Result dict as returned by /api/predict
+    """
+    report = report or (lambda stage: None)
+
+    # The version serving this request stays loaded until it returns, even across a hot-swap
+    with serving_version() as served:
+        return predict_with_version(served, image_bytes, extension, server_charts, report)
+
+def mirror_to_shadow(served, image, prediction, cache_key):
+    """Score a sampled request with the shadow version in the background and compare top-1 answers"""
+    shadow = model_registry.sample_shadow()
+    if shadow is None:
+        return
+
+    def compare(future):
+        try:
+            output = future.result()
+            shadow_prediction = output[0] if isinstance(output, tuple) else output
+            model_registry.record_shadow(served.version, shadow, prediction, shadow_prediction, cache_key)
+        except Exception as e:
+            shadow.release()
+            print(f"Shadow prediction failed: {e}")
+
+    shadow.engine.submit(image).add_done_callback(compare)
+
+def predict_with_version(served, image_bytes, extension, server_charts, report):
+    # Identical uploads (re-submissions, client retries) reuse the stored result
+    with stage('cache_lookup'):
+        cache_key = prediction_cache.key_for(image_bytes)
+        result = prediction_cache.get(cache_key, served.cache_version)
+    if result is not None:
+        with stage('restore_artifacts'):
+            restore_artifacts(result, image_bytes)
+    else:
+        # Uploads are stored under their content hash, so duplicates share one file
+        filename = upload_storage.content_name(image_bytes, extension)
+        if SAVE_UPLOADS:
+            with stage('save_upload'):
+                upload_storage.put_async(filename, image_bytes)
+
+        report('preprocessing')
+        with stage('preprocess'):
+            preprocessed_img = preprocess_image(image_bytes)
+
+        # Queue for batched inference and wait for this image's softmax row
+        report('inference')
+        with stage('inference'):
+            prediction, cascade_stage, embedding = served.classifier.submit(preprocessed_img[0]).result()
+        if cascade_stage == 'full':
+            mirror_to_shadow(served, preprocessed_img[0], prediction, cache_key)
+        with stage('assemble'):
+            result = build_prediction_result(prediction, filename, cascade_stage=cascade_stage,
+                                             model_version=served.version)
+        with stage('index_embedding'):
+            index_embedding(served.similar_index, cache_key, embedding, prediction, extension)
+
+        # Chart URLs only register the confidence vector; PNGs render on first GET
+        with stage('visualization'):
+            result["visualizations"] = create_visualization(result, uuid.uuid4().hex)
+
+        prediction_cache.put(cache_key, result, served.cache_version)
+
+    if not server_charts:
+        result.pop("visualizations", None)
+    return result
 
 @app.route('/api/predict', methods=['POST'])
 def predict():
-    """Process image and return cancer prediction"""
+    """
+    Process image and return cancer prediction.
+
+    ?format=compact returns only the probability array and top class indices
+    (joined with GET /api/classes on the client), gzipped if accepted.
+    """
+    if request.content_length is not None and request.content_length > MAX_IMAGE_SIZE:
+        return jsonify({"error": "File too large. Maximum size allowed is 10MB "
+                                 "(use /api/predict/slide for whole-slide TIFFs)"}), 413
+
     if 'image' not in request.files:
         return jsonify({"error": "No image provided"}), 400
 
@@ -443,95 +1192,560 @@ def predict():
         return jsonify({"error": "No selected file"}), 400
 
     if file and allowed_file(file.filename):
-        filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
         try:
-            preprocessed_img = preprocess_image(filepath)
-            
-            # Execute prediction with memory optimization
-            with tf.device('/CPU:0'):  # Force CPU prediction for stability
-                prediction = model.predict(preprocessed_img, verbose=0)[0]
+            extension = file.filename.rsplit('.', 1)[1].lower()
+            result = run_prediction(file.read(), extension, wants_server_charts())
+            if wants_compact():
+                return encoded_response(json.dumps(compact_result(result)).encode('utf-8'))
+            return jsonify(result)
 
-            top_index = int(np.argmax(prediction))
-            top_class = class_labels[top_index]
-            top_confidence = float(prediction[top_index])
+        except Exception as e:
+            record_error(e)
+            return jsonify({"error": str(e)}), 500
 
-            class_confidences = {label: float(pred) for label, pred in zip(class_labels, prediction)}
+    return jsonify({"error": "File type not allowed"}), 400
 
-            # Create base result object
-            result = {
-                "prediction": {
-                    "class": top_class,
-                    "confidence": top_confidence,
-                    "readable_name": readable_class_names.get(top_class, top_class),
-                    "organ": get_organ_from_class(top_class)
-                },
-                "all_confidences": class_confidences,
-                "filename": filename,
-                "meta": {
-                    "organ": get_organ_from_class(top_class),
-                    "is_malignant": top_class not in ['all_benign', 'brain_notumor', 'breast_benign',
-                                                    'colon_bnt', 'kidney_normal', 'lung_bnt', 'oral_normal']
-                }
+def run_prediction_job(payload, report):
+    """Job queue handler: payload is (image_bytes, extension, server_charts)"""
+    image_bytes, extension, server_charts = payload
+    try:
+        return run_prediction(image_bytes, extension, server_charts, report)
+    except Exception as e:
+        record_error(e)
+        raise
+
+# Asynchronous job mode: bounded queue served by a fixed pool of workers
+prediction_jobs = JobQueue(run_prediction_job, num_workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE,
+                           result_ttl=JOB_RESULT_TTL,
+                           state_dir=os.path.join(JOB_STATE_DIR, 'predict') if JOB_STATE_DIR else None)
+
+def run_tile_batch(engine, tiles):
+    """Softmax rows for a batch of uint8 slide tiles, scored through a version's inference engine"""
+    futures = [engine.submit(tile) for tile in tiles]
+    outputs = [future.result() for future in futures]
+    return np.stack([output[0] if isinstance(output, tuple) else output for output in outputs])
+
+def run_slide_job(payload, report):
+    """Slide job handler: payload is (path, source name, server_charts, remove_after)"""
+    path, source, server_charts, remove_after = payload
+    try:
+        report('reading')
+        # Every tile of a slide is scored by the same version
+        with serving_version() as served, SlideReader(path) as reader, timed(stage_latency, 'slide'):
+            slide = predict_slide(reader, lambda tiles: run_tile_batch(served.engine, tiles),
+                                  tile_size=SLIDE_TILE_SIZE, batch_size=MAX_BATCH_SIZE,
+                                  min_tissue=SLIDE_MIN_TISSUE, report=report)
+            width, height = reader.width, reader.height
+        if slide["probabilities"] is None:
+            raise ValueError("No tissue found in slide")
+
+        report('assemble')
+        result = build_prediction_result(slide["probabilities"], source, model_version=served.version)
+        result["slide"] = {
+            "width": width,
+            "height": height,
+            "aggregation": "mean",
+            "tiles": slide["tiles"],
+            "tile_map": {
+                **slide["grid"],
+                # Most likely class per tile (-1: background, not scored) and its probability
+                "class_index": slide["class_index"].tolist(),
+                "confidence": np.round(slide["confidence"], 4).tolist()
             }
+        }
+        if server_charts:
+            result["visualizations"] = create_visualization(result, uuid.uuid4().hex)
+        return result
+    except Exception as e:
+        record_error(e)
+        raise
+    finally:
+        if remove_after:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
-            # Add medical information for the predicted class
-            if top_class in cancer_information:
-                result["cancer_info"] = cancer_information[top_class]
-            else:
-                result["cancer_info"] = {
-                    "description": "Information not available for this classification.",
-                    "details": "Please consult with a healthcare professional for more information.",
-                    "patient_implications": "A medical professional should interpret these results.",
-                    "common_treatments": "Treatment options should be discussed with your healthcare provider."
-                }
-
-            # Add top 3 alternative predictions with their information
-            top3_indices = np.argsort(prediction)[-4:-1][::-1]  # Get indices of top 3 after the best one
-            top3_classes = [class_labels[i] for i in top3_indices]
-            top3_confidences = [float(prediction[i]) for i in top3_indices]
-
-            result["alternatives_info"] = []
-            for cls, conf in zip(top3_classes, top3_confidences):
-                alt_info = {
-                    "class": cls,
-                    "confidence": conf,
-                    "readable_name": readable_class_names.get(cls, cls),
-                    "organ": get_organ_from_class(cls)
-                }
+# Slides take minutes, so they get their own small pool instead of blocking image jobs
+slide_jobs = JobQueue(run_slide_job, num_workers=SLIDE_JOB_WORKERS, max_queue=SLIDE_JOB_QUEUE_SIZE,
+                      result_ttl=JOB_RESULT_TTL,
+                      state_dir=os.path.join(JOB_STATE_DIR, 'slide') if JOB_STATE_DIR else None)
 
-                if cls in cancer_information:
-                    alt_info["brief_info"] = cancer_information[cls]["description"]
-                else:
-                    alt_info["brief_info"] = "Information not available for this classification."
+def find_job(job_id):
+    """(queue, job snapshot) of an image or slide job, or (None, None) if unknown"""
+    for jobs in (prediction_jobs, slide_jobs):
+        job = jobs.get(job_id)
+        if job is not None:
+            return jobs, job
+    return None, None
 
-                result["alternatives_info"].append(alt_info)
+def public_job(job):
+    """Job snapshot as exposed over the API"""
+    return {key: job[key] for key in ("id", "status", "stage", "created", "updated", "result", "error")}
 
-            # Create visualizations
-            filename_base = filename.split('.')[0]
-            visualizations = create_visualization(result, filename_base)
-            result["visualizations"] = visualizations
-            
-            # Clear session to free memory
-            clear_session_after_predict()
+def job_accepted(job_id):
+    """202 response pointing at a queued job"""
+    response = jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}",
+        "events_url": f"/api/jobs/{job_id}/events"
+    })
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job_id}"
+    return response
 
-            return jsonify(result)
+def queue_full(e):
+    """429 response with a Retry-After hint"""
+    response = jsonify({"error": "Server busy, retry later", "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue an image for prediction and return a job id immediately (202).
+
+    Rejects with 429 and a Retry-After hint when the queue is full.
+    """
+    if request.content_length is not None and request.content_length > MAX_IMAGE_SIZE:
+        return jsonify({"error": "File too large. Maximum size allowed is 10MB"}), 413
+
+    file = request.files.get('image')
+    if file is None or file.filename == '':
+        return jsonify({"error": "No image provided"}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"error": "File type not allowed"}), 400
+
+    payload = (file.read(), file.filename.rsplit('.', 1)[1].lower(), wants_server_charts())
+    try:
+        job_id = prediction_jobs.submit(payload)
+    except QueueFull as e:
+        return queue_full(e)
+    return job_accepted(job_id)
+
+@app.route('/api/predict/slide', methods=['POST'])
+def submit_slide():
+    """
+    Queue a whole-slide TIFF for tiled prediction and return a job id (202).
+
+    The slide is uploaded in the 'slide' field (up to SLIDE_MAX_MB) or, when
+    SLIDE_DIR is set, named by its path relative to SLIDE_DIR ('path' form
+    field or query parameter). The job result is a predict() result for the
+    whole slide plus a 'slide' section with tile counts and the per-tile map.
+    """
+    if importlib.util.find_spec('tifffile') is None:
+        return jsonify({"error": "Tiled slide inference requires the tifffile package"}), 501
+    if request.content_length is not None and request.content_length > SLIDE_MAX_SIZE:
+        return jsonify({"error": f"Slide too large. Maximum size allowed is {SLIDE_MAX_SIZE // (1024 * 1024)}MB"}), 413
+
+    file = request.files.get('slide')
+    relative_path = request.values.get('path')
+    if file is not None and file.filename != '':
+        if not file.filename.lower().endswith(('.tif', '.tiff')):
+            return jsonify({"error": "Slides must be TIFF files"}), 400
+        # Large multipart fields are already spooled to disk; keep the file for the job
+        fd, path = tempfile.mkstemp(suffix='.tiff')
+        os.close(fd)
+        file.save(path)
+        payload = (path, file.filename, wants_server_charts(), True)
+    elif relative_path and SLIDE_DIR:
+        root = os.path.realpath(SLIDE_DIR)
+        path = os.path.realpath(os.path.join(root, relative_path))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return jsonify({"error": "Slide not found"}), 404
+        payload = (path, os.path.basename(path), wants_server_charts(), False)
+    else:
+        return jsonify({"error": "No slide provided"}), 400
+
+    try:
+        job_id = slide_jobs.submit(payload)
+    except QueueFull as e:
+        if payload[3]:
+            os.remove(payload[0])
+        return queue_full(e)
+    return job_accepted(job_id)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a job's status, and its result once done"""
+    _, job = find_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(public_job(job))
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events stream of a job's status changes, ending with the result"""
+    jobs, job = find_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    def generate(job):
+        while True:
+            yield f"event: status\ndata: {json.dumps(public_job(job))}\n\n"
+            if job["status"] in ("done", "failed"):
+                return
+            version = job["version"]
+            while True:
+                update = jobs.wait_for_update(job_id, version, timeout=SSE_HEARTBEAT_SECONDS)
+                if update is None:
+                    return
+                if update["version"] > version:
+                    job = update
+                    break
+                yield ": keep-alive\n\n"
+
+    response = Response(generate(job), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
+def read_zip_member(archive, member):
+    """Bytes of one archive member, reading at most MAX_IMAGE_SIZE whatever its header claims"""
+    with archive.open(member) as f:
+        data = f.read(MAX_IMAGE_SIZE + 1)
+    if len(data) > MAX_IMAGE_SIZE:
+        raise ValueError("File too large. Maximum size allowed is 10MB")
+    return data
+
+def open_batch_uploads(files):
+    """
+    Open the uploaded files and zip archives and check them before streaming starts.
+
+    Returns:
+        (entries, archives): entries are (name, read, error) per image, where
+        read() returns the image bytes and error is set instead for uploads
+        that cannot be scored; archives are the open ZipFiles to close
+
+    Raises:
+        ValueError: when the archives decompress to more than MAX_BATCH_UNCOMPRESSED_SIZE
+    """
+    entries, archives = [], []
+    uncompressed = 0
+    for file in files:
+        if not file or file.filename == '':
+            continue
+        if file.filename.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except (zipfile.BadZipFile, OSError) as e:
+                entries.append((file.filename, None, f"Invalid zip archive: {e}"))
+                continue
+            archives.append(archive)
+            for member in archive.infolist():
+                if member.is_dir() or not allowed_file(member.filename):
+                    continue
+                if member.file_size > MAX_IMAGE_SIZE:
+                    entries.append((member.filename, None, "File too large. Maximum size allowed is 10MB"))
+                    continue
+                uncompressed += member.file_size
+                entries.append((member.filename, functools.partial(read_zip_member, archive, member), None))
+        elif allowed_file(file.filename):
+            entries.append((file.filename, file.read, None))
+        else:
+            entries.append((file.filename, None, "File type not allowed"))
+
+    if uncompressed > MAX_BATCH_UNCOMPRESSED_SIZE:
+        for archive in archives:
+            archive.close()
+        raise ValueError(f"Archives too large. Maximum uncompressed size allowed is "
+                         f"{MAX_BATCH_UNCOMPRESSED_SIZE // (1024 * 1024)}MB")
+    return entries, archives
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Score many images in one upload and stream one JSON line per image.
+
+    Accepts any number of files in the 'images' (or 'image') field, including
+    zip archives of images. Lines are emitted as each image completes, so
+    they are not necessarily in upload order; every line carries the upload
+    'index' and 'source' name next to the usual predict() fields.
+    Chart URLs (rendered lazily) are only returned with ?visualize=1, and
+    ?format=compact streams compact results (see predict()).
+    """
+    if request.content_length is not None and request.content_length > MAX_BATCH_UPLOAD_SIZE:
+        return jsonify({"error": f"Upload too large. Maximum size allowed is "
+                                 f"{MAX_BATCH_UPLOAD_SIZE // (1024 * 1024)}MB"}), 413
+
+    files = request.files.getlist('images') + request.files.getlist('image')
+    if not files:
+        return jsonify({"error": "No images provided"}), 400
+    try:
+        entries, archives = open_batch_uploads(files)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 413
+
+    visualize = request.args.get('visualize', '0').lower() in ('1', 'true', 'yes')
+    compact = wants_compact()
+    max_in_flight = 2 * MAX_BATCH_SIZE
+
+    def finish(served, index, source, filename, cache_key, image, future, summary):
+        try:
+            prediction, cascade_stage, embedding = future.result()
+            if cascade_stage == 'full':
+                mirror_to_shadow(served, image, prediction, cache_key)
+            result = build_prediction_result(prediction, filename, summary, cascade_stage, served.version)
+            index_embedding(served.similar_index, cache_key, embedding, prediction, filename.rsplit('.', 1)[1])
+            result["visualizations"] = create_visualization(result, uuid.uuid4().hex)
+            prediction_cache.put(cache_key, result, served.cache_version)
+            if not visualize:
+                result.pop("visualizations")
+            if compact:
+                result = compact_result(result)
+        except Exception as e:
+            record_error(e)
+            result = {"error": str(e)}
+        result["index"] = index
+        result["source"] = source
+        return json.dumps(result) + '\n'
+
+    def generate():
+        # The whole upload is scored by one version, even if another is activated meanwhile
+        try:
+            with serving_version() as served:
+                yield from generate_with_version(served)
+        finally:
+            for archive in archives:
+                archive.close()
+
+    def generate_with_version(served):
+        pending = {}
+
+        def drain(return_when):
+            done, _ = wait(list(pending), return_when=return_when)
+            # Taxonomy fields of every completed image in one vectorized call
+            succeeded = [future for future in done if future.exception() is None]
+            summaries = {}
+            if succeeded:
+                summary = taxonomy.summarize(np.stack([future.result()[0] for future in succeeded]))
+                summaries = {future: Taxonomy.row(summary, i) for i, future in enumerate(succeeded)}
+            for future in done:
+                yield finish(served, *pending.pop(future), future, summaries.get(future))
+
+        for index, (source, read, error) in enumerate(entries):
+            if error is None:
+                try:
+                    image_bytes = read()
+                except Exception as e:
+                    # Corrupt or truncated archive member: report it and keep streaming
+                    record_error(e)
+                    error = str(e)
+            if error is not None:
+                yield json.dumps({"index": index, "source": source, "error": error}) + '\n'
+                continue
+
+            cache_key = prediction_cache.key_for(image_bytes)
+            cached_result = prediction_cache.get(cache_key, served.cache_version)
+            if cached_result is not None:
+                restore_artifacts(cached_result, image_bytes)
+                if not visualize:
+                    cached_result.pop("visualizations", None)
+                if compact:
+                    cached_result = compact_result(cached_result)
+                cached_result["index"] = index
+                cached_result["source"] = source
+                yield json.dumps(cached_result) + '\n'
+                continue
+
+            filename = upload_storage.content_name(image_bytes, source.rsplit('.', 1)[1].lower())
+            if SAVE_UPLOADS:
+                upload_storage.put_async(filename, image_bytes)
+
+            try:
+                with stage('preprocess'):
+                    preprocessed_img = preprocess_image(image_bytes)
+            except Exception as e:
+                record_error(e)
+                yield json.dumps({"index": index, "source": source, "error": str(e)}) + '\n'
+                continue
+
+            # Decoding the next images overlaps with inference of the queued ones
+            future = served.classifier.submit(preprocessed_img[0])
+            pending[future] = (index, source, filename, cache_key, preprocessed_img[0])
+
+            if len(pending) >= max_in_flight:
+                yield from drain(FIRST_COMPLETED)
+
+        if pending:
+            yield from drain(ALL_COMPLETED)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/similar', methods=['GET', 'POST'])
+def similar():
+    """
+    The k most similar previously seen cases (cosine similarity of embeddings).
+
+    The query is either an uploaded image (POST, 'image' field), embedded
+    with the full model, or a previously seen image by id (?id=<sha256>, the
+    stem of its upload filename). ?k= sets the number of neighbours (default
+    5) and ?organ=<organ> keeps only cases predicted in that organ. Only cases
+    seen by the active model version are searched.
+    """
+    with serving_version() as served:
+        return similar_with_version(served)
+
+def similar_with_version(served):
+    similar_index = served.similar_index
+    if similar_index is None:
+        return jsonify({"error": "Similar-case search requires the keras backend and SIMILAR_INDEX_DIR"}), 501
+
+    try:
+        k = int(request.args.get('k', 5))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    k = min(max(k, 1), MAX_SIMILAR_K)
+
+    organ = request.args.get('organ')
+    class_mask = None
+    if organ is not None:
+        if organ not in organ_categories:
+            return jsonify({"error": f"Unknown organ: {organ}"}), 400
+        class_mask = taxonomy.organ_index == taxonomy.organs.index(organ)
+
+    file = request.files.get('image')
+    if file is not None and file.filename != '':
+        if not allowed_file(file.filename):
+            return jsonify({"error": "File type not allowed"}), 400
+        image_bytes = file.read()
+        query_key = prediction_cache.key_for(image_bytes)
+        try:
+            _, query = served.engine.predict(preprocess_image(image_bytes)[0])
         except Exception as e:
+            record_error(e)
             return jsonify({"error": str(e)}), 500
+    else:
+        query_key = request.args.get('id', '').lower()
+        if not re.fullmatch(r'[0-9a-f]{64}', query_key):
+            return jsonify({"error": "Provide an image or a 64-character hex id"}), 400
+        query = similar_index.vector_for(query_key)
+        if query is None:
+            return jsonify({"error": "Unknown id"}), 404
 
-    return jsonify({"error": "File type not allowed"}), 400
+    neighbors = []
+    for match in similar_index.search(query, k, class_mask, exclude_key=query_key):
+        cls = class_labels[match["class_index"]]
+        neighbors.append({
+            "id": match["key"],
+            "similarity": match["similarity"],
+            "class": cls,
+            "readable_name": readable_class_names.get(cls, cls),
+            "organ": get_organ_from_class(cls),
+            "filename": f"{match['key']}.{EXTENSION_CODES[match['extension']]}"
+        })
+    return jsonify({"query": {"id": query_key}, "k": k, "organ": organ, "neighbors": neighbors,
+                    "model_version": served.version})
+
+@app.route('/api/explain', methods=['POST'])
+def explain():
+    """
+    Grad-CAM explanations for one or more images.
+
+    Accepts up to MAX_EXPLAIN_IMAGES files in the 'image' field. Explains the
+    top_k predicted classes of each image (?top_k=, default 1), or a fixed
+    class (?class=<label>). All heatmaps come from one forward and one
+    backward pass and are returned as base64 PNG overlays.
+    """
+    with serving_version() as served:
+        return explain_with_version(served)
+
+def explain_with_version(served):
+    if served.keras_model is None:
+        return jsonify({"error": "Explanations require the keras inference backend"}), 501
+    from gradcam import compute_heatmaps, overlay_heatmaps
+
+    files = [f for f in request.files.getlist('image') if f and f.filename != '']
+    if not files:
+        return jsonify({"error": "No image provided"}), 400
+    if len(files) > MAX_EXPLAIN_IMAGES:
+        return jsonify({"error": f"At most {MAX_EXPLAIN_IMAGES} images can be explained per request"}), 400
+    if not all(allowed_file(f.filename) for f in files):
+        return jsonify({"error": "File type not allowed"}), 400
+
+    class_name = request.args.get('class')
+    if class_name is not None and class_name not in class_labels:
+        return jsonify({"error": f"Unknown class: {class_name}"}), 400
+    try:
+        top_k = int(request.args.get('top_k', 1))
+    except ValueError:
+        return jsonify({"error": "top_k must be an integer"}), 400
+    top_k = min(max(top_k, 1), MAX_EXPLAIN_TOP_K)
+
+    try:
+        images = np.stack([decode_image_bytes(f.read()) for f in files])
+        class_indices = None
+        if class_name is not None:
+            class_indices = np.full((len(files), 1), class_labels.index(class_name), dtype=np.int32)
+
+        with tf.device(DEVICE):
+            predictions, explained, heatmaps = compute_heatmaps(
+                images.astype(np.float32) / 255.0, served.keras_model, served.gradcam_layer, class_indices, top_k)
+        overlays = overlay_heatmaps(images, heatmaps)
+
+        results = []
+        for i, file in enumerate(files):
+            explanations = []
+            for j, class_index in enumerate(explained[i]):
+                cls = class_labels[class_index]
+                _, png = cv2.imencode('.png', overlays[i, j][..., ::-1])
+                explanations.append({
+                    "class": cls,
+                    "readable_name": readable_class_names.get(cls, cls),
+                    "confidence": float(predictions[i, class_index]),
+                    "overlay": "data:image/png;base64," + base64.b64encode(png.tobytes()).decode('ascii')
+                })
+            top_class = class_labels[int(np.argmax(predictions[i]))]
+            results.append({
+                "source": file.filename,
+                "prediction": {
+                    "class": top_class,
+                    "confidence": float(np.max(predictions[i])),
+                    "readable_name": readable_class_names.get(top_class, top_class),
+                    "organ": get_organ_from_class(top_class)
+                },
+                "explanations": explanations
+            })
+
+        return jsonify({"layer": served.gradcam_layer, "model_version": served.version, "results": results})
+
+    except Exception as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), 500
 
 # Serve static files
+def stored_path(storage, filename):
+    """Sharded path of a stored file, or 404 for names that can't be stored"""
+    try:
+        return storage.path_for(filename)
+    except ValueError:
+        abort(404)
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    path = stored_path(upload_storage, filename)
+    upload_storage.touch(filename)
+    return send_from_directory(os.path.dirname(path), filename)
 
 @app.route('/visualizations/<filename>')
 def visualization_file(filename):
-    return send_from_directory(app.config['VISUALIZATION_FOLDER'], filename)
+    """Serve a chart, rendering it from the stored confidence vector on first request"""
+    chart_path = stored_path(visualization_storage, filename)
+    if os.path.exists(chart_path):
+        visualization_storage.touch(filename)
+    else:
+        match = CHART_FILENAME_RE.fullmatch(filename)
+        confidences_path = visualization_storage.path_for(f"{match.group(1)}.npy") if match else None
+        if confidences_path is None or not os.path.exists(confidences_path):
+            abort(404)
+
+        with stage('render_chart'):
+            png = render_chart(match.group(2), build_chart_data(np.load(confidences_path)))
+        visualization_storage.put(filename, png, overwrite=True)
+
+    return send_from_directory(os.path.dirname(chart_path), filename, max_age=CHART_MAX_AGE)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,205 @@
+# autotune.py
+"""
+Find the fastest CPU inference runtime profile for this machine.
+
+Sweeps intra-op and inter-op thread counts, oneDNN on/off and (with more
+than one worker) per-worker CPU affinity. For each setting it starts
+--workers measuring processes at once, like serve.py replicas sharing the
+host, since oversubscription only shows up under concurrent load. Each
+process loads the real model with that setting (TensorFlow reads most of
+these options at import time, hence one process per setting) and times the
+forward pass at every batch size for --duration seconds.
+
+The setting and batch size with the highest combined throughput whose p95
+batch latency stays within --max-latency-ms is saved as the runtime profile
+that App.py and serve.py load at startup (RUNTIME_PROFILE, default
+runtime_profile.json).
+
+Usage (from the backend directory):
+    python autotune.py --workers 2 --backend keras -o runtime_profile.json
+    python serve.py --workers 2
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from runtime_profile import (DEFAULT_PROFILE_PATH, PROFILE_DEFAULTS, apply_environment, available_cpus,
+                             pin_worker, save_profile)
+
+DEFAULT_MODEL_PATH = 'model/resnet152V2_model.keras'
+# Prefix of the lines a measuring process reports on stdout (TensorFlow logs go to stderr)
+MARKER = 'AUTOTUNE '
+
+
+def measure(args):
+    """Measuring process: apply one setting, load the model, time every batch size"""
+    config = json.loads(args.measure)
+    profile = {**PROFILE_DEFAULTS, **{key: config[key] for key in PROFILE_DEFAULTS if key in config}}
+    pin_worker(config["worker_index"], config["workers"], profile["affinity"])
+    apply_environment(profile)
+
+    import tensorflow as tf
+    if profile["intra_op_threads"]:
+        tf.config.threading.set_intra_op_parallelism_threads(profile["intra_op_threads"])
+    if profile["inter_op_threads"]:
+        tf.config.threading.set_inter_op_parallelism_threads(profile["inter_op_threads"])
+    from backends import load_backend
+
+    backend = load_backend(args.backend, args.model, num_threads=profile["intra_op_threads"])
+    rng = np.random.default_rng(config["worker_index"])
+    batches = {size: rng.integers(0, 256, (size, 224, 224, 3), dtype=np.uint8) for size in args.batch_sizes}
+    for batch in batches.values():
+        for _ in range(2):
+            backend.predict(batch)
+
+    # Wait until every worker of this setting is loaded, then measure together
+    print(f"{MARKER}ready", flush=True)
+    sys.stdin.readline()
+
+    results = {}
+    for size, batch in batches.items():
+        latencies = []
+        started = time.perf_counter()
+        while time.perf_counter() - started < args.duration:
+            call_started = time.perf_counter()
+            backend.predict(batch)
+            latencies.append(time.perf_counter() - call_started)
+        wall_time = time.perf_counter() - started
+        results[size] = {
+            "throughput": len(latencies) * size / wall_time,
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000)
+        }
+    print(f"{MARKER}{json.dumps(results)}", flush=True)
+
+
+def candidate_settings(args):
+    """All settings of the sweep, as profile dicts"""
+    cpus = available_cpus()
+    budget = max(1, len(cpus) // args.workers)
+    threads = args.threads or sorted({max(1, budget // 2), budget, min(len(cpus), budget * 2)})
+    inter_op = args.inter_op_threads or [1, 2]
+    onednn = [True, False]
+    affinity = ['none', 'compact'] if args.workers > 1 and hasattr(os, 'sched_setaffinity') else ['none']
+    return [{**PROFILE_DEFAULTS, "device": "cpu", "intra_op_threads": intra, "inter_op_threads": inter,
+             "onednn": dnn, "affinity": pin}
+            for intra, inter, dnn, pin in itertools.product(threads, inter_op, onednn, affinity)]
+
+
+def read_marker(process):
+    """Next marker payload from a measuring process, or None if it exited"""
+    for line in process.stdout:
+        if line.startswith(MARKER):
+            return line[len(MARKER):].strip()
+    return None
+
+
+def run_setting(setting, args):
+    """
+    Measure one setting with --workers concurrent processes.
+
+    Returns:
+        {batch size: combined throughput and worst-worker latencies}, or None on failure
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--model', args.model, '--backend', args.backend,
+               '--batch-sizes', ','.join(str(size) for size in args.batch_sizes),
+               '--duration', str(args.duration)]
+    processes = [
+        subprocess.Popen(command + ['--measure', json.dumps({**setting, "worker_index": index,
+                                                             "workers": args.workers})],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for index in range(args.workers)
+    ]
+    try:
+        if any(read_marker(process) != 'ready' for process in processes):
+            return None
+        for process in processes:
+            process.stdin.write('go\n')
+            process.stdin.flush()
+        reports = [read_marker(process) for process in processes]
+        if any(report is None for report in reports):
+            return None
+        reports = [json.loads(report) for report in reports]
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+
+    return {
+        size: {
+            "throughput": sum(report[str(size)]["throughput"] for report in reports),
+            "p50_ms": max(report[str(size)]["p50_ms"] for report in reports),
+            "p95_ms": max(report[str(size)]["p95_ms"] for report in reports)
+        }
+        for size in args.batch_sizes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep CPU runtime settings and save the fastest profile')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--backend', default='keras', help='Inference backend (keras, tflite-fp16, tflite-int8, onnx)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes that will share this host')
+    parser.add_argument('--threads', type=lambda s: [int(t) for t in s.split(',')],
+                        help='Intra-op thread counts to try (default: around cores / workers)')
+    parser.add_argument('--inter-op-threads', type=lambda s: [int(t) for t in s.split(',')],
+                        help='Inter-op thread counts to try (default: 1,2)')
+    parser.add_argument('--batch-sizes', type=lambda s: [int(b) for b in s.split(',')], default=[1, 4, 8, 16, 32])
+    parser.add_argument('--duration', type=float, default=2.0, help='Seconds measured per batch size')
+    parser.add_argument('--max-latency-ms', type=float, default=500.0,
+                        help='Largest acceptable p95 latency of one batch')
+    parser.add_argument('-o', '--output', default=DEFAULT_PROFILE_PATH, help='Profile file to write')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args)
+        return
+
+    if not os.path.exists(args.model):
+        raise SystemExit(f"{args.model} not found; auto-tuning needs the real model")
+
+    settings = candidate_settings(args)
+    print(f"Sweeping {len(settings)} settings x {len(args.batch_sizes)} batch sizes "
+          f"with {args.workers} worker(s) on {len(available_cpus())} CPUs")
+    print(f"{'intra':>5} {'inter':>5} {'onednn':>6} {'affinity':>8} {'batch':>5} {'img/s':>9} {'p95 ms':>9}")
+
+    rows = []
+    for setting in settings:
+        measurements = run_setting(setting, args)
+        if measurements is None:
+            print(f"{setting['intra_op_threads']:>5} {setting['inter_op_threads']:>5} {str(setting['onednn']):>6} "
+                  f"{setting['affinity']:>8}  failed")
+            continue
+        for size, measured in measurements.items():
+            rows.append({**setting, "batch_size": size, **measured})
+            print(f"{setting['intra_op_threads']:>5} {setting['inter_op_threads']:>5} {str(setting['onednn']):>6} "
+                  f"{setting['affinity']:>8} {size:>5} {measured['throughput']:>9.1f} {measured['p95_ms']:>9.1f}")
+
+    eligible = [row for row in rows if row["p95_ms"] <= args.max_latency_ms]
+    if not eligible:
+        raise SystemExit(f"No setting kept p95 batch latency within {args.max_latency_ms} ms")
+    best = max(eligible, key=lambda row: row["throughput"])
+
+    profile = {key: best[key] for key in PROFILE_DEFAULTS}
+    save_profile(args.output, profile, tuning={
+        "backend": args.backend,
+        "model": args.model,
+        "workers": args.workers,
+        "cpus": len(available_cpus()),
+        "throughput": best["throughput"],
+        "p95_ms": best["p95_ms"],
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "results": rows
+    })
+    print(f"Best: {profile} ({best['throughput']:.1f} img/s, p95 {best['p95_ms']:.1f} ms); saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+# backends.py
+import os
+import threading
+
+import numpy as np
+
+# TensorFlow is imported by the backends that need it, so converted_model_path()
+# and BACKEND_NAMES stay cheap to import
+
+BACKEND_NAMES = ('keras', 'tflite-fp16', 'tflite-int8', 'onnx')
+
+# File suffix of each converted model, next to the .keras file
+_CONVERTED_SUFFIXES = {
+    'tflite-fp16': '_fp16.tflite',
+    'tflite-int8': '_int8.tflite',
+    'onnx': '.onnx',
+}
+
+
+def converted_model_path(model_path, backend_name):
+    """Path of the converted model file a backend loads for a given .keras model"""
+    if backend_name == 'keras':
+        return model_path
+    return os.path.splitext(model_path)[0] + _CONVERTED_SUFFIXES[backend_name]
+
+
+class KerasBackend:
+    """
+    Full-precision Keras model behind a compiled tf.function.
+
+    Batches are uint8 RGB pixels, normalized inside the graph. With
+    with_embeddings, predict() returns (softmax, embeddings) from one
+    forward pass, the embeddings being the penultimate pooled features;
+    when they cannot be extracted from the model, embedding_dim stays None.
+    """
+
+    def __init__(self, model, input_shape=(224, 224, 3), with_embeddings=False):
+        from inference import find_embedding_layer, make_serving_fn
+
+        self.name = 'keras'
+        self.model = model
+        self.embedding_layer = None
+        self.embedding_dim = None
+        if with_embeddings:
+            try:
+                embedding_layer = find_embedding_layer(model)
+                self._serving_fn = make_serving_fn(model, input_shape, embedding_layer)
+                self.embedding_layer = embedding_layer
+                self.embedding_dim = int(model.get_layer(embedding_layer).output.shape[-1])
+            except Exception as e:
+                # Similar-case search is optional; serve the softmax alone
+                print(f"Warning: cannot extract embeddings from this model, similar-case search disabled: {e}")
+        if self.embedding_layer is None:
+            self._serving_fn = make_serving_fn(model, input_shape)
+
+    def predict(self, batch):
+        # No dtype coercion: float input fails the uint8 signature instead of being truncated
+        outputs = self._serving_fn(np.asarray(batch))
+        if self.embedding_layer is not None:
+            return outputs[0].numpy(), outputs[1].numpy()
+        return outputs.numpy()
+
+
+class TFLiteBackend:
+    """
+    TensorFlow Lite interpreter (float16 or dynamic-range int8 weights).
+
+    Models converted by convert_model.py take uint8 pixels; files from older
+    conversions with a float32 input are normalized here instead.
+
+    The flatbuffer is memory-mapped from disk, but by default XNNPACK copies
+    the weights into its own packed (for fp16: dequantized) buffers, so each
+    interpreter holds a private copy. With shared_weights (int8 only) the
+    interpreters run TFLite's built-in kernels without the default
+    delegates; those read the int8 weights in place from the mapping, so
+    all interpreters and processes serving the same file share one copy
+    through the page cache, at several times the inference latency.
+
+    Resizing an interpreter reallocates its tensors (and makes XNNPACK
+    prepare the graph again), and micro-batch sizes change on almost every
+    call. Batches are therefore zero-padded to power-of-two buckets up to
+    max_batch_size, each served by its own interpreter, created on first use
+    and never resized; larger batches are split. Each interpreter holds its
+    own activation arena (and XNNPACK packed weights), so memory grows with
+    the number of bucket sizes seen.
+    """
+
+    embedding_dim = None  # converted models only carry the softmax output
+
+    def __init__(self, model_path, name='tflite', num_threads=None, max_batch_size=32, shared_weights=False):
+        import tensorflow as tf
+
+        if shared_weights and name != 'tflite-int8':
+            raise ValueError(f"Shared weights need the tflite-int8 backend, not {name}")
+        self.name = name
+        self._tf = tf
+        self._model_path = model_path
+        self._num_threads = num_threads
+        resolvers = tf.lite.experimental.OpResolverType
+        self._op_resolver = resolvers.BUILTIN_WITHOUT_DEFAULT_DELEGATES if shared_weights else resolvers.AUTO
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.batch_buckets = sorted({min(1 << i, self.max_batch_size)
+                                     for i in range(self.max_batch_size.bit_length() + 1)})
+
+        self._interpreters = {}  # bucket size -> (interpreter, lock)
+        self._create_lock = threading.Lock()
+        interpreter, _ = self._interpreter(1)
+        input_details = interpreter.get_input_details()[0]
+        self._input_shape = tuple(input_details['shape'][1:])
+        self._input_dtype = input_details['dtype']
+        self._float_input = self._input_dtype == np.float32
+
+    def _interpreter(self, bucket):
+        """Interpreter allocated for batches of exactly bucket images (an interpreter is not thread-safe)"""
+        with self._create_lock:
+            if bucket not in self._interpreters:
+                interpreter = self._tf.lite.Interpreter(model_path=self._model_path, num_threads=self._num_threads,
+                                                        experimental_op_resolver_type=self._op_resolver)
+                input_details = interpreter.get_input_details()[0]
+                interpreter.resize_tensor_input(input_details['index'], (bucket,) + tuple(input_details['shape'][1:]))
+                interpreter.allocate_tensors()
+                self._interpreters[bucket] = (interpreter, threading.Lock())
+            return self._interpreters[bucket]
+
+    def predict(self, batch):
+        batch = np.asarray(batch)
+        if len(batch) > self.max_batch_size:
+            return np.concatenate([self.predict(batch[start:start + self.max_batch_size])
+                                   for start in range(0, len(batch), self.max_batch_size)])
+        if self._float_input:
+            batch = batch.astype(np.float32) * np.float32(1.0 / 255.0)
+
+        size = len(batch)
+        bucket = next(b for b in self.batch_buckets if b >= size)
+        if bucket != size:
+            padded = np.zeros((bucket,) + self._input_shape, dtype=batch.dtype)
+            padded[:size] = batch
+            batch = padded
+        interpreter, lock = self._interpreter(bucket)
+        with lock:
+            interpreter.set_tensor(interpreter.get_input_details()[0]['index'], batch)
+            interpreter.invoke()
+            return interpreter.get_tensor(interpreter.get_output_details()[0]['index'])[:size].copy()
+
+
+class OnnxBackend:
+    """ONNX Runtime CPU session (requires the optional onnxruntime package)"""
+
+    embedding_dim = None
+
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime as ort
+
+        self.name = 'onnx'
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._float_input = model_input.type == 'tensor(float)'  # older conversions
+
+    def predict(self, batch):
+        batch = np.asarray(batch)
+        if self._float_input:
+            batch = batch.astype(np.float32) * np.float32(1.0 / 255.0)
+        return self.session.run(None, {self._input_name: batch})[0]
+
+
+def load_backend(name, model_path, model=None, num_threads=None, with_embeddings=False, max_batch_size=32,
+                 shared_weights=False):
+    """
+    Create an inference backend.
+
+    Args:
+        name: One of BACKEND_NAMES
+        model_path: Path of the .keras model; converted backends load the
+            matching converted file next to it (see converted_model_path)
+        model: Already loaded Keras model (required for 'keras')
+        num_threads: Intra-op thread count for the TFLite/ONNX runtimes
+        with_embeddings: Also return penultimate features (Keras only; other
+            backends ignore it and report embedding_dim None)
+        max_batch_size: Largest batch the TFLite backends allocate for (see TFLiteBackend)
+        shared_weights: Read tflite-int8 weights in place so worker processes
+            share them (see TFLiteBackend)
+
+    Returns:
+        Backend object exposing name, embedding_dim and predict(batch) ->
+        softmax array, or (softmax, embeddings) when embedding_dim is set
+    """
+    if name == 'keras':
+        if model is None:
+            import tensorflow as tf
+
+            model = tf.keras.models.load_model(model_path)
+        return KerasBackend(model, with_embeddings=with_embeddings)
+
+    path = converted_model_path(model_path, name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; create it with: python convert_model.py convert --format {name}")
+    if name in ('tflite-fp16', 'tflite-int8'):
+        return TFLiteBackend(path, name=name, num_threads=num_threads, max_batch_size=max_batch_size,
+                             shared_weights=shared_weights)
+    if name == 'onnx':
+        return OnnxBackend(path, num_threads=num_threads)
+    raise ValueError(f"Unknown inference backend: {name} (expected one of {', '.join(BACKEND_NAMES)})")
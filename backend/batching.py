@@ -0,0 +1,138 @@
+# batching.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Collect concurrent inference requests into shared model batches.
+
+    Request handlers submit single preprocessed images; a background worker
+    drains the shared queue and flushes a batch as soon as it holds
+    max_batch_size images or the oldest image has waited max_wait_ms. Each
+    batch costs one forward pass and the per-row outputs are handed back to
+    the waiting handlers through futures.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10):
+        """
+        Args:
+            predict_fn: Callable taking a stacked batch (N, ...) and returning an
+                array of N rows, or a tuple/list of such arrays
+            max_batch_size: Largest number of images run in one forward pass
+            max_wait_ms: Longest time the first queued image waits for company
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self.batches_run = 0
+        self.items_run = 0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def queue_depth(self):
+        """Number of submitted images not yet picked up by the worker"""
+        return self._queue.qsize()
+
+    def submit(self, item):
+        """
+        Queue a single input for batched inference.
+
+        Args:
+            item: One preprocessed input without the batch axis
+
+        Returns:
+            concurrent.futures.Future resolving to this input's output row
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def predict(self, item, timeout=None):
+        """Blocking convenience wrapper around submit()"""
+        return self.submit(item).result(timeout)
+
+    def close(self):
+        """Stop the worker once the already queued requests are served"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put((_STOP, None))
+            self._thread.join()
+        self._thread = None
+
+    def _ensure_worker(self):
+        # The worker is started lazily and restarted in forked children, where
+        # the parent's thread no longer exists.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        q = self._queue
+        while True:
+            item, future = q.get()
+            if item is _STOP:
+                return
+
+            batch = [(item, future)]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        entry = q.get(timeout=remaining)
+                    else:
+                        entry = q.get_nowait()
+                except queue.Empty:
+                    break
+                if entry[0] is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch):
+        # Drop requests whose caller already gave up
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            inputs = np.stack([item for item, _ in batch])
+            outputs = self.predict_fn(inputs)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.items_run += len(batch)
+
+        for row, (_, future) in enumerate(batch):
+            if isinstance(outputs, (tuple, list)):
+                future.set_result(tuple(output[row] for output in outputs))
+            else:
+                future.set_result(outputs[row])
@@ -0,0 +1,513 @@
+# benchmark.py
+"""
+Reproducible benchmarks and load tests for the inference service.
+
+    images   Write synthetic test images (png, jpg, jpeg, tiff at several
+             resolutions)
+    standin  Write the stand-in model to a path, for serving without the
+             real model file
+    micro    Time preprocess_image(), the batched forward pass at several
+             batch sizes, create_visualization() and chart rendering
+    load     Closed-loop (fixed concurrency) or open-loop (fixed arrival
+             rate) HTTP load against /api/predict; with --serve it starts
+             serve.py itself for the run
+    compare  Check a results file against a saved baseline
+
+Every run writes machine-readable JSON. Passing --baseline to micro/load
+(or using compare) exits non-zero when a latency grows or a throughput
+drops by more than --tolerance, so regressions fail loudly.
+
+Everything runs offline on CPU. When the model file is missing, micro and
+load --serve use a small stand-in model with the same input and output
+shapes (untrained, so only the timings are meaningful).
+
+Usage (from the backend directory):
+    python benchmark.py images --out bench_images
+    python benchmark.py micro -o micro.json --baseline micro_baseline.json
+    python benchmark.py load --serve --workers 2 --mode open --rate 20 -o load.json
+    # or against a server started separately, e.g. on the stand-in model:
+    python benchmark.py standin --out model/standin.keras
+    MODEL_PATH=model/standin.keras python serve.py --workers 2 &
+    python benchmark.py load --mode open --rate 20 --duration 30 -o load.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_MODEL_PATH = 'model/resnet152V2_model.keras'
+IMAGE_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'tiff': 'TIFF'}
+RESOLUTIONS = ((224, 224), (512, 512), (1024, 768), (2048, 1536))
+NUM_CLASSES = 27
+
+
+# ---- synthetic data ----
+
+def synthetic_image(width, height, extension, seed=0):
+    """
+    Encoded image of the given size: smooth colour gradients plus noise, so
+    that compressed sizes and decode costs resemble photographs more than
+    pure noise or flat colour would.
+    """
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    x = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :]
+    phases = rng.uniform(0, 2 * np.pi, size=3)
+    frequencies = rng.uniform(1, 6, size=3)
+    channels = [np.sin(frequencies[c] * (x + y) * np.pi + phases[c]) for c in range(3)]
+    pixels = (np.stack(channels, axis=-1) * 0.5 + 0.5) * 200
+    pixels += rng.normal(0, 12, size=(height, width, 3))
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    buffer = io.BytesIO()
+    image.save(buffer, IMAGE_FORMATS[extension])
+    return buffer.getvalue()
+
+
+def generate_images(args):
+    os.makedirs(args.out, exist_ok=True)
+    seed = 0
+    for width, height in RESOLUTIONS:
+        for extension in IMAGE_FORMATS:
+            for copy in range(args.copies):
+                path = os.path.join(args.out, f"synthetic_{width}x{height}_{copy}.{extension}")
+                with open(path, 'wb') as f:
+                    f.write(synthetic_image(width, height, extension, seed))
+                seed += 1
+    print(f"Wrote {seed} images to {args.out}")
+
+
+def build_standin_model(path):
+    """Save a small untrained CNN with the production input/output shapes"""
+    import tensorflow as tf
+
+    inputs = tf.keras.Input(shape=(224, 224, 3))
+    x = tf.keras.layers.Conv2D(16, 3, strides=4, activation='relu')(inputs)
+    x = tf.keras.layers.Conv2D(32, 3, strides=2, activation='relu', name='last_conv')(x)
+    x = tf.keras.layers.GlobalAveragePooling2D(name='avg_pool')(x)
+    outputs = tf.keras.layers.Dense(NUM_CLASSES, activation='softmax')(x)
+    tf.keras.Model(inputs, outputs).save(path)
+
+
+def write_standin(args):
+    directory = os.path.dirname(os.path.abspath(args.out))
+    os.makedirs(directory, exist_ok=True)
+    build_standin_model(args.out)
+    print(f"Wrote stand-in model to {args.out}; serve it with MODEL_PATH={args.out} python serve.py")
+
+
+# ---- timing and reporting ----
+
+def summarize(latencies, items_per_call=1, wall_time=None):
+    """Latency percentiles (ms) and throughput (items/s) of a list of seconds"""
+    latencies = np.asarray(latencies, dtype=np.float64)
+    wall_time = wall_time if wall_time is not None else float(latencies.sum())
+    return {
+        "calls": int(len(latencies)),
+        "mean_ms": float(latencies.mean() * 1000),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "throughput": float(len(latencies) * items_per_call / wall_time) if wall_time > 0 else 0.0
+    }
+
+
+def time_calls(fn, repeats, warmup=3):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def environment_info(**extra):
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    info.update(extra)
+    return info
+
+
+def compare_results(current, baseline, tolerance):
+    """
+    List regressions of current against baseline.
+
+    Latency fields (*_ms) regress when they grow by more than tolerance,
+    throughput when it drops by more than tolerance, and the share of failed
+    requests whenever it is higher than the baseline's. Benchmarks missing on
+    either side are ignored.
+    """
+    regressions = []
+    for name, base in baseline["results"].items():
+        result = current["results"].get(name)
+        if result is None:
+            continue
+        error_rate, base_error_rate = error_rate_of(result), error_rate_of(base)
+        if error_rate > base_error_rate:
+            regressions.append(f"{name} error rate: {error_rate:.2%} vs baseline {base_error_rate:.2%}")
+        for field, base_value in base.items():
+            value = result.get(field)
+            if value is None or not base_value:
+                continue
+            if field.endswith('_ms') and value > base_value * (1 + tolerance):
+                regressions.append(f"{name} {field}: {value:.2f} vs baseline {base_value:.2f}")
+            elif field == 'throughput' and value < base_value * (1 - tolerance):
+                regressions.append(f"{name} {field}: {value:.2f} vs baseline {base_value:.2f}")
+    return regressions
+
+
+def error_rate_of(result):
+    """Failed share of all requests (0 for benchmarks that do not count errors)"""
+    errors = result.get("errors", 0)
+    total = result.get("calls", 0) + errors
+    return errors / total if total else 0.0
+
+
+def write_and_check(results, args):
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        check_regressions(results, baseline, args.tolerance)
+
+
+def check_regressions(results, baseline, tolerance):
+    regressions = compare_results(results, baseline, tolerance)
+    if regressions:
+        print(f"REGRESSIONS (tolerance {tolerance:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"No regressions against baseline (tolerance {tolerance:.0%})")
+
+
+def print_table(results):
+    print(f"{'benchmark':<36}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'throughput':>12}")
+    for name, r in results.items():
+        print(f"{name:<36}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput']:>12.1f}")
+
+
+# ---- microbenchmarks ----
+
+def run_micro(args):
+    model_path = os.path.abspath(args.model)
+    standin = not os.path.exists(model_path)
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        results = micro_results(args, model_path, standin, workdir)
+    finally:
+        # Results and baseline paths are relative to the caller's directory
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+    output = {
+        "suite": "micro",
+        "environment": environment_info(backend=args.backend, standin_model=standin, repeats=args.repeats),
+        "results": results
+    }
+    write_and_check(output, args)
+
+
+def micro_results(args, model_path, standin, workdir):
+    """Time each pipeline stage with App imported inside workdir"""
+    if standin:
+        model_path = os.path.join(workdir, 'standin_model.keras')
+        print(f"{args.model} not found; using a stand-in model")
+        build_standin_model(model_path)
+
+    # App reads its configuration at import; uploads and charts go to the scratch dir
+    os.environ['MODEL_PATH'] = model_path
+    os.environ['MODEL_STATE_FILE'] = ''  # never the hot-swapped version of a running server
+    os.environ['INFERENCE_BACKEND'] = args.backend
+    os.environ['MAX_BATCH_SIZE'] = str(max(args.batch_sizes))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    import App
+    from charts import CHART_KINDS, render_chart
+
+    results = {}
+
+    for width, height in RESOLUTIONS:
+        for extension in IMAGE_FORMATS:
+            data = synthetic_image(width, height, extension)
+            results[f"preprocess[{extension}-{width}x{height}]"] = summarize(
+                time_calls(lambda: App.preprocess_image(data), args.repeats))
+
+    rng = np.random.default_rng(0)
+    for batch_size in args.batch_sizes:
+        batch = rng.integers(0, 256, (batch_size, 224, 224, 3), dtype=np.uint8)
+        results[f"forward[batch={batch_size}]"] = summarize(
+            time_calls(lambda: App.run_model_batch(batch), args.repeats), items_per_call=batch_size)
+
+    prediction = App.run_model_batch(rng.integers(0, 256, (1, 224, 224, 3), dtype=np.uint8))[0]
+    result = App.build_prediction_result(prediction, 'benchmark.png')
+    results["create_visualization"] = summarize(
+        time_calls(lambda: App.create_visualization(result, 'benchmark'), args.repeats))
+    chart_data = App.build_chart_data(prediction)
+    for kind in CHART_KINDS:
+        results[f"render_chart[{kind}]"] = summarize(
+            time_calls(lambda: render_chart(kind, chart_data), args.repeats))
+    return results
+
+
+# ---- HTTP load generator ----
+
+def load_payloads(images_dir, limit=64):
+    """(filename, bytes) pairs from a directory, or freshly generated ones"""
+    payloads = []
+    if images_dir:
+        for name in sorted(os.listdir(images_dir)):
+            if name.rsplit('.', 1)[-1].lower() in IMAGE_FORMATS:
+                with open(os.path.join(images_dir, name), 'rb') as f:
+                    payloads.append((name, f.read()))
+    else:
+        for i, (width, height) in enumerate(RESOLUTIONS[:2] * 4):
+            extension = list(IMAGE_FORMATS)[i % len(IMAGE_FORMATS)]
+            payloads.append((f"synthetic_{i}.{extension}", synthetic_image(width, height, extension, i)))
+    if not payloads:
+        raise SystemExit(f"No images found in {images_dir}")
+    return payloads[:limit]
+
+
+class LoadRecorder:
+    """Thread-safe collection of request outcomes"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, latency, error=None):
+        with self._lock:
+            if error is None:
+                self.latencies.append(latency)
+            else:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+
+@contextmanager
+def local_server(model, backend, workers, timeout=300):
+    """
+    Run serve.py on a free local port for the duration of the block; yields its URL.
+
+    Works in a scratch directory (uploads, charts, indexes) removed afterwards,
+    on a stand-in model when model does not exist.
+    """
+    import requests
+
+    model_path = os.path.abspath(model)
+    workdir = tempfile.mkdtemp(prefix='benchmark-serve-')
+    process = None
+    try:
+        if not os.path.exists(model_path):
+            if backend != 'keras':
+                raise SystemExit(f"{model} not found; the stand-in model needs --backend keras")
+            model_path = os.path.join(workdir, 'standin_model.keras')
+            print(f"{model} not found; serving a stand-in model")
+            # In a child process, so the load generator never imports TensorFlow
+            subprocess.run([sys.executable, os.path.abspath(__file__), 'standin', '--out', model_path], check=True)
+
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        url = f"http://127.0.0.1:{port}"
+        env = dict(os.environ, MODEL_PATH=model_path, MODEL_STATE_FILE='')
+        serve_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')
+        process = subprocess.Popen([sys.executable, serve_script, '--host', '127.0.0.1', '--port', str(port),
+                                    '--workers', str(workers), '--backend', backend], cwd=workdir, env=env)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise SystemExit(f"serve.py exited with status {process.returncode}")
+            try:
+                if requests.get(url + '/api/health/ready', timeout=5).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"serve.py was not ready after {timeout}s")
+            time.sleep(0.5)
+        yield url
+    finally:
+        if process is not None and process.poll() is None:
+            process.terminate()
+            process.wait(timeout=60)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_load(args):
+    if not args.serve:
+        load_test(args)
+        return
+    with local_server(args.model, args.backend, args.workers) as url:
+        args.url = url
+        load_test(args)
+
+
+def load_test(args):
+    import requests
+
+    payloads = load_payloads(args.images)
+    url = args.url.rstrip('/') + '/api/predict?charts=' + args.charts
+    recorder = LoadRecorder()
+    sessions = threading.local()
+
+    def send(scheduled_at):
+        name, data = random.choice(payloads)
+        if args.cache_bust:
+            # Trailing bytes are ignored by the decoders but defeat the prediction cache
+            data = data + os.urandom(16)
+        session = getattr(sessions, 'session', None)
+        if session is None:
+            session = sessions.session = requests.Session()
+        try:
+            response = session.post(url, files={'image': (name, data)}, timeout=args.timeout)
+            error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        # Open-loop latency counts from the scheduled send time, so queueing
+        # behind a slow server is not hidden (no coordinated omission)
+        recorder.record(time.perf_counter() - scheduled_at, error)
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    if args.mode == 'closed':
+        def client():
+            while time.perf_counter() < deadline:
+                send(time.perf_counter())
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        rng = random.Random(0)
+        with ThreadPoolExecutor(max_workers=args.max_outstanding) as executor:
+            next_send = started
+            while next_send < deadline:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(send, next_send)
+                next_send += rng.expovariate(args.rate)  # Poisson arrivals
+
+    wall_time = time.perf_counter() - started
+    if not recorder.latencies:
+        raise SystemExit(f"No successful requests; errors: {recorder.errors}")
+
+    name = f"load[{args.mode}-c{args.concurrency}]" if args.mode == 'closed' else f"load[open-{args.rate:g}rps]"
+    summary = summarize(recorder.latencies, wall_time=wall_time)
+    summary["errors"] = sum(recorder.errors.values())
+    results = {name: summary}
+
+    print_table(results)
+    if recorder.errors:
+        print(f"Errors: {recorder.errors}")
+    output = {
+        "suite": "load",
+        "environment": environment_info(url=args.url, served=args.serve, mode=args.mode, duration=args.duration,
+                                        concurrency=args.concurrency, rate=args.rate,
+                                        charts=args.charts, cache_bust=args.cache_bust),
+        "results": results,
+        "errors": recorder.errors
+    }
+    write_and_check(output, args)
+
+
+def run_compare(args):
+    with open(args.results) as f:
+        results = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    check_regressions(results, baseline, args.tolerance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks and load tests for the inference service')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    images_parser = subparsers.add_parser('images', help='Write synthetic test images')
+    images_parser.add_argument('--out', default='bench_images')
+    images_parser.add_argument('--copies', type=int, default=2, help='Images per format and resolution')
+    images_parser.set_defaults(func=generate_images)
+
+    standin_parser = subparsers.add_parser('standin', help='Write the stand-in model')
+    standin_parser.add_argument('--out', default='model/standin_model.keras')
+    standin_parser.set_defaults(func=write_standin)
+
+    def add_result_args(subparser, default_output):
+        subparser.add_argument('-o', '--output', default=default_output, help='JSON results file')
+        subparser.add_argument('--baseline', help='Fail when results regress against this JSON file')
+        subparser.add_argument('--tolerance', type=float, default=0.2,
+                               help='Allowed relative slowdown before a regression is reported')
+
+    micro_parser = subparsers.add_parser('micro', help='Microbenchmarks of the prediction pipeline')
+    micro_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    micro_parser.add_argument('--backend', default='keras')
+    micro_parser.add_argument('--batch-sizes', type=lambda s: [int(b) for b in s.split(',')], default=[1, 4, 16])
+    micro_parser.add_argument('--repeats', type=int, default=30)
+    add_result_args(micro_parser, 'benchmark_micro.json')
+    micro_parser.set_defaults(func=run_micro)
+
+    load_parser = subparsers.add_parser('load', help='HTTP load test against /api/predict')
+    load_parser.add_argument('--url', default='http://localhost:5000')
+    load_parser.add_argument('--serve', action='store_true',
+                             help='Start serve.py for the run instead of using --url')
+    load_parser.add_argument('--model', default=DEFAULT_MODEL_PATH,
+                             help='Model served with --serve (a stand-in when missing)')
+    load_parser.add_argument('--backend', default='keras', help='Inference backend served with --serve')
+    load_parser.add_argument('--workers', type=int, default=1, help='serve.py workers with --serve')
+    load_parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    load_parser.add_argument('--concurrency', type=int, default=8, help='Clients in closed-loop mode')
+    load_parser.add_argument('--rate', type=float, default=10.0, help='Requests per second in open-loop mode')
+    load_parser.add_argument('--max-outstanding', type=int, default=256,
+                             help='Concurrent requests allowed in open-loop mode')
+    load_parser.add_argument('--duration', type=float, default=30.0, help='Seconds of load')
+    load_parser.add_argument('--timeout', type=float, default=60.0)
+    load_parser.add_argument('--images', help='Directory of images to send (default: generated)')
+    load_parser.add_argument('--charts', choices=['server', 'client'], default='server')
+    load_parser.add_argument('--no-cache-bust', dest='cache_bust', action='store_false',
+                             help='Send identical bytes, letting the prediction cache answer repeats')
+    add_result_args(load_parser, 'benchmark_load.json')
+    load_parser.set_defaults(func=run_load)
+
+    compare_parser = subparsers.add_parser('compare', help='Compare a results file with a baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--tolerance', type=float, default=0.2)
+    compare_parser.set_defaults(func=run_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
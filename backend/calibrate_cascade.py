@@ -0,0 +1,162 @@
+# calibrate_cascade.py
+"""
+Choose the confidence gate of the two-stage cascade.
+
+Scores a labelled sample with both the first-stage model and the full
+model, then reports for every threshold (and minimum margin) how many
+images would escalate to the full model, how often the cascade's answer
+agrees with the full model, the accuracy of each against the labels and
+the expected compute cost relative to always running the full model.
+
+The sample is a directory with one subdirectory per class label (images
+in other directories are scored but only count towards agreement).
+
+Usage (from the backend directory):
+    python calibrate_cascade.py --first-stage model/mobilenet_first_stage.keras \\
+        --samples /data/labelled_sample --target-agreement 0.99
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from backends import BACKEND_NAMES, load_backend
+from cascade import escalation_mask
+from ingest import decode_image_bytes
+
+DEFAULT_MODEL_PATH = 'model/resnet152V2_model.keras'
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tiff'}
+DEFAULT_THRESHOLDS = '0.5,0.6,0.7,0.8,0.85,0.9,0.95,0.97,0.99'
+
+
+def load_labelled_samples(samples_dir, class_labels, limit, target_size=(224, 224)):
+    """
+    uint8 batch of decoded, resized images and label indices (-1 when unlabelled).
+
+    The label of an image is the name of its parent directory.
+    """
+    images = []
+    labels = []
+    for root, _, files in os.walk(samples_dir):
+        label = os.path.basename(root)
+        for name in sorted(files):
+            if name.rsplit('.', 1)[-1].lower() not in ALLOWED_EXTENSIONS:
+                continue
+            with open(os.path.join(root, name), 'rb') as f:
+                try:
+                    images.append(decode_image_bytes(f.read(), target_size))
+                except Exception as e:
+                    print(f"Skipping {name}: {e}")
+                    continue
+            labels.append(class_labels.index(label) if label in class_labels else -1)
+            if len(images) >= limit:
+                break
+        if len(images) >= limit:
+            break
+    if not images:
+        raise SystemExit(f"No images found in {samples_dir}")
+    return np.stack(images), np.array(labels)
+
+
+def score(backend, samples, batch_size):
+    """Softmax outputs for all samples and the mean forward time per image"""
+    backend.predict(samples[:1])  # warm-up
+    outputs = []
+    started = time.perf_counter()
+    for start in range(0, len(samples), batch_size):
+        output = backend.predict(samples[start:start + batch_size])
+        outputs.append(output[0] if isinstance(output, tuple) else output)  # drop embeddings
+    return np.concatenate(outputs), (time.perf_counter() - started) / len(samples)
+
+
+def calibrate(first_outputs, full_outputs, labels, thresholds, margins, first_cost, full_cost):
+    """One report row per (threshold, margin) pair"""
+    labelled = labels >= 0
+    full_top = full_outputs.argmax(axis=1)
+    first_top = first_outputs.argmax(axis=1)
+
+    rows = []
+    for threshold in thresholds:
+        for margin in margins:
+            escalate = escalation_mask(first_outputs, threshold, margin)
+            cascade_top = np.where(escalate, full_top, first_top)
+            accepted = ~escalate
+            rows.append({
+                "threshold": threshold,
+                "min_margin": margin,
+                "escalation_rate": float(escalate.mean()),
+                "agreement_with_full": float((cascade_top == full_top).mean()),
+                "first_stage_agreement_when_accepted":
+                    float((first_top[accepted] == full_top[accepted]).mean()) if accepted.any() else None,
+                "cascade_accuracy":
+                    float((cascade_top[labelled] == labels[labelled]).mean()) if labelled.any() else None,
+                "full_accuracy":
+                    float((full_top[labelled] == labels[labelled]).mean()) if labelled.any() else None,
+                "relative_cost": float((first_cost + escalate.mean() * full_cost) / full_cost)
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Escalation rate and agreement of the model cascade per threshold')
+    parser.add_argument('--first-stage', required=True, help='First-stage model file')
+    parser.add_argument('--first-stage-backend', default='keras', choices=BACKEND_NAMES)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='Full model (.keras)')
+    parser.add_argument('--backend', default='keras', choices=BACKEND_NAMES, help='Backend of the full model')
+    parser.add_argument('--samples', required=True, help='Labelled sample directory (one subdirectory per class)')
+    parser.add_argument('--limit', type=int, default=2000, help='Maximum number of sample images')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS, help='Comma-separated top-1 thresholds')
+    parser.add_argument('--margins', default='0', help='Comma-separated minimum top-1/top-2 margins')
+    parser.add_argument('--target-agreement', type=float, default=0.99,
+                        help='Recommend the cheapest setting whose agreement with the full model reaches this')
+    parser.add_argument('-o', '--output', help='Also write the report as JSON')
+    args = parser.parse_args()
+
+    # App loads the full model (and provides the class labels)
+    os.environ['MODEL_PATH'] = args.model
+    os.environ['MODEL_STATE_FILE'] = ''  # never the hot-swapped version of a running server
+    os.environ['INFERENCE_BACKEND'] = args.backend
+    os.environ.pop('CASCADE_MODEL_PATH', None)
+    import App
+
+    samples, labels = load_labelled_samples(args.samples, App.class_labels, args.limit)
+    print(f"Scoring {len(samples)} images ({int((labels >= 0).sum())} labelled)")
+
+    first_outputs, first_cost = score(load_backend(args.first_stage_backend, args.first_stage),
+                                      samples, args.batch_size)
+    full_outputs, full_cost = score(App.model_registry.active.backend, samples, args.batch_size)
+    print(f"Forward time per image: first stage {first_cost * 1000:.2f} ms, full model {full_cost * 1000:.2f} ms")
+
+    thresholds = [float(t) for t in args.thresholds.split(',')]
+    margins = [float(m) for m in args.margins.split(',')]
+    rows = calibrate(first_outputs, full_outputs, labels, thresholds, margins, first_cost, full_cost)
+
+    def fmt(value):
+        return '     n/a' if value is None else f"{value:8.4f}"
+
+    print(f"{'threshold':>9} {'margin':>7} {'escalate':>8} {'agree':>8} {'acc':>8} {'full acc':>8} {'cost':>8}")
+    for row in rows:
+        print(f"{row['threshold']:>9.3f} {row['min_margin']:>7.3f} {row['escalation_rate']:>8.4f} "
+              f"{fmt(row['agreement_with_full'])} {fmt(row['cascade_accuracy'])} {fmt(row['full_accuracy'])} "
+              f"{row['relative_cost']:>8.4f}")
+
+    eligible = [row for row in rows if row['agreement_with_full'] >= args.target_agreement]
+    recommended = min(eligible, key=lambda row: row['relative_cost']) if eligible else None
+    if recommended:
+        print(f"Recommended: CASCADE_THRESHOLD={recommended['threshold']} "
+              f"CASCADE_MIN_MARGIN={recommended['min_margin']} "
+              f"(escalates {recommended['escalation_rate']:.1%}, agreement {recommended['agreement_with_full']:.4f})")
+    else:
+        print(f"No setting reaches agreement {args.target_agreement}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"first_stage_ms": first_cost * 1000, "full_ms": full_cost * 1000,
+                       "samples": len(samples), "rows": rows, "recommended": recommended}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# cascade.py
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def top_confidence_and_margin(probabilities):
+    """
+    Top-1 probability and its margin over the runner-up, per row.
+
+    Args:
+        probabilities: Array (N, num_classes), or a single vector
+
+    Returns:
+        (top1, margin) arrays of shape (N,)
+    """
+    probs = np.atleast_2d(probabilities)
+    top2 = np.partition(probs, -2, axis=1)[:, -2:]
+    return top2[:, 1], top2[:, 1] - top2[:, 0]
+
+
+def escalation_mask(probabilities, threshold, min_margin=0.0):
+    """
+    Rows whose first-stage answer is not confident enough to keep.
+
+    A row is accepted when its top-1 probability is at least threshold and
+    its margin over the runner-up is at least min_margin.
+    """
+    top1, margin = top_confidence_and_margin(probabilities)
+    return (top1 < threshold) | (margin < min_margin)
+
+
+class ModelCascade:
+    """
+    Two-stage classifier: a small first-stage model answers confident
+    images and escalates the rest to the full model.
+
+    Both stages are micro-batched engines (see batching.MicroBatcher), so
+    first-stage passes and escalations are each batched across concurrent
+    requests.
+    """
+
+    def __init__(self, first_stage, full_model, threshold=0.9, min_margin=0.0, on_decision=None):
+        """
+        Args:
+            first_stage: Engine with submit(image) -> Future of a softmax row,
+                or None to send every image to the full model
+            full_model: Engine with the same interface for the full model
+            threshold: Minimum first-stage top-1 probability to accept its answer
+            min_margin: Minimum top-1 minus top-2 probability to accept its answer
+            on_decision: Optional callable receiving 'first' or 'full' per image
+        """
+        self.first_stage = first_stage
+        self.full_model = full_model
+        self.threshold = threshold
+        self.min_margin = min_margin
+        self.on_decision = on_decision or (lambda stage: None)
+
+    def submit(self, image):
+        """
+        Classify one preprocessed image.
+
+        Returns:
+            Future resolving to (softmax row, answering stage: 'first' or 'full',
+            embedding row or None). Embeddings come from the full model only,
+            when its engine returns (softmax, embedding) pairs.
+        """
+        result = Future()
+        result.set_running_or_notify_cancel()
+
+        def escalated(future):
+            try:
+                output = future.result()
+                probs, embedding = output if isinstance(output, tuple) else (output, None)
+                result.set_result((probs, 'full', embedding))
+            except Exception as e:
+                result.set_exception(e)
+
+        if self.first_stage is None:
+            self.full_model.submit(image).add_done_callback(escalated)
+            return result
+
+        def first_stage_done(future):
+            try:
+                probs = future.result()
+                if not escalation_mask(probs, self.threshold, self.min_margin)[0]:
+                    self.on_decision('first')
+                    result.set_result((probs, 'first', None))
+                    return
+                self.on_decision('full')
+                self.full_model.submit(image).add_done_callback(escalated)
+            except Exception as e:
+                result.set_exception(e)
+
+        self.first_stage.submit(image).add_done_callback(first_stage_done)
+        return result
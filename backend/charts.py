@@ -0,0 +1,58 @@
+# charts.py
+import io
+
+CHART_KINDS = ('bar', 'organ', 'pie')
+
+
+def render_chart(kind, chart_data):
+    """
+    Render one prediction chart to PNG.
+
+    Uses the object-oriented matplotlib API (no pyplot global state), so
+    charts can be rendered concurrently from request threads.
+
+    Args:
+        kind: One of 'bar' (top 5 classes), 'organ' (organ-wise maxima) or
+            'pie' (benign vs malignant)
+        chart_data: Chart data dict as returned in the predict response
+
+    Returns:
+        PNG image bytes
+    """
+    # matplotlib is imported on the first chart, keeping it out of startup
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    if kind == 'bar':
+        fig = Figure(figsize=(10, 6))
+        ax = fig.add_subplot()
+        top5 = chart_data['top5']
+        ax.barh([entry['readable_name'] for entry in top5],
+                [entry['confidence'] for entry in top5], color='skyblue')
+        ax.set_xlabel('Confidence')
+        ax.set_title('Top 5 Predictions')
+        fig.tight_layout()
+    elif kind == 'organ':
+        fig = Figure(figsize=(12, 8))
+        ax = fig.add_subplot()
+        organs = chart_data['organs']
+        ax.barh([entry['organ'] for entry in organs],
+                [entry['confidence'] for entry in organs],
+                color=['crimson' if entry['is_malignant'] else 'forestgreen' for entry in organs])
+        ax.set_xlabel('Max Confidence')
+        ax.set_title('Organ-wise Highest Confidence')
+        fig.tight_layout()
+    elif kind == 'pie':
+        fig = Figure(figsize=(8, 8))
+        ax = fig.add_subplot()
+        assessment = chart_data['benign_vs_malignant']
+        ax.pie([assessment['benign'], assessment['malignant']], labels=['Benign', 'Malignant/Abnormal'],
+               colors=['forestgreen', 'crimson'], autopct='%1.1f%%', startangle=90)
+        ax.axis('equal')
+        ax.set_title('Benign vs Malignant Assessment')
+    else:
+        raise ValueError(f"Unknown chart kind: {kind}")
+
+    buf = io.BytesIO()
+    FigureCanvasAgg(fig).print_png(buf)
+    return buf.getvalue()
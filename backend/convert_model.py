@@ -0,0 +1,137 @@
+# convert_model.py
+"""
+Convert the Keras classifier for the CPU-optimized inference backends and
+check that the converted models agree with it.
+
+Usage (from the backend directory):
+    python convert_model.py convert --format all
+    python convert_model.py parity --backend tflite-int8 --samples /data/sample_images
+"""
+import argparse
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from backends import BACKEND_NAMES, converted_model_path, load_backend
+from inference import uint8_input_model
+from ingest import decode_image_bytes
+
+DEFAULT_MODEL_PATH = 'model/resnet152V2_model.keras'
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tiff'}
+
+
+def convert_tflite(model, output_path, quantization):
+    """
+    Convert to TensorFlow Lite.
+
+    The converted model takes uint8 pixels and normalizes them itself.
+
+    Args:
+        quantization: 'fp16' (float16 weights) or 'int8' (dynamic-range int8
+            weights, float activations)
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(uint8_input_model(model))
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'fp16':
+        converter.target_spec.supported_types = [tf.float16]
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def convert_onnx(model, output_path, input_shape=(224, 224, 3)):
+    """Convert to ONNX with a uint8 input (requires the optional tf2onnx package)"""
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None,) + tuple(input_shape), tf.uint8, name='input'),)
+    tf2onnx.convert.from_keras(uint8_input_model(model, input_shape), input_signature=spec, opset=13,
+                               output_path=output_path)
+
+
+def convert(args):
+    model = tf.keras.models.load_model(args.model)
+    formats = [name for name in BACKEND_NAMES if name != 'keras'] if args.format == 'all' else [args.format]
+
+    for name in formats:
+        output_path = converted_model_path(args.model, name)
+        print(f"Converting {args.model} -> {output_path}")
+        if name == 'tflite-fp16':
+            convert_tflite(model, output_path, 'fp16')
+        elif name == 'tflite-int8':
+            convert_tflite(model, output_path, 'int8')
+        elif name == 'onnx':
+            convert_onnx(model, output_path)
+        print(f"  {os.path.getsize(output_path) / 1e6:.1f} MB")
+
+
+def load_samples(samples_dir, limit, target_size=(224, 224)):
+    """uint8 batch of up to limit decoded, resized images from a directory tree"""
+    images = []
+    for root, _, files in os.walk(samples_dir):
+        for name in sorted(files):
+            if name.rsplit('.', 1)[-1].lower() in ALLOWED_EXTENSIONS:
+                with open(os.path.join(root, name), 'rb') as f:
+                    try:
+                        images.append(decode_image_bytes(f.read(), target_size))
+                    except Exception as e:
+                        print(f"Skipping {name}: {e}")
+            if len(images) >= limit:
+                break
+        if len(images) >= limit:
+            break
+    if not images:
+        raise SystemExit(f"No images found in {samples_dir}")
+    return np.stack(images)
+
+
+def parity(args):
+    samples = load_samples(args.samples, args.limit)
+    reference_backend = load_backend('keras', args.model)
+    candidate_backend = load_backend(args.backend, args.model)
+
+    reference = []
+    candidate = []
+    for start in range(0, len(samples), args.batch_size):
+        batch = samples[start:start + args.batch_size]
+        reference.append(reference_backend.predict(batch))
+        candidate.append(candidate_backend.predict(batch))
+    reference = np.concatenate(reference)
+    candidate = np.concatenate(candidate)
+
+    deviation = np.abs(reference - candidate)
+    agreement = float(np.mean(reference.argmax(axis=1) == candidate.argmax(axis=1)))
+
+    print(f"Parity of {args.backend} against keras on {len(samples)} images:")
+    print(f"  top-1 agreement:         {agreement:.4f}")
+    print(f"  max softmax deviation:   {deviation.max():.6f}")
+    print(f"  mean softmax deviation:  {deviation.mean():.6f}")
+
+    if agreement < args.min_agreement:
+        raise SystemExit(f"Top-1 agreement {agreement:.4f} is below {args.min_agreement}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert the classifier and verify converted backends')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='Write converted model files next to the .keras model')
+    convert_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    convert_parser.add_argument('--format', default='all', choices=['all'] + [n for n in BACKEND_NAMES if n != 'keras'])
+    convert_parser.set_defaults(func=convert)
+
+    parity_parser = subparsers.add_parser('parity', help='Compare a converted backend with the Keras model')
+    parity_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parity_parser.add_argument('--backend', required=True, choices=[n for n in BACKEND_NAMES if n != 'keras'])
+    parity_parser.add_argument('--samples', required=True, help='Directory of sample images')
+    parity_parser.add_argument('--limit', type=int, default=256, help='Maximum number of sample images')
+    parity_parser.add_argument('--batch-size', type=int, default=16)
+    parity_parser.add_argument('--min-agreement', type=float, default=0.0,
+                               help='Exit non-zero when top-1 agreement falls below this value')
+    parity_parser.set_defaults(func=parity)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
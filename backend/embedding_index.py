@@ -0,0 +1,214 @@
+# embedding_index.py
+import fcntl
+import json
+import os
+import threading
+
+import numpy as np
+
+# Per-row id map: content hash of the image, predicted class and upload extension
+RECORD_DTYPE = np.dtype([('key', 'u1', (32,)), ('class_index', 'u1'), ('extension', 'u1')])
+
+
+class EmbeddingIndex:
+    """
+    Append-only, memory-mapped store of image embeddings for similar-case search.
+
+    Vectors are L2-normalized and stored as float16 rows of vectors.f16;
+    records.bin holds the matching id map rows (RECORD_DTYPE) and
+    index.json the row count. Files grow in chunks of grow_rows rows and
+    are only ever appended to, so readers just map the first count rows.
+    Each key is stored once: adding a key that is already indexed overwrites
+    its row in place. Search scans the mapped matrix in chunks whose float32
+    copy is about search_chunk_bytes, so memory use does not depend on the
+    number of stored vectors and pages are left to the OS page cache.
+
+    Appends take an exclusive file lock, so several worker processes can
+    share one index directory.
+    """
+
+    def __init__(self, directory, dim, grow_rows=65536, search_chunk_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            directory: Index directory (created if missing)
+            dim: Embedding dimension
+            grow_rows: Rows added to the files whenever they are full
+            search_chunk_bytes: Size of the float32 copy of the rows scored
+                per step of a search (8192 rows of 2048-d vectors by default)
+        """
+        self.directory = directory
+        self.dim = int(dim)
+        self.grow_rows = int(grow_rows)
+        self.search_chunk_rows = max(1, int(search_chunk_bytes) // (self.dim * 4))
+
+        self._vectors_path = os.path.join(directory, 'vectors.f16')
+        self._records_path = os.path.join(directory, 'records.bin')
+        self._header_path = os.path.join(directory, 'index.json')
+        self._lock_path = os.path.join(directory, '.lock')
+        self._lock = threading.Lock()
+        self._capacity = 0
+        self._vectors = None
+        self._records = None
+        self._rows = {}  # key bytes -> row, for the first _rows_count rows
+        self._rows_count = 0
+
+        os.makedirs(directory, exist_ok=True)
+        header = self._read_header()
+        if header is not None and header["dim"] != self.dim:
+            raise ValueError(f"Index in {directory} holds {header['dim']}-d vectors, not {self.dim}-d")
+
+    def __len__(self):
+        header = self._read_header()
+        return header["count"] if header else 0
+
+    def add(self, key, embedding, class_index, extension_code=0):
+        """
+        Append one embedding, or overwrite the row of an already indexed key.
+
+        Args:
+            key: Hex content hash identifying the image (SHA-256)
+            embedding: Vector of length dim
+            class_index: Predicted class index
+            extension_code: Small integer identifying the upload extension
+
+        Returns:
+            Row number of the entry
+        """
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+
+        with self._lock, open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            header = self._read_header() or {"dim": self.dim, "count": 0}
+            key_bytes = bytes.fromhex(key)
+            row = self._row_of(key_bytes, header["count"])
+            appended = row is None
+            if appended:
+                row = header["count"]
+                self._ensure_capacity(row + 1)
+
+            # Shared mappings: other processes see the row without an msync
+            self._vectors[row] = vector.astype(np.float16)
+            self._records[row] = (np.frombuffer(key_bytes, dtype=np.uint8), class_index, extension_code)
+
+            if appended:
+                # Publish the row only after its data is written
+                header["count"] = row + 1
+                self._write_header(header)
+                self._rows[key_bytes] = row
+            return row
+
+    def vector_for(self, key):
+        """Stored (normalized) vector of an image, or None if it was never indexed"""
+        with self._lock:
+            row = self._row_of(bytes.fromhex(key), len(self))
+            if row is None:
+                return None
+            return np.asarray(self._vectors[row], dtype=np.float32)
+
+    def _row_of(self, key_bytes, count):
+        """Row of a key among the first count rows, or None (called with self._lock held)"""
+        count = self._map(count)
+        # Rows appended since the last call (possibly by other processes) join the key map
+        for start in range(self._rows_count, count, self.search_chunk_rows):
+            stop = min(start + self.search_chunk_rows, count)
+            keys = self._records['key'][start:stop]
+            for offset in range(stop - start):
+                self._rows.setdefault(keys[offset].tobytes(), start + offset)
+        self._rows_count = max(self._rows_count, count)
+        return self._rows.get(key_bytes)
+
+    def search(self, query, k=5, class_mask=None, exclude_key=None):
+        """
+        k most cosine-similar stored embeddings.
+
+        Args:
+            query: Query embedding (need not be normalized)
+            k: Number of neighbours
+            class_mask: Optional boolean array over class indices; only rows
+                whose predicted class is True are considered
+            exclude_key: Optional hex key left out of the results (the query itself)
+
+        Returns:
+            List of dicts with row, key, class_index, extension and similarity,
+            most similar first
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        excluded = np.frombuffer(bytes.fromhex(exclude_key), dtype=np.uint8) if exclude_key else None
+
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        with self._lock:
+            count = self._map(len(self))
+            for start in range(0, count, self.search_chunk_rows):
+                stop = min(start + self.search_chunk_rows, count)
+                scores = self._vectors[start:stop].astype(np.float32) @ query
+
+                records = self._records[start:stop]
+                valid = np.ones(stop - start, dtype=bool)
+                if class_mask is not None:
+                    valid &= class_mask[records['class_index']]
+                if excluded is not None:
+                    valid &= (records['key'] != excluded).any(axis=1)
+                scores[~valid] = -np.inf
+
+                # Merge this chunk's top k with the running top k
+                top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+                best_rows = np.concatenate([best_rows, top + start])
+                best_scores = np.concatenate([best_scores, scores[top]])
+                keep = np.argsort(-best_scores, kind='stable')[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+            results = []
+            for row, score in zip(best_rows, best_scores):
+                if not np.isfinite(score):
+                    continue
+                record = self._records[row]
+                results.append({
+                    "row": int(row),
+                    "key": record['key'].tobytes().hex(),
+                    "class_index": int(record['class_index']),
+                    "extension": int(record['extension']),
+                    "similarity": float(score)
+                })
+        return results
+
+    def _read_header(self):
+        try:
+            with open(self._header_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_header(self, header):
+        tmp_path = f"{self._header_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(header, f)
+        os.replace(tmp_path, self._header_path)
+
+    def _ensure_capacity(self, rows):
+        # Called with the file lock held
+        self._map(rows)
+        if rows <= self._capacity:
+            return
+        capacity = ((rows + self.grow_rows - 1) // self.grow_rows) * self.grow_rows
+        for path, row_bytes in ((self._vectors_path, self.dim * 2), (self._records_path, RECORD_DTYPE.itemsize)):
+            with open(path, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        self._map(rows)
+
+    def _map(self, rows):
+        """(Re)map the files if another process grew them; returns rows"""
+        if not os.path.exists(self._vectors_path):
+            return 0
+        capacity = os.path.getsize(self._vectors_path) // (self.dim * 2)
+        if capacity != self._capacity:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode='r+', shape=(capacity, self.dim))
+            self._records = np.memmap(self._records_path, dtype=RECORD_DTYPE, mode='r+', shape=(capacity,))
+            self._capacity = capacity
+        return min(rows, self._capacity)
@@ -1,44 +1,204 @@
 # gradcam.py
-import tensorflow as tf
+import threading
+
+import cv2
 import numpy as np
+import tensorflow as tf
+
+from inference import nested_feature_model
+
+# Gradient sub-models and compiled explain functions, built once per (model, layer)
+_grad_models = {}
+_explain_fns = {}
+_cache_lock = threading.Lock()
+
+
+def find_last_conv_layer(model):
+    """
+    Find the last layer of a model that produces a spatial (4D) feature map.
+
+    For the ResNet152V2 classifier this is the final activation of the
+    convolutional trunk (or the nested backbone model itself when the
+    classifier wraps it as a single layer), right before global pooling.
+    A nested backbone must sit in a linear chain of layers (backbone,
+    pooling, dense head), see get_grad_model().
+
+    Args:
+        model: Loaded TensorFlow/Keras model
+
+    Returns:
+        Name of the layer
+    """
+    for layer in reversed(model.layers):
+        try:
+            shape = layer.output.shape
+        except (AttributeError, ValueError):
+            continue
+        if len(shape) == 4:
+            return layer.name
+    raise ValueError("Model has no convolutional layer with a 4D output")
+
 
-def make_gradcam_heatmap(img_array, model, last_conv_layer_name, pred_index=None):
+def get_grad_model(model, last_conv_layer_name=None):
+    """
+    Return the cached model mapping inputs to (last conv activations, predictions).
+
+    Args:
+        model: Loaded TensorFlow/Keras model
+        last_conv_layer_name: Layer to explain (None auto-detects the last conv layer)
+    """
+    if last_conv_layer_name is None:
+        last_conv_layer_name = find_last_conv_layer(model)
+
+    key = (id(model), last_conv_layer_name)
+    with _cache_lock:
+        if key not in _grad_models:
+            layer = model.get_layer(last_conv_layer_name)
+            if isinstance(layer, tf.keras.Model):
+                _grad_models[key] = nested_feature_model(model, layer)
+            else:
+                _grad_models[key] = tf.keras.models.Model(
+                    inputs=model.inputs,
+                    outputs=[layer.output, model.output]
+                )
+        return _grad_models[key]
+
+
+def _get_explain_fn(model, last_conv_layer_name, top_k, with_class_indices):
+    if last_conv_layer_name is None:
+        last_conv_layer_name = find_last_conv_layer(model)
+
+    key = (id(model), last_conv_layer_name, top_k, with_class_indices)
+    with _cache_lock:
+        if key in _explain_fns:
+            return _explain_fns[key]
+
+    grad_model = get_grad_model(model, last_conv_layer_name)
+
+    def explain(images, class_indices):
+        with tf.GradientTape() as tape:
+            conv_outputs, preds = grad_model(images, training=False)
+            if class_indices is None:
+                class_indices = tf.math.top_k(preds, k=top_k).indices
+            # Each image only influences its own scores, so summing over the
+            # batch yields every image's gradient in the same backward pass
+            class_scores = tf.reduce_sum(tf.gather(preds, class_indices, batch_dims=1), axis=0)
+
+        # (K, N, h, w, c): one vectorized backward pass for all K classes
+        grads = tape.jacobian(class_scores, conv_outputs)
+
+        # Weight each channel by its mean gradient and combine
+        pooled_grads = tf.reduce_mean(grads, axis=(2, 3))
+        heatmaps = tf.einsum('nhwc,knc->nkhw', conv_outputs, pooled_grads)
+
+        # Normalize each heatmap to [0, 1]
+        heatmaps = tf.nn.relu(heatmaps)
+        heatmaps = tf.math.divide_no_nan(heatmaps, tf.reduce_max(heatmaps, axis=(2, 3), keepdims=True))
+        return preds, class_indices, heatmaps
+
+    # Fixed signatures with a free batch dimension: one trace per (model, layer, K), whatever the batch size
+    image_spec = tf.TensorSpec([None] + list(model.input_shape[1:]), tf.float32)
+    if with_class_indices:
+        fn = tf.function(explain, input_signature=[image_spec, tf.TensorSpec([None, top_k], tf.int32)])
+    else:
+        fn = tf.function(lambda images: explain(images, None), input_signature=[image_spec])
+
+    with _cache_lock:
+        return _explain_fns.setdefault(key, fn)
+
+
+def warm_up(model, last_conv_layer_name=None, top_k=1):
+    """Trace the default (top_k predicted classes) explain function before the first request"""
+    compute_heatmaps(np.zeros((1,) + tuple(model.input_shape[1:]), dtype=np.float32), model,
+                     last_conv_layer_name, top_k=top_k)
+
+
+def release_model(model):
+    """Drop the cached gradient models and explain functions built for a model (when it is unloaded)"""
+    with _cache_lock:
+        for cache in (_grad_models, _explain_fns):
+            for key in [key for key in cache if key[0] == id(model)]:
+                del cache[key]
+
+
+def compute_heatmaps(img_array, model, last_conv_layer_name=None, class_indices=None, top_k=1):
+    """
+    Create Grad-CAM heatmaps for a batch of images and one or more classes.
+
+    The forward pass, the class selection and the gradients for all requested
+    classes share a single GradientTape pass.
+
+    Args:
+        img_array: Batch of preprocessed images (N, H, W, 3)
+        model: Loaded TensorFlow/Keras model
+        last_conv_layer_name: Layer to explain (None auto-detects the last conv layer)
+        class_indices: Class indices to explain per image (N, K); None explains
+            each image's top_k predicted classes
+        top_k: Number of top classes to explain when class_indices is None
+
+    Returns:
+        Tuple (predictions (N, C), class_indices (N, K), heatmaps (N, K, h, w))
+        as numpy arrays
+    """
+    images = tf.convert_to_tensor(img_array, dtype=tf.float32)
+    if class_indices is not None:
+        class_indices = tf.convert_to_tensor(class_indices, dtype=tf.int32)
+        top_k = int(class_indices.shape[1])
+
+    if class_indices is None:
+        preds, indices, heatmaps = _get_explain_fn(model, last_conv_layer_name, int(top_k), False)(images)
+    else:
+        explain = _get_explain_fn(model, last_conv_layer_name, int(top_k), True)
+        preds, indices, heatmaps = explain(images, class_indices)
+    return preds.numpy(), indices.numpy(), heatmaps.numpy()
+
+
+def make_gradcam_heatmap(img_array, model, last_conv_layer_name=None, pred_index=None):
     """
     Create a Grad-CAM heatmap for model visualization.
-    
+
     Args:
         img_array: Input image as a numpy array (preprocessed for the model)
         model: Loaded TensorFlow/Keras model
         last_conv_layer_name: Name of the last convolutional layer in the model
+            (None auto-detects it)
         pred_index: Index of the predicted class to visualize (None for highest scoring class)
-    
+
     Returns:
         Generated heatmap as a numpy array
     """
-    # Create a model that maps the input image to the activations of the last conv layer
-    grad_model = tf.keras.models.Model(
-        inputs=[model.inputs],
-        outputs=[model.get_layer(last_conv_layer_name).output, model.output]
-    )
-    
-    # Compute gradient of top predicted class with respect to last conv layer
-    with tf.GradientTape() as tape:
-        last_conv_layer_output, preds = grad_model(img_array)
-        if pred_index is None:
-            pred_index = tf.argmax(preds[0])
-        class_channel = preds[:, pred_index]
-    
-    # Gradient of the predicted class with respect to the output feature map
-    grads = tape.gradient(class_channel, last_conv_layer_output)
-    
-    # Vector of mean intensity of gradients over a specific feature map channel
-    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
-    
-    # Weight the channels by importance (pooled gradients)
-    last_conv_layer_output = last_conv_layer_output[0]
-    heatmap = last_conv_layer_output @ pooled_grads[..., tf.newaxis]
-    heatmap = tf.squeeze(heatmap)
-    
-    # Normalize the heatmap
-    heatmap = tf.maximum(heatmap, 0) / tf.math.reduce_max(heatmap)
-    return heatmap.numpy()
\ No newline at end of file
+    class_indices = None if pred_index is None else [[int(pred_index)]]
+    _, _, heatmaps = compute_heatmaps(img_array[:1], model, last_conv_layer_name, class_indices)
+    return heatmaps[0, 0]
+
+
+def overlay_heatmaps(images, heatmaps, alpha=0.4, colormap=cv2.COLORMAP_JET):
+    """
+    Colorize heatmaps and blend them over their images.
+
+    All maps are resized in one multi-channel cv2.resize call and colorized in
+    one cv2.applyColorMap call on a stacked image.
+
+    Args:
+        images: uint8 RGB images (N, H, W, 3)
+        heatmaps: Heatmaps in [0, 1] (N, K, h, w)
+        alpha: Opacity of the heatmap layer
+        colormap: OpenCV colormap
+
+    Returns:
+        uint8 RGB overlays (N, K, H, W, 3)
+    """
+    images = np.asarray(images, dtype=np.uint8)
+    n, k, h, w = heatmaps.shape
+    height, width = images.shape[1:3]
+
+    # (h, w, N*K) -> resize all maps at once -> (N*K, H, W)
+    maps = np.uint8(255 * np.clip(heatmaps, 0, 1)).reshape(n * k, h, w).transpose(1, 2, 0)
+    maps = cv2.resize(maps, (width, height), interpolation=cv2.INTER_LINEAR)
+    maps = maps.reshape(height, width, n * k).transpose(2, 0, 1)
+
+    colored = cv2.applyColorMap(np.ascontiguousarray(maps.reshape(n * k * height, width)), colormap)
+    colored = colored[..., ::-1].reshape(n, k, height, width, 3)
+
+    blended = (1 - alpha) * images[:, None].astype(np.float32) + alpha * colored.astype(np.float32)
+    return np.clip(blended, 0, 255).astype(np.uint8)
@@ -0,0 +1,108 @@
+# inference.py
+import numpy as np
+import tensorflow as tf
+
+
+def find_embedding_layer(model):
+    """
+    Name of the layer producing the penultimate feature vector: the last
+    rank-2 output before the classifier (the global-pooled features).
+    """
+    for layer in reversed(model.layers[:-1]):
+        if len(layer.output.shape) == 2:
+            return layer.name
+    raise ValueError("Could not find a pooled feature layer before the classifier.")
+
+
+def nested_feature_model(model, backbone):
+    """
+    Model mapping inputs to (backbone output, predictions) for a classifier
+    that wraps its backbone as a single layer.
+
+    The nested model's .output belongs to its own inner graph, not to the
+    outer model's inputs, so the layers are chained again on a fresh input:
+    the layers before the backbone, the backbone, then the head. Layers
+    are reused, so weights are shared; this assumes a linear chain.
+    """
+    index = model.layers.index(backbone)
+    inputs = tf.keras.Input(shape=model.input_shape[1:], dtype=model.inputs[0].dtype)
+    x = inputs
+    for layer in model.layers[:index]:
+        if not isinstance(layer, tf.keras.layers.InputLayer):
+            x = layer(x)
+    features = backbone(x)
+    x = features
+    for layer in model.layers[index + 1:]:
+        x = layer(x)
+    return tf.keras.Model(inputs=inputs, outputs=[features, x])
+
+
+def make_serving_fn(model, input_shape=(224, 224, 3), embedding_layer=None, resize=False):
+    """
+    Build a long-lived inference callable for a loaded Keras model.
+
+    The model call is wrapped in a tf.function with a fixed input signature
+    (only the batch axis is left open), so it is traced exactly once and the
+    same graph is reused for every batch instead of rebuilding the predict
+    function and data adapter the way model.predict() does.
+
+    The function takes raw uint8 RGB pixels and scales them to [0, 1] inside
+    the graph, so callers hand over compact uint8 batches and no float copy
+    is made on the Python side.
+
+    Args:
+        model: Loaded TensorFlow/Keras model
+        input_shape: Per-image input shape expected by the model
+        embedding_layer: Optional layer name whose output is returned next to
+            the softmax, from the same forward pass (may be a nested backbone
+            model, see nested_feature_model())
+        resize: Accept any height and width and resize to input_shape in the
+            graph (all images of one batch must still share a size)
+
+    Returns:
+        tf.function mapping a uint8 batch (N, H, W, C) to the model outputs
+        (a (softmax, embeddings) pair when embedding_layer is given)
+    """
+    image_shape = (None, None, input_shape[2]) if resize else tuple(input_shape)
+    spec = tf.TensorSpec(shape=(None,) + image_shape, dtype=tf.uint8)
+    if embedding_layer is not None:
+        layer = model.get_layer(embedding_layer)
+        if isinstance(layer, tf.keras.Model):
+            # The backbone's own output is not connected to the outer inputs
+            feature_model = nested_feature_model(model, layer)
+            model = tf.keras.Model(feature_model.inputs, feature_model.outputs[::-1])
+        else:
+            model = tf.keras.Model(model.inputs, [model.outputs[0], layer.output])
+
+    @tf.function(input_signature=[spec])
+    def serve(images):
+        images = tf.cast(images, tf.float32) * (1.0 / 255.0)
+        if resize:
+            images = tf.image.resize(images, input_shape[:2], antialias=True)
+        return model(images, training=False)
+
+    return serve
+
+
+def uint8_input_model(model, input_shape=(224, 224, 3)):
+    """
+    Keras model taking raw uint8 pixels and scaling them to [0, 1] before
+    the wrapped model: the graph that converted backends are exported from.
+    """
+    inputs = tf.keras.Input(shape=tuple(input_shape), dtype='uint8', name='input')
+    outputs = model(tf.keras.layers.Rescaling(1.0 / 255.0)(inputs), training=False)
+    return tf.keras.Model(inputs, outputs)
+
+
+def warm_up(serving_fn, input_shape=(224, 224, 3), batch_sizes=(1,)):
+    """
+    Trace the serving function and run it once per batch size so the first
+    real request does not pay for graph construction or kernel selection.
+
+    Args:
+        serving_fn: Callable returned by make_serving_fn()
+        input_shape: Per-image input shape expected by the model
+        batch_sizes: Batch sizes to exercise
+    """
+    for batch_size in sorted(set(batch_sizes)):
+        serving_fn(np.zeros((batch_size,) + tuple(input_shape), dtype=np.uint8))
@@ -0,0 +1,37 @@
+# ingest.py
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def decode_image_bytes(data, target_size=(224, 224)):
+    """
+    Decode an encoded image straight from memory and resize it for the model.
+
+    JPEG sources much larger than the target are decoded at reduced resolution
+    (libjpeg DCT scaling to 1/2, 1/4 or 1/8) so the full-resolution bitmap is
+    never materialised; the final resize is done with OpenCV.
+
+    Args:
+        data: Encoded image bytes (png, jpg, jpeg, tiff)
+        target_size: Output (width, height)
+
+    Returns:
+        uint8 RGB array of shape (height, width, 3)
+    """
+    img = Image.open(io.BytesIO(data))
+    if img.format == 'JPEG':
+        # Picks the largest scale reduction that stays >= target_size
+        img.draft('RGB', target_size)
+    img = img.convert('RGB')
+
+    img_array = np.asarray(img)
+    height, width = img_array.shape[:2]
+    if (width, height) != tuple(target_size):
+        downscaling = width >= target_size[0] and height >= target_size[1]
+        interpolation = cv2.INTER_AREA if downscaling else cv2.INTER_LINEAR
+        img_array = cv2.resize(img_array, tuple(target_size), interpolation=interpolation)
+    return img_array
+
@@ -0,0 +1,249 @@
+# jobs.py
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the work queue is at capacity"""
+
+    def __init__(self, retry_after):
+        super().__init__("Job queue is full")
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """
+    Bounded work queue served by a fixed pool of worker threads.
+
+    Submissions return a job id immediately. Each job moves through
+    queued -> running -> done/failed, and handlers can report intermediate
+    stages. Observers poll snapshots with get() or block for the next
+    change with wait_for_update() (used for Server-Sent Events). Finished
+    jobs are kept for result_ttl seconds.
+
+    Jobs run in the process that accepted them. With state_dir, every job
+    change is also written to <state_dir>/<job id>.json, so that sibling
+    processes sharing the directory (serve.py workers) can answer polls and
+    event streams for jobs they did not accept; they follow such jobs by
+    polling the file.
+    """
+
+    def __init__(self, handler, num_workers=8, max_queue=64, result_ttl=600, state_dir=None,
+                 poll_interval=0.25):
+        """
+        Args:
+            handler: Callable (payload, report) -> result dict, where
+                report(stage) records progress of the running job
+            num_workers: Number of worker threads
+            max_queue: Jobs that may wait for a worker before submissions are rejected
+            result_ttl: Seconds finished jobs stay available
+            state_dir: Optional directory shared by all processes serving the
+                same API (job results must be JSON-serializable)
+            poll_interval: Seconds between reads of another process's job file
+        """
+        self.handler = handler
+        self.num_workers = max(1, int(num_workers))
+        self.max_queue = max(1, int(max_queue))
+        self.result_ttl = result_ttl
+        self.state_dir = state_dir
+        self.poll_interval = poll_interval
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self._last_sweep = 0.0
+
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._jobs = {}
+        self._changed = threading.Condition()
+        self._workers = []
+        self._pid = None
+        self._avg_job_seconds = 1.0
+
+    @property
+    def queue_depth(self):
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def retry_after(self):
+        """Seconds a rejected client should wait, from the current backlog and job time"""
+        backlog = self._queue.qsize() + self.num_workers
+        return max(1, int(round(backlog * self._avg_job_seconds / self.num_workers)))
+
+    def submit(self, payload):
+        """
+        Queue a job.
+
+        Returns:
+            The new job id
+
+        Raises:
+            QueueFull: when max_queue jobs are already waiting
+        """
+        self._ensure_workers()
+        self._expire()
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {"id": job_id, "status": "queued", "stage": "queued", "created": now,
+               "updated": now, "result": None, "error": None, "version": 0}
+        with self._changed:
+            self._jobs[job_id] = job
+        # Saved before a worker can pick the job up, so this "queued" state
+        # never overwrites the worker's newer one
+        self._persist(dict(job))
+        try:
+            self._queue.put_nowait((job_id, payload))
+        except queue.Full:
+            with self._changed:
+                del self._jobs[job_id]
+            self._discard(job_id)
+            raise QueueFull(self.retry_after())
+        return job_id
+
+    def get(self, job_id):
+        """Snapshot of a job, or None if unknown or expired"""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        return self._load(job_id)
+
+    def wait_for_update(self, job_id, version, timeout=None):
+        """
+        Block until the job's version moves past version (or timeout expires).
+
+        Returns:
+            Latest job snapshot, or None if the job is unknown
+        """
+        with self._changed:
+            if job_id in self._jobs:
+                self._changed.wait_for(
+                    lambda: job_id not in self._jobs or self._jobs[job_id]["version"] > version, timeout)
+                job = self._jobs.get(job_id)
+                return dict(job) if job is not None else None
+
+        # Job of another process: follow its state file
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            job = self._load(job_id)
+            if job is None or job["version"] > version:
+                return job
+            remaining = deadline - time.monotonic() if deadline is not None else self.poll_interval
+            if remaining <= 0:
+                return job
+            time.sleep(min(self.poll_interval, remaining))
+
+    def _update(self, job_id, **fields):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            job["updated"] = time.time()
+            job["version"] += 1
+            snapshot = dict(job)
+            self._changed.notify_all()
+        # Updates of one job all come from the worker thread running it, so files are written in order
+        self._persist(snapshot)
+
+    # ---- shared job state ----
+
+    def _state_path(self, job_id):
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _persist(self, job):
+        if not self.state_dir:
+            return
+        path = self._state_path(job["id"])
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(job, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not save state of job {job['id']}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _discard(self, job_id):
+        if not self.state_dir:
+            return
+        try:
+            os.remove(self._state_path(job_id))
+        except OSError:
+            pass
+
+    def _load(self, job_id):
+        """Job snapshot from the shared state dir, or None if unknown or expired"""
+        if not self.state_dir or not re.fullmatch(r'[0-9a-f]{32}', job_id):
+            return None
+        try:
+            with open(self._state_path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job["status"] in ("done", "failed") and job["updated"] < time.time() - self.result_ttl:
+            return None
+        return job
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        with self._changed:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["status"] in ("done", "failed") and job["updated"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        self._sweep_state_dir(cutoff)
+
+    def _sweep_state_dir(self, cutoff):
+        # Job files of every process; at most once per minute since it lists the directory
+        if not self.state_dir or time.time() - self._last_sweep < 60:
+            return
+        self._last_sweep = time.time()
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                if name.endswith('.tmp'):
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    status = json.load(f)["status"]
+                if status in ("done", "failed"):
+                    os.remove(path)
+            except (OSError, ValueError, KeyError):
+                continue
+
+    def _ensure_workers(self):
+        # Started lazily, and again in forked children where the threads are gone
+        if self._pid == os.getpid():
+            return
+        with self._changed:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._workers = [threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                             for i in range(self.num_workers)]
+            for worker in self._workers:
+                worker.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            job_id, payload = self._queue.get()
+            self._update(job_id, status="running", stage="running")
+            started = time.monotonic()
+            try:
+                result = self.handler(payload, lambda stage: self._update(job_id, stage=stage))
+                self._update(job_id, status="done", stage="done", result=result)
+            except Exception as e:
+                self._update(job_id, status="failed", stage="failed", error=str(e))
+            # Exponential moving average of job duration for Retry-After hints
+            self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * (time.monotonic() - started)
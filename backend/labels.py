@@ -0,0 +1,74 @@
+# labels.py
+"""
+Class labels of the classifier's softmax output, their organ grouping and
+malignancy, and readable names. Kept apart from App.py so the offline
+tools can report results without importing the web service.
+"""
+from taxonomy import Taxonomy
+
+# Class labels and category grouping
+class_labels = [
+    'all_benign', 'all_early', 'all_pre', 'all_pro',
+    'brain_glioma', 'brain_menin', 'brain_notumor', 'brain_tumor',
+    'breast_benign', 'breast_malignant',
+    'cervix_dyk', 'cervix_koc', 'cervix_mep', 'cervix_pab', 'cervix_sfi',
+    'colon_aca', 'colon_bnt',
+    'kidney_normal', 'kidney_tumor',
+    'lung_aca', 'lung_bnt', 'lung_scc',
+    'lymph_cll', 'lymph_fl', 'lymph_mcl',
+    'oral_normal', 'oral_scc'
+]
+
+# Organ categories
+organ_categories = {
+    'Brain': ['brain_glioma', 'brain_menin', 'brain_notumor', 'brain_tumor'],
+    'Breast': ['breast_benign', 'breast_malignant'],
+    'Cervix': ['cervix_dyk', 'cervix_koc', 'cervix_mep', 'cervix_pab', 'cervix_sfi'],
+    'Colon': ['colon_aca', 'colon_bnt'],
+    'Kidney': ['kidney_normal', 'kidney_tumor'],
+    'Lung': ['lung_aca', 'lung_bnt', 'lung_scc'],
+    'Lymph': ['lymph_cll', 'lymph_fl', 'lymph_mcl'],
+    'Oral': ['oral_normal', 'oral_scc'],
+    'General': ['all_benign', 'all_early', 'all_pre', 'all_pro']
+}
+
+# Classes reported as benign/normal; every other class counts as malignant/abnormal
+benign_classes = ['all_benign', 'brain_notumor', 'breast_benign', 'colon_bnt',
+                  'kidney_normal', 'lung_bnt', 'oral_normal']
+
+# Normal cervical cell types: not benign above, but not drawn as malignant on the organ chart
+indeterminate_classes = ['cervix_mep', 'cervix_pab', 'cervix_sfi']
+
+# Precomputed organ index and malignancy masks over class_labels
+taxonomy = Taxonomy(class_labels, organ_categories, benign_classes, indeterminate_classes)
+
+# Readable class names
+readable_class_names = {
+    'all_benign': 'Benign (General)',
+    'all_early': 'Early Stage Cancer',
+    'all_pre': 'Pre-cancerous',
+    'all_pro': 'Progressive Cancer',
+    'brain_glioma': 'Brain Glioma',
+    'brain_menin': 'Brain Meningioma',
+    'brain_notumor': 'Brain - No Tumor',
+    'brain_tumor': 'Brain Tumor',
+    'breast_benign': 'Breast - Benign',
+    'breast_malignant': 'Breast - Malignant',
+    'cervix_dyk': 'Cervix Dyskeratosis',
+    'cervix_koc': 'Cervix Koilocytosis',
+    'cervix_mep': 'Cervix Metaplasia',
+    'cervix_pab': 'Cervix Parabasal',
+    'cervix_sfi': 'Cervix Superficial',
+    'colon_aca': 'Colon Adenocarcinoma',
+    'colon_bnt': 'Colon - Benign',
+    'kidney_normal': 'Kidney - Normal',
+    'kidney_tumor': 'Kidney Tumor',
+    'lung_aca': 'Lung Adenocarcinoma',
+    'lung_bnt': 'Lung - Benign',
+    'lung_scc': 'Lung Squamous Cell Carcinoma',
+    'lymph_cll': 'Lymphoma CLL',
+    'lymph_fl': 'Lymphoma Follicular',
+    'lymph_mcl': 'Lymphoma Mantle Cell',
+    'oral_normal': 'Oral - Normal',
+    'oral_scc': 'Oral Squamous Cell Carcinoma'
+}
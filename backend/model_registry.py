@@ -0,0 +1,290 @@
+# model_registry.py
+import json
+import os
+import random
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class ModelVersion:
+    """
+    One loaded model version and the number of requests using it.
+
+    The loader attaches whatever the service needs to serve with it (backend,
+    inference engine, ...) as keyword components, which become attributes.
+    """
+
+    def __init__(self, version, path, **components):
+        self.version = version
+        self.path = path
+        self.loaded_at = time.time()
+        for name, value in components.items():
+            setattr(self, name, value)
+        self._in_flight = 0
+        self._idle = threading.Condition()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self):
+        with self._idle:
+            self._in_flight += 1
+
+    def release(self):
+        with self._idle:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.notify_all()
+
+    def wait_drained(self, timeout=None):
+        """Block until no request uses this version (returns False on timeout)"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def describe(self):
+        return {"version": self.version, "path": self.path, "loaded_at": self.loaded_at,
+                "in_flight": self._in_flight}
+
+
+class ModelRegistry:
+    """
+    The model version serving traffic, plus an optional shadow version.
+
+    New versions are loaded and warmed up off the request path, then swapped
+    in atomically: requests that started on the old version finish on it
+    (use() counts them) and the old version is retired on its own thread
+    once they have drained, so a swap returns (and the next one may start)
+    as soon as the new version serves. A shadow version scores a sampled fraction of traffic in the
+    background; its top-1 answers are compared with the served ones and
+    disagreements are counted.
+
+    With state_path, the chosen active/shadow models are written to a JSON
+    file so restarts and sibling worker processes (see sync()) serve the same
+    versions.
+    """
+
+    def __init__(self, loader, on_retire=None, on_shadow=None, state_path=None, drain_timeout=300,
+                 shadow_history=50):
+        """
+        Args:
+            loader: Callable (path, version, role) -> ModelVersion, loading and
+                warming up a model; role is 'active' or 'shadow' and version
+                may be None (the loader then derives one)
+            on_retire: Optional callable receiving a version once it is no
+                longer used (to release its resources)
+            on_shadow: Optional callable (served version, shadow version, agreed)
+                per shadow comparison
+            state_path: Optional JSON file recording the chosen versions
+            drain_timeout: Seconds to wait for in-flight requests before
+                retiring a replaced version anyway
+            shadow_history: Number of recent disagreements kept for inspection
+        """
+        self.loader = loader
+        self.on_retire = on_retire or (lambda version: None)
+        self.on_shadow = on_shadow or (lambda served, shadow, agreed: None)
+        self.state_path = state_path
+        self.drain_timeout = drain_timeout
+
+        self._active = None
+        self._shadow = None
+        self.shadow_fraction = 0.0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loading = None
+        self._history = deque(maxlen=20)
+        self._shadow_compared = 0
+        self._shadow_disagreed = 0
+        self._disagreements = deque(maxlen=shadow_history)
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def shadow(self):
+        return self._shadow
+
+    @contextmanager
+    def use(self):
+        """Serve one request with the active version; it is not retired before the block exits"""
+        with self._lock:
+            version = self._active
+            if version is None:
+                raise RuntimeError("No model version is active")
+            version.acquire()
+        try:
+            yield version
+        finally:
+            version.release()
+
+    # ---- switching versions ----
+
+    def activate(self, version):
+        """Swap version in for all new requests; the previous one is drained and retired in the background"""
+        with self._lock:
+            previous, self._active = self._active, version
+        self._history.appendleft({"version": version.version, "path": version.path, "activated_at": time.time()})
+        print(f"Model version {version.version} ({version.path}) is now active")
+        if previous is not None and previous is not version:
+            self._retire(previous)
+
+    def set_shadow(self, version, fraction):
+        """Start shadowing traffic with version (None stops shadowing; the old shadow retires in the background)"""
+        with self._lock:
+            previous, self._shadow = self._shadow, version
+            self.shadow_fraction = fraction if version is not None else 0.0
+            self._shadow_compared = 0
+            self._shadow_disagreed = 0
+            self._disagreements.clear()
+        if previous is not None and previous is not version:
+            self._retire(previous)
+
+    def load(self, path, version=None, role='active', fraction=0.0):
+        """Load, warm up and switch to a version synchronously"""
+        loaded = self.loader(path, version, role)
+        if role == 'shadow':
+            self.set_shadow(loaded, fraction)
+        else:
+            self.activate(loaded)
+        return loaded
+
+    def load_in_background(self, path, version=None, role='active', fraction=0.0, on_done=None):
+        """
+        load() on a background thread.
+
+        Raises:
+            RuntimeError: when another load is still running
+        """
+        if not self._load_lock.acquire(blocking=False):
+            raise RuntimeError("Another model version is still loading")
+        self._loading = {"path": path, "version": version, "role": role, "state": "loading",
+                         "started": time.time(), "error": None}
+
+        def target():
+            try:
+                self.load(path, version, role, fraction)
+                self._loading["state"] = "done"
+                if on_done is not None:
+                    on_done()
+            except Exception as e:
+                traceback.print_exc()
+                self._loading["state"] = "failed"
+                self._loading["error"] = f"{type(e).__name__}: {e}"
+            finally:
+                self._loading["finished"] = time.time()
+                self._load_lock.release()
+
+        thread = threading.Thread(target=target, name='model-swap', daemon=True)
+        thread.start()
+        return thread
+
+    def _retire(self, version):
+        threading.Thread(target=self._drain_and_retire, args=(version,), name='model-retire', daemon=True).start()
+
+    def _drain_and_retire(self, version):
+        if not version.wait_drained(self.drain_timeout):
+            print(f"Model version {version.version} still has {version.in_flight} requests "
+                  f"after {self.drain_timeout}s; retiring it anyway")
+        self.on_retire(version)
+        for entry in self._history:
+            if entry["version"] == version.version and "retired_at" not in entry:
+                entry["retired_at"] = time.time()
+                break
+
+    # ---- shadow traffic ----
+
+    def sample_shadow(self):
+        """Shadow version to mirror the current request to, or None (sampled at shadow_fraction)"""
+        with self._lock:
+            shadow = self._shadow
+            if shadow is None or random.random() >= self.shadow_fraction:
+                return None
+            shadow.acquire()
+            return shadow
+
+    def record_shadow(self, served_version, shadow, served_probs, shadow_probs, key=None):
+        """Compare one served answer with the shadow version's answer (releases shadow)"""
+        try:
+            served_top = int(np.argmax(served_probs))
+            shadow_top = int(np.argmax(shadow_probs))
+            agreed = served_top == shadow_top
+            with self._lock:
+                if shadow is self._shadow:
+                    self._shadow_compared += 1
+                    if not agreed:
+                        self._shadow_disagreed += 1
+                        self._disagreements.appendleft({"time": time.time(), "key": key,
+                                                        "served": served_top, "shadow": shadow_top})
+            self.on_shadow(served_version, shadow.version, agreed)
+        finally:
+            shadow.release()
+
+    # ---- persisted choice ----
+
+    def save_state(self):
+        """Record the active and shadow versions in state_path"""
+        if not self.state_path:
+            return
+        with self._lock:
+            active, shadow, fraction = self._active, self._shadow, self.shadow_fraction
+        state = {
+            "active": {"path": active.path, "version": active.version} if active else None,
+            "shadow": {"path": shadow.path, "version": shadow.version, "fraction": fraction} if shadow else None
+        }
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def read_state(self):
+        """Saved state, or None when there is none"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def sync(self):
+        """Load whatever the state file selects that this process is not serving yet (blocking)"""
+        state = self.read_state()
+        if state is None:
+            return
+        with self._load_lock:
+            active = state.get("active")
+            if active and (self._active is None or self._active.version != active["version"]):
+                self.load(active["path"], active["version"])
+            shadow = state.get("shadow")
+            if shadow is None:
+                if self._shadow is not None:
+                    self.set_shadow(None, 0.0)
+            elif self._shadow is None or self._shadow.version != shadow["version"]:
+                self.load(shadow["path"], shadow["version"], role='shadow', fraction=shadow["fraction"])
+            else:
+                self.shadow_fraction = shadow["fraction"]
+
+    def snapshot(self):
+        """Serializable registry status"""
+        with self._lock:
+            active, shadow = self._active, self._shadow
+            shadow_status = None
+            if shadow is not None:
+                shadow_status = {
+                    **shadow.describe(),
+                    "fraction": self.shadow_fraction,
+                    "compared": self._shadow_compared,
+                    "disagreements": self._shadow_disagreed,
+                    "disagreement_rate": (self._shadow_disagreed / self._shadow_compared
+                                          if self._shadow_compared else None),
+                    "recent_disagreements": list(self._disagreements)
+                }
+            return {
+                "active": active.describe() if active else None,
+                "shadow": shadow_status,
+                "loading": dict(self._loading) if self._loading else None,
+                "history": [dict(entry) for entry in self._history]
+            }
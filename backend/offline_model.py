@@ -0,0 +1,69 @@
+# offline_model.py
+"""
+The serving model for offline tools, without the web service.
+
+Importing App starts the whole server: storage sweepers, job queues, the
+similar-case index and model hot-swapping. This module only loads the
+model App would serve (MODEL_PATH with INFERENCE_BACKEND and the runtime
+profile's device and threads) and runs batches through it.
+
+Import it before tensorflow: the runtime profile's thread/device
+environment is applied on import, and TensorFlow only reads it then.
+"""
+import os
+
+from runtime_profile import DEFAULT_PROFILE_PATH, apply_environment, load_profile
+
+runtime_profile = load_profile(os.environ.get('RUNTIME_PROFILE', DEFAULT_PROFILE_PATH))
+INFERENCE_DEVICE = os.environ.get('INFERENCE_DEVICE', runtime_profile["device"])
+apply_environment(runtime_profile, INFERENCE_DEVICE)  # before TensorFlow is imported
+
+MODEL_PATH = os.environ.get('MODEL_PATH', 'model/resnet152V2_model.keras')
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'keras')
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0)) or runtime_profile["intra_op_threads"]
+INFERENCE_INTER_OP_THREADS = (int(os.environ.get('INFERENCE_INTER_OP_THREADS', 0))
+                              or runtime_profile["inter_op_threads"])
+TFLITE_SHARED_WEIGHTS = os.environ.get('TFLITE_SHARED_WEIGHTS', '0') == '1'
+
+
+class OfflineModel:
+    """
+    One inference backend and the device it runs on.
+
+    Unlike the server there is no micro-batcher: callers already hold whole
+    batches and pass them to run_model_batch().
+    """
+
+    def __init__(self, path=MODEL_PATH, backend_name=INFERENCE_BACKEND, max_batch_size=64):
+        """
+        Args:
+            path: .keras model file (converted backends load the file next to it)
+            backend_name: One of backends.BACKEND_NAMES
+            max_batch_size: Largest batch run_model_batch() is called with
+        """
+        import tensorflow as tf
+        from backends import load_backend
+
+        if INFERENCE_THREADS:
+            tf.config.threading.set_intra_op_parallelism_threads(INFERENCE_THREADS)
+        if INFERENCE_INTER_OP_THREADS:
+            tf.config.threading.set_inter_op_parallelism_threads(INFERENCE_INTER_OP_THREADS)
+
+        self.device = '/CPU:0'
+        if INFERENCE_DEVICE == 'gpu':
+            gpus = tf.config.list_physical_devices('GPU')
+            for gpu in gpus:
+                tf.config.experimental.set_memory_growth(gpu, True)
+            if gpus:
+                self.device = '/GPU:0'
+        print(f"Inference device: {self.device}")
+
+        self._tf = tf
+        with tf.device(self.device):
+            self.backend = load_backend(backend_name, path, num_threads=INFERENCE_THREADS,
+                                        max_batch_size=max_batch_size, shared_weights=TFLITE_SHARED_WEIGHTS)
+
+    def run_model_batch(self, batch):
+        """Softmax outputs for a stacked uint8 batch of preprocessed images"""
+        with self._tf.device(self.device):
+            return self.backend.predict(batch)
@@ -0,0 +1,231 @@
+# prediction_cache.py
+import copy
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of full prediction results.
+
+    Results are keyed by the SHA-256 of the uploaded bytes and held in a
+    bounded in-memory LRU. An optional on-disk tier (one JSON file per entry,
+    capped in total size) sits behind it and survives restarts. Every entry
+    belongs to the model version that produced it and is only returned for
+    that version, so several versions can be served side by side (during a
+    hot-swap); entries of versions no longer served simply age out of both
+    tiers.
+
+    Several processes (serve.py workers) may share disk_dir: entries written
+    by one are found by the others. Each process accounts only for the
+    entries it has written or read, so disk_max_bytes caps the disk tier per
+    process and the directory can grow to about workers x disk_max_bytes.
+    """
+
+    def __init__(self, max_entries=1024, disk_dir=None, disk_max_bytes=512 * 1024 * 1024):
+        """
+        Args:
+            max_entries: Capacity of the in-memory LRU tier
+            disk_dir: Directory of the on-disk tier (None disables it)
+            disk_max_bytes: Size cap of the on-disk tier
+        """
+        self.max_entries = max(0, int(max_entries))
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = int(disk_max_bytes)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()      # (version, key) -> result
+        self._disk_index = OrderedDict()  # (version, key) -> size in bytes, oldest first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        if self.disk_dir:
+            self._load_disk_index()
+
+    @staticmethod
+    def key_for(data):
+        """Content hash used as the cache key for an upload"""
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key, model_version='default'):
+        """
+        Look up a cached result.
+
+        Args:
+            key: Content hash of the upload (key_for())
+            model_version: Version of the model the result must come from
+
+        Returns:
+            A copy of the cached result dict, or None on a miss
+        """
+        key = (str(model_version), key)
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(result)
+
+        # Disk reads happen outside the lock
+        result = self._disk_get(key)
+        with self._lock:
+            if result is not None:
+                self._memory_put(key, result)
+                self.hits += 1
+                self.disk_hits += 1
+                return copy.deepcopy(result)
+
+            self.misses += 1
+            return None
+
+    def put(self, key, result, model_version='default'):
+        """Store a result produced by model_version in both tiers (disk write failures are only logged)"""
+        key = (str(model_version), key)
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._memory_put(key, result)
+        self._disk_put(key, result)
+
+    def invalidate(self, model_version=None):
+        """
+        Drop cached results.
+
+        Args:
+            model_version: Only drop the entries of this version (None clears
+                the whole cache)
+        """
+        with self._lock:
+            version = str(model_version) if model_version is not None else None
+            for key in [key for key in self._memory if version is None or key[0] == version]:
+                del self._memory[key]
+            for key in [key for key in self._disk_index if version is None or key[0] == version]:
+                self._disk_bytes -= self._disk_index.pop(key)
+            if self.disk_dir:
+                if version is None:
+                    for name in os.listdir(self.disk_dir) if os.path.isdir(self.disk_dir) else []:
+                        shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+                else:
+                    shutil.rmtree(os.path.join(self.disk_dir, version), ignore_errors=True)
+
+    def stats(self):
+        """Counters and sizes for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_versions": sorted({version for version, _ in self._memory} |
+                                         {version for version, _ in self._disk_index}),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_capacity": self.max_entries,
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+                "disk_capacity_bytes": self.disk_max_bytes if self.disk_dir else 0,
+            }
+
+    # ---- in-memory tier ----
+
+    def _memory_put(self, key, result):
+        if self.max_entries == 0:
+            return
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # ---- on-disk tier ----
+
+    def _disk_path(self, key):
+        version, digest = key
+        return os.path.join(self.disk_dir, version, digest[:2], f"{digest}.json")
+
+    def _load_disk_index(self):
+        # Layout: disk_dir/<model version>/<first two hex digits>/<key>.json
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            version = os.path.relpath(root, self.disk_dir).split(os.sep)[0]
+            for name in files:
+                if name.endswith('.json') and version != '.':
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, (version, name[:-5]), stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                result = json.load(f)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._disk_bytes -= self._disk_index.pop(key, 0)
+            return None
+        except (OSError, ValueError):
+            self._disk_forget(key)
+            return None
+        # Entries written by another process join this process's index once read
+        with self._lock:
+            self._disk_bytes += size - self._disk_index.pop(key, 0)
+            self._disk_index[key] = size
+        return result
+
+    def _disk_put(self, key, result):
+        if not self.disk_dir:
+            return
+        payload = json.dumps(result).encode('utf-8')
+        if len(payload) > self.disk_max_bytes:
+            return
+
+        # Unique temp name: other threads and processes may write the same key concurrently
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write prediction cache entry {key[1]}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+            self._disk_index[key] = len(payload)
+            self._disk_bytes += len(payload)
+
+            evicted = []
+            while self._disk_bytes > self.disk_max_bytes and self._disk_index:
+                oldest, size = self._disk_index.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(oldest)
+        for oldest in evicted:
+            self._remove_file(oldest)
+
+    def _disk_forget(self, key):
+        with self._lock:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+        self._remove_file(key)
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
@@ -0,0 +1,98 @@
+# runtime_profile.py
+import json
+import os
+
+DEFAULT_PROFILE_PATH = 'runtime_profile.json'
+AFFINITY_MODES = ('none', 'compact')
+
+# None leaves the setting to TensorFlow / the launcher
+PROFILE_DEFAULTS = {
+    "device": "cpu",            # 'cpu' never initialises CUDA; 'gpu' enables the GPU setup
+    "intra_op_threads": None,   # threads per op (per worker under serve.py)
+    "inter_op_threads": None,   # ops run concurrently
+    "onednn": None,             # oneDNN (MKL) kernels on/off
+    "affinity": "none",         # 'compact' pins each serve.py worker to its own block of cores
+    "batch_size": None,         # preferred micro-batch size (MAX_BATCH_SIZE)
+}
+
+
+def load_profile(path=DEFAULT_PROFILE_PATH):
+    """
+    Runtime profile saved by autotune.py, over PROFILE_DEFAULTS.
+
+    A missing file gives the defaults; unknown keys are ignored.
+    """
+    profile = dict(PROFILE_DEFAULTS)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+        profile.update({key: value for key, value in saved.get("profile", {}).items() if key in PROFILE_DEFAULTS})
+        print(f"Loaded runtime profile {path}: {profile}")
+    if profile["affinity"] not in AFFINITY_MODES:
+        raise ValueError(f"Unknown affinity mode: {profile['affinity']} (expected one of {', '.join(AFFINITY_MODES)})")
+    return profile
+
+
+def save_profile(path, profile, tuning=None):
+    """Write a profile (and optionally the measurements behind it) atomically"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"profile": {key: profile.get(key) for key in PROFILE_DEFAULTS}, "tuning": tuning}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def apply_environment(profile, device=None):
+    """
+    Export the settings TensorFlow only reads at import time.
+
+    Must run before tensorflow is imported. Variables already set in the
+    environment win over the profile.
+
+    Args:
+        profile: Runtime profile (load_profile())
+        device: Effective inference device when it overrides the profile's
+            (e.g. from INFERENCE_DEVICE); CUDA is only hidden for 'cpu'
+    """
+    if (device or profile["device"]) == 'cpu':
+        os.environ.setdefault('CUDA_VISIBLE_DEVICES', '-1')
+    if profile["onednn"] is not None:
+        os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '1' if profile["onednn"] else '0')
+    if profile["intra_op_threads"]:
+        os.environ.setdefault('OMP_NUM_THREADS', str(profile["intra_op_threads"]))
+        os.environ.setdefault('TF_NUM_INTRAOP_THREADS', str(profile["intra_op_threads"]))
+    if profile["inter_op_threads"]:
+        os.environ.setdefault('TF_NUM_INTEROP_THREADS', str(profile["inter_op_threads"]))
+
+
+def available_cpus():
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_cpus(index, workers, cpus=None):
+    """
+    Block of cores for worker index out of workers under 'compact' affinity.
+
+    Cores are split into equal contiguous blocks (so a worker's threads share
+    caches); with more workers than cores, blocks wrap around.
+    """
+    cpus = cpus if cpus is not None else available_cpus()
+    per_worker = max(1, len(cpus) // max(1, workers))
+    start = (index * per_worker) % len(cpus)
+    return cpus[start:start + per_worker]
+
+
+def pin_worker(index, workers, affinity, cpus=None):
+    """
+    Apply an affinity mode to the current process.
+
+    Returns:
+        The CPUs the process was pinned to, or None when left unpinned
+    """
+    if affinity != 'compact' or not hasattr(os, 'sched_setaffinity'):
+        return None
+    pinned = worker_cpus(index, workers, cpus)
+    os.sched_setaffinity(0, pinned)
+    return pinned
@@ -0,0 +1,157 @@
+# score_bulk.py
+"""
+Offline bulk scoring of image directories.
+
+Loads the model the server would serve (offline_model.py, without starting
+the server), reports with its labels and malignancy logic (labels.py) and
+feeds the model from a parallel tf.data pipeline (parallel decode/resize, batching and
+prefetch). Results are appended to a CSV file after every batch; rerunning
+the same command skips images that are already in the output, so an
+interrupted run resumes where it stopped.
+
+Usage (from the backend directory):
+    python score_bulk.py /data/slides -o scores.csv --batch-size 64
+"""
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+# offline_model applies the runtime profile's thread/device environment, which
+# TensorFlow only reads at import time, so it has to be imported first
+from offline_model import OfflineModel
+from ingest import decode_image_bytes
+from labels import class_labels, readable_class_names, taxonomy
+import tensorflow as tf
+
+TARGET_SIZE = (224, 224)
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tiff'}
+
+
+def find_images(input_dir):
+    """Sorted list of all images with an allowed extension below input_dir"""
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.rsplit('.', 1)[-1].lower() in ALLOWED_EXTENSIONS:
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def read_checkpoint(output_path):
+    """
+    Return the set of already scored paths in an existing output file.
+
+    A trailing partial line left by an interrupted write is truncated away.
+    """
+    if not os.path.exists(output_path):
+        return set()
+
+    with open(output_path, 'rb+') as f:
+        content = f.read()
+        if content and not content.endswith(b'\n'):
+            f.truncate(content.rfind(b'\n') + 1)
+
+    with open(output_path, 'r', newline='') as f:
+        return {row['path'] for row in csv.DictReader(f)}
+
+
+def build_dataset(paths, batch_size):
+    """
+    Parallel decode/resize pipeline yielding (paths, images, ok) batches.
+
+    Images that fail to decode come back as blank frames with ok=False so
+    that one corrupt file does not abort the run.
+    """
+    def decode(data):
+        try:
+            return decode_image_bytes(data, TARGET_SIZE), True
+        except Exception:
+            return np.zeros(TARGET_SIZE[::-1] + (3,), dtype=np.uint8), False
+
+    def load(path):
+        image, ok = tf.numpy_function(decode, [tf.io.read_file(path)], [tf.uint8, tf.bool])
+        image.set_shape(TARGET_SIZE[::-1] + (3,))
+        ok.set_shape(())
+        return path, image, ok
+
+    # Batches stay uint8; the serving graph normalizes them
+    dataset = tf.data.Dataset.from_tensor_slices(paths)
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    dataset = dataset.batch(batch_size)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def result_rows(batch_paths, predictions, ok):
+    """Convert one batch of softmax vectors into CSV rows"""
+    summary = taxonomy.summarize(predictions)
+    top_indices = summary['top_index']
+
+    rows = []
+    for i, path in enumerate(batch_paths):
+        path = path.decode('utf-8')
+        if not ok[i]:
+            rows.append({'path': path, 'error': 'decode failed'})
+            continue
+        top_class = class_labels[top_indices[i]]
+        row = {
+            'path': path,
+            'error': '',
+            'class': top_class,
+            'confidence': float(predictions[i, top_indices[i]]),
+            'readable_name': readable_class_names.get(top_class, top_class),
+            'organ': taxonomy.organs[summary['top_organ'][i]],
+            'is_malignant': bool(summary['top_is_malignant'][i]),
+            'benign_probability': float(summary['benign'][i]),
+            'malignant_probability': float(summary['malignant'][i]),
+        }
+        row.update({label: float(p) for label, p in zip(class_labels, predictions[i])})
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a directory of images with the cancer classifier')
+    parser.add_argument('input_dir', help='Directory searched recursively for png/jpg/jpeg/tiff images')
+    parser.add_argument('-o', '--output', default='scores.csv', help='Output CSV (appended to when resuming)')
+    parser.add_argument('--batch-size', type=int, default=64, help='Images per forward pass')
+    args = parser.parse_args()
+
+    fieldnames = ['path', 'error', 'class', 'confidence', 'readable_name', 'organ', 'is_malignant',
+                  'benign_probability', 'malignant_probability'] + list(class_labels)
+
+    all_paths = find_images(args.input_dir)
+    done = read_checkpoint(args.output)
+    todo = [p for p in all_paths if p not in done]
+    print(f"Found {len(all_paths)} images, {len(done)} already scored, {len(todo)} to go")
+    if not todo:
+        return
+
+    model = OfflineModel(max_batch_size=args.batch_size)
+
+    write_header = not os.path.exists(args.output) or os.path.getsize(args.output) == 0
+    scored = 0
+    start = time.perf_counter()
+
+    with open(args.output, 'a', newline='') as out:
+        writer = csv.DictWriter(out, fieldnames=fieldnames)
+        if write_header:
+            writer.writeheader()
+
+        for batch_paths, images, ok in build_dataset(todo, args.batch_size):
+            predictions = model.run_model_batch(images.numpy())
+            writer.writerows(result_rows(batch_paths.numpy(), predictions, ok.numpy()))
+
+            # Every flushed batch is a checkpoint
+            out.flush()
+            os.fsync(out.fileno())
+
+            scored += len(predictions)
+            elapsed = time.perf_counter() - start
+            print(f"Scored {scored}/{len(todo)} images ({scored / elapsed:.1f} img/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+# serve.py
+"""
+Production launcher: a supervised pre-forking server for App.py.
+
+The master binds the listening socket and forks N workers that accept on it.
+Each worker gets its own intra-op thread budget (cores / workers by
+default), imports App.py and serves requests with a threaded WSGI server so
+that its micro-batcher sees concurrent requests. Workers that die are
+restarted (in the same slot, so they keep their CPU block). Workers accept connections as soon as App.py is imported and load
+the model in the background; until it is warmed up, /api/health/ready answers
+503 and prediction routes ask clients to retry.
+
+Memory: TensorFlow's runtime is not fork-safe once it has run, so the model
+cannot be loaded in the master and inherited. With the Keras backend (the
+default) every worker loads its own float32 copy of ResNet152V2 (about 240
+MB) on top of the TensorFlow runtime and the activations of a MAX_BATCH_SIZE
+batch; budget roughly 1-1.5 GB per worker and check
+process_resident_memory_bytes on /api/metrics after warm-up before raising
+--workers. The TFLite backends map the converted file, but XNNPACK copies
+the weights into private packed buffers (one copy per batch-size
+interpreter), so by default they are not shared either. --shared-weights
+(tflite-int8 only) runs the interpreters without XNNPACK: the built-in
+kernels read the int8 weights in place from the mapped file, whose pages the
+OS page cache holds once for all workers. Measured with two workers on a
+ResNet152V2-sized int8 file (MAX_BATCH_SIZE 8, two threads each), private
+memory per worker drops from about 1350 MB to about 400 MB, while a single
+/api/predict takes about 420 ms instead of 60 ms. Use it when memory, not
+CPU, limits the number of workers.
+
+Asynchronous jobs (/api/jobs) run in the worker that accepted them, but
+their state is written to a directory shared by all workers (JOB_STATE_DIR,
+a temporary directory of the master by default), so a poll or event stream
+reconnect can land on any worker.
+
+Model hot-swaps (POST /api/models/activate) are handled by one worker, which
+records the new version in MODEL_STATE_FILE and sends SIGHUP to the master;
+the master forwards it to every worker so that all of them load the same
+version.
+
+Known limitation: each worker serves HTTP with Werkzeug's threaded
+development server (make_server). It is adequate behind a reverse proxy
+that buffers requests and bounds connections (nginx), but it has no
+request timeouts, keep-alive limits or slow-client protection of its own;
+do not expose the workers directly to untrusted clients.
+
+Thread counts, per-worker CPU affinity and the batch size default to the
+runtime profile written by autotune.py (RUNTIME_PROFILE); flags override it.
+
+Usage (from the backend directory):
+    python convert_model.py convert --format tflite-int8
+    python autotune.py --workers 4 --backend tflite-int8
+    python serve.py --workers 4 --backend tflite-int8 --port 5000
+    python serve.py --workers 8 --backend tflite-int8 --shared-weights
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from runtime_profile import AFFINITY_MODES, DEFAULT_PROFILE_PATH, available_cpus, load_profile, pin_worker
+
+# Workers that exit sooner than this after starting are considered crash-looping
+MIN_WORKER_UPTIME = 5.0
+RESTART_BACKOFF = 5.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the cancer classification API with N worker processes')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=2, help='Number of worker processes')
+    parser.add_argument('--threads-per-worker', type=int, default=0,
+                        help='Intra-op threads per worker (default: runtime profile, else cores / workers)')
+    parser.add_argument('--affinity', choices=AFFINITY_MODES,
+                        help="'compact' pins each worker to its own block of cores (default: runtime profile)")
+    parser.add_argument('--backend', default=os.environ.get('INFERENCE_BACKEND', 'keras'),
+                        help='Inference backend (keras, tflite-fp16, tflite-int8, onnx)')
+    parser.add_argument('--backlog', type=int, default=128, help='Listen backlog of the shared socket')
+    parser.add_argument('--shared-weights', action='store_true',
+                        help='tflite-int8: read weights in place so all workers share one copy '
+                             '(much less memory per worker, much slower inference)')
+    parser.add_argument('--eager-load', action='store_true',
+                        help='Load the model before serving instead of in the background '
+                             '(readiness is reported at /api/health/ready either way)')
+    return parser.parse_args()
+
+
+def watch_master(master_pid):
+    """Exit the worker if the master disappears (e.g. it was SIGKILLed)"""
+    while os.getppid() == master_pid:
+        time.sleep(1.0)
+    os._exit(0)
+
+
+def run_worker(listen_fd, host, port, threads, master_pid, index, workers, affinity):
+    """Worker process body: pin CPUs, configure threads, load the app and serve forever"""
+    threading.Thread(target=watch_master, args=(master_pid,), name='master-watch', daemon=True).start()
+
+    pinned = pin_worker(index, workers, affinity)
+    if pinned is not None:
+        print(f"[worker {os.getpid()}] pinned to CPUs {pinned}")
+
+    os.environ['INFERENCE_THREADS'] = str(threads)
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['SERVE_MASTER_PID'] = str(master_pid)
+
+    # Default signal handling in the worker: SIGTERM ends it immediately
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)  # App.py installs its model-sync handler on import
+
+    # Werkzeug's development server; see "Known limitation" in the module docstring
+    from werkzeug.serving import make_server
+    import App
+
+    server = make_server(host, port, App.app, threaded=True, fd=listen_fd)
+    print(f"[worker {os.getpid()}] serving on {host}:{port} with {threads} intra-op threads")
+    server.serve_forever()
+
+
+def main():
+    args = parse_args()
+    if args.shared_weights and args.backend != 'tflite-int8':
+        sys.exit("--shared-weights needs --backend tflite-int8")
+    os.environ['INFERENCE_BACKEND'] = args.backend
+    if args.shared_weights:
+        os.environ['TFLITE_SHARED_WEIGHTS'] = '1'
+    os.environ['MODEL_LOADING'] = 'eager' if args.eager_load else 'background'
+    profile = load_profile(os.environ.get('RUNTIME_PROFILE', DEFAULT_PROFILE_PATH))
+    threads = (args.threads_per_worker or profile["intra_op_threads"]
+               or max(1, len(available_cpus()) // args.workers))
+    affinity = args.affinity or profile["affinity"]
+
+    # Job state must be visible to every worker; removed on exit unless chosen by the operator
+    job_state_dir = None
+    if not os.environ.get('JOB_STATE_DIR'):
+        job_state_dir = tempfile.mkdtemp(prefix='serve-jobs-')
+        os.environ['JOB_STATE_DIR'] = job_state_dir
+
+    if args.shared_weights:
+        print("[master] tflite-int8 weights are read in place and shared by all workers")
+    else:
+        print(f"[master] {args.backend} backend: each worker holds its own copy of the model weights")
+
+    listener = socket.create_server((args.host, args.port), backlog=args.backlog, reuse_port=False)
+    listener.set_inheritable(True)
+
+    master_pid = os.getpid()
+    workers = {}  # pid -> (start time, slot index)
+    shutting_down = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(listener.fileno(), args.host, args.port, threads, master_pid,
+                           index, args.workers, affinity)
+            finally:
+                os._exit(1)
+        workers[pid] = (time.monotonic(), index)
+
+    def shutdown(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def broadcast_model_change(signum, frame):
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGHUP, broadcast_model_change)
+
+    print(f"[master {os.getpid()}] starting {args.workers} workers on {args.host}:{args.port} "
+          f"({threads} intra-op threads each, affinity {affinity})")
+    for index in range(args.workers):
+        spawn(index)
+
+    # Supervise: restart workers that exit until asked to shut down
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = workers.pop(pid, None)
+        if slot is None or shutting_down:
+            continue
+        started, index = slot
+
+        print(f"[master] worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+        if time.monotonic() - started < MIN_WORKER_UPTIME:
+            time.sleep(RESTART_BACKOFF)
+        if not shutting_down:
+            spawn(index)
+
+    listener.close()
+    if job_state_dir is not None:
+        shutil.rmtree(job_state_dir, ignore_errors=True)
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
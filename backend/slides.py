@@ -0,0 +1,280 @@
+# slides.py
+import math
+
+import cv2
+import numpy as np
+
+# Levels at most this large (longest side, pixels) are read whole for the tissue mask
+MASK_LEVEL_MAX_SIDE = 4096
+# Decoded strips kept between reads of a stripped TIFF, see SlideReader
+STRIP_CACHE_BYTES = 512 * 1024 * 1024
+
+
+def tissue_fraction(pixels, min_saturation=20, max_brightness=220):
+    """
+    Share of pixels that look like stained tissue rather than glass.
+
+    Background on H&E slides is bright and grey; tissue is coloured. A pixel
+    counts as tissue when its channel spread (a cheap saturation) is at
+    least min_saturation and it is not brighter than max_brightness.
+
+    Args:
+        pixels: uint8 RGB array (..., 3)
+
+    Returns:
+        Float array of per-pixel 0/1 tissue flags (channel axis removed)
+    """
+    pixels = np.asarray(pixels)
+    saturation = pixels.max(axis=-1).astype(np.int16) - pixels.min(axis=-1)
+    brightness = pixels.mean(axis=-1)
+    return ((saturation >= min_saturation) & (brightness <= max_brightness)).astype(np.float32)
+
+
+class SlideReader:
+    """
+    Lazy region reader for (pyramidal) TIFF slides.
+
+    Only the strips or tiles of the TIFF that intersect a requested region
+    are read and decoded, so memory use is bounded by the region size, not
+    the slide size. Uncompressed, contiguous images are memory-mapped
+    instead. Requires the optional tifffile package.
+
+    A strip spans the full image width, so consecutive regions of the same
+    rows (the blocks of one block row, read left to right) need the same
+    strips. The decoded strips of the last region are kept, up to
+    strip_cache_bytes, and reused by the next read instead of being
+    decoded again for every block column.
+    """
+
+    def __init__(self, path, strip_cache_bytes=STRIP_CACHE_BYTES):
+        try:
+            import tifffile
+        except ImportError as e:
+            raise RuntimeError("Tiled slide inference requires the optional tifffile package") from e
+
+        self.path = path
+        self.strip_cache_bytes = strip_cache_bytes
+        self._strips = {}  # (level, strip index) -> decoded strip (or None), for the last region read
+        self._tif = tifffile.TiffFile(path)
+        try:
+            series = self._tif.series[0]
+            self.levels = [level.keyframe for level in series.levels]
+            for page in self.levels:
+                if page.planarconfig == 2 and page.samplesperpixel > 1:
+                    raise ValueError("TIFFs with separate colour planes are not supported")
+            base = self.levels[0]
+            self.width, self.height = base.imagewidth, base.imagelength
+
+            self._memmap = None
+            if base.is_memmappable and isinstance(base.index, int):
+                self._memmap = tifffile.memmap(path, page=base.index, mode='r')
+        except Exception:
+            self._tif.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._memmap = None
+        self._strips = {}
+        self._tif.close()
+
+    def level_size(self, level):
+        """(width, height) of a pyramid level"""
+        page = self.levels[level]
+        return page.imagewidth, page.imagelength
+
+    def mask_level(self):
+        """Smallest pyramid level below full resolution that is small enough to read whole, or None"""
+        for level in range(len(self.levels) - 1, 0, -1):
+            if max(self.level_size(level)) <= MASK_LEVEL_MAX_SIDE:
+                return level
+        return None
+
+    def read_region(self, x, y, width, height, level=0):
+        """
+        RGB pixels of a region of one level.
+
+        Parts of the region outside the image are white (background).
+
+        Returns:
+            uint8 array (height, width, 3)
+        """
+        page = self.levels[level]
+        region = np.full((height, width, 3), 255, dtype=np.uint8)
+        x1, y1 = min(x + width, page.imagewidth), min(y + height, page.imagelength)
+        if x1 <= x or y1 <= y:
+            return region
+
+        if level == 0 and self._memmap is not None:
+            region[:y1 - y, :x1 - x] = self._to_rgb(self._memmap[y:y1, x:x1])
+            return region
+
+        if page.is_tiled:
+            tile_h, tile_w = page.tilelength, page.tilewidth
+            across = math.ceil(page.imagewidth / tile_w)
+            for row in range(y // tile_h, (y1 - 1) // tile_h + 1):
+                for col in range(x // tile_w, (x1 - 1) // tile_w + 1):
+                    segment = self._decode(page, row * across + col)
+                    self._paste(segment, col * tile_w, row * tile_h, region, x, y, x1, y1)
+        else:
+            rows_per_strip = min(page.rowsperstrip or page.imagelength, page.imagelength)
+            strips = range(y // rows_per_strip, (y1 - 1) // rows_per_strip + 1)
+            # Drop strips this region does not touch before decoding new ones
+            self._strips = {key: segment for key, segment in self._strips.items()
+                            if key[0] == level and key[1] in strips}
+            cached_bytes = sum(segment.nbytes for segment in self._strips.values() if segment is not None)
+            for strip in strips:
+                if (level, strip) in self._strips:
+                    segment = self._strips[level, strip]
+                else:
+                    segment = self._decode(page, strip)
+                    size = segment.nbytes if segment is not None else 0
+                    if cached_bytes + size <= self.strip_cache_bytes:
+                        self._strips[level, strip] = segment
+                        cached_bytes += size
+                self._paste(segment, 0, strip * rows_per_strip, region, x, y, x1, y1)
+        return region
+
+    def _paste(self, segment, seg_x, seg_y, region, x, y, x1, y1):
+        """Copy the overlap of one decoded strip/tile with the region"""
+        if segment is None:
+            return
+        seg_h, seg_w = segment.shape[:2]
+        ox0, oy0 = max(x, seg_x), max(y, seg_y)
+        ox1, oy1 = min(x1, seg_x + seg_w), min(y1, seg_y + seg_h)
+        if ox1 <= ox0 or oy1 <= oy0:
+            return
+        region[oy0 - y:oy1 - y, ox0 - x:ox1 - x] = self._to_rgb(segment[oy0 - seg_y:oy1 - seg_y,
+                                                                        ox0 - seg_x:ox1 - seg_x])
+
+    def _decode(self, page, index):
+        offset, bytecount = page.dataoffsets[index], page.databytecounts[index]
+        if not bytecount:
+            return None
+        filehandle = self._tif.filehandle
+        with filehandle.lock:
+            filehandle.seek(offset)
+            data = filehandle.read(bytecount)
+        segment, _, _ = page.decode(data, index, jpegtables=page.jpegtables)
+        if segment is None:
+            return None
+        return segment.reshape(segment.shape[-3:])  # (length, width, samples)
+
+    @staticmethod
+    def _to_rgb(pixels):
+        if pixels.ndim == 2:
+            pixels = pixels[..., np.newaxis]
+        if pixels.dtype == np.uint16:
+            pixels = (pixels >> 8).astype(np.uint8)
+        elif pixels.dtype != np.uint8:
+            pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+        if pixels.shape[-1] == 1:
+            return np.repeat(pixels, 3, axis=-1)
+        return pixels[..., :3]
+
+
+def predict_slide(reader, predict_batch, tile_size=224, target_size=(224, 224), batch_size=32,
+                  min_tissue=0.25, block_tiles=8, report=None):
+    """
+    Slide-level prediction from the tissue tiles of a slide.
+
+    The slide is cut into a grid of tile_size x tile_size tiles at full
+    resolution. Tiles whose tissue fraction (from a low-resolution pyramid
+    level when there is one, otherwise from the tile itself) is below
+    min_tissue are skipped. The rest are resized to target_size and scored
+    in batches; the slide prediction is the mean of the tile softmax rows.
+
+    The slide is read one block of block_tiles x block_tiles tiles at a time,
+    row-major, so peak memory is one block plus one batch (plus, for stripped
+    TIFFs, the reader's cached strips of one block row), whatever the slide
+    size.
+
+    Args:
+        reader: SlideReader
+        predict_batch: Callable (N, height, width, 3) uint8 tiles -> (N, num_classes) softmax
+        report: Optional callable receiving progress strings
+
+    Returns:
+        Dict with 'probabilities' (mean softmax row, or None when no tissue
+        was found), 'tiles' counts and the per-tile 'class_index' (-1 for
+        skipped tiles) and 'confidence' grids
+    """
+    report = report or (lambda stage: None)
+    rows, cols = math.ceil(reader.height / tile_size), math.ceil(reader.width / tile_size)
+
+    # Cheap tissue mask at tile resolution from a small pyramid level
+    tissue = None
+    level = reader.mask_level()
+    if level is not None:
+        report('tissue_mask')
+        level_w, level_h = reader.level_size(level)
+        thumbnail = reader.read_region(0, 0, level_w, level_h, level=level)
+        # Pad the thumbnail to whole tiles so the grid lines up with the base level
+        padded_w = round(cols * tile_size * level_w / reader.width)
+        padded_h = round(rows * tile_size * level_h / reader.height)
+        mask = np.zeros((max(padded_h, level_h), max(padded_w, level_w)), dtype=np.float32)
+        mask[:level_h, :level_w] = tissue_fraction(thumbnail)
+        tissue = cv2.resize(mask[:padded_h, :padded_w], (cols, rows), interpolation=cv2.INTER_AREA)
+
+    class_index = np.full((rows, cols), -1, dtype=np.int16)
+    confidence = np.zeros((rows, cols), dtype=np.float32)
+    probability_sum = None
+    scored = 0
+
+    batch, positions = [], []
+
+    def flush():
+        nonlocal probability_sum, scored
+        probs = np.asarray(predict_batch(np.stack(batch)), dtype=np.float64)
+        for (row, col), row_probs in zip(positions, probs):
+            class_index[row, col] = row_probs.argmax()
+            confidence[row, col] = row_probs.max()
+        probability_sum = probs.sum(axis=0) + (0 if probability_sum is None else probability_sum)
+        scored += len(batch)
+        batch.clear()
+        positions.clear()
+        report(f'tiles {scored}/{candidates}')
+
+    candidates = int((tissue >= min_tissue).sum()) if tissue is not None else rows * cols
+    for block_row in range(0, rows, block_tiles):
+        for block_col in range(0, cols, block_tiles):
+            block_rows = min(block_tiles, rows - block_row)
+            block_cols = min(block_tiles, cols - block_col)
+            if tissue is not None and not (tissue[block_row:block_row + block_rows,
+                                                  block_col:block_col + block_cols] >= min_tissue).any():
+                continue
+
+            block = reader.read_region(block_col * tile_size, block_row * tile_size,
+                                       block_cols * tile_size, block_rows * tile_size)
+            for r in range(block_rows):
+                for c in range(block_cols):
+                    row, col = block_row + r, block_col + c
+                    if tissue is not None and tissue[row, col] < min_tissue:
+                        continue
+                    tile = block[r * tile_size:(r + 1) * tile_size, c * tile_size:(c + 1) * tile_size]
+                    # Per-tile check on a strided sample (also catches mask-level misses)
+                    if tissue_fraction(tile[::4, ::4]).mean() < min_tissue:
+                        continue
+                    if tile.shape[:2] != (target_size[1], target_size[0]):
+                        interpolation = cv2.INTER_AREA if tile_size >= max(target_size) else cv2.INTER_LINEAR
+                        tile = cv2.resize(tile, tuple(target_size), interpolation=interpolation)
+                    batch.append(tile)
+                    positions.append((row, col))
+                    if len(batch) >= batch_size:
+                        flush()
+            del block
+    if batch:
+        flush()
+
+    return {
+        "probabilities": probability_sum / scored if scored else None,
+        "tiles": {"total": rows * cols, "tissue": scored, "skipped": rows * cols - scored},
+        "grid": {"rows": rows, "cols": cols, "tile_size": tile_size},
+        "class_index": class_index,
+        "confidence": confidence
+    }
@@ -0,0 +1,98 @@
+# startup.py
+import threading
+import time
+import traceback
+
+
+class StartupTracker:
+    """
+    Progress of model loading, as reported by the readiness probe.
+
+    Loading is a fixed sequence of named steps; the tracker records which
+    step is running, how long finished steps took and whether loading
+    failed. Snapshots are safe to take from request threads while the
+    loader runs in the background.
+    """
+
+    def __init__(self, steps):
+        """
+        Args:
+            steps: Names of the loading steps, in order
+        """
+        self.steps = list(steps)
+        self.started = time.time()
+        self.finished = None
+        self.current = None
+        self.durations = {}
+        self.error = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def wait(self, timeout=None):
+        """Block until loading finished successfully (returns False on timeout)"""
+        return self._ready.wait(timeout)
+
+    def run(self, step_fns):
+        """
+        Run (name, fn) steps in order, recording progress.
+
+        Raises:
+            Whatever a step raises, after recording it as the load error
+        """
+        try:
+            for name, fn in step_fns:
+                with self._lock:
+                    self.current = name
+                started = time.perf_counter()
+                fn()
+                with self._lock:
+                    self.durations[name] = time.perf_counter() - started
+            with self._lock:
+                self.current = None
+                self.finished = time.time()
+            self._ready.set()
+        except Exception as e:
+            with self._lock:
+                self.error = f"{type(e).__name__}: {e}"
+                self.finished = time.time()
+            raise
+
+    def run_in_background(self, step_fns):
+        """run() on a daemon thread; failures are printed and kept in error"""
+        def target():
+            try:
+                self.run(step_fns)
+            except Exception:
+                traceback.print_exc()
+
+        thread = threading.Thread(target=target, name='model-loader', daemon=True)
+        thread.start()
+        return thread
+
+    def snapshot(self):
+        """Serializable load status"""
+        with self._lock:
+            if self.error is not None:
+                state = 'failed'
+            elif self._ready.is_set():
+                state = 'ready'
+            else:
+                state = 'loading'
+            return {
+                "state": state,
+                "step": self.current,
+                "completed_steps": len(self.durations),
+                "total_steps": len(self.steps),
+                "progress": len(self.durations) / len(self.steps) if self.steps else 1.0,
+                "step_seconds": dict(self.durations),
+                "elapsed_seconds": (self.finished or time.time()) - self.started,
+                "error": self.error
+            }
@@ -0,0 +1,250 @@
+# storage.py
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+_SAFE_NAME_RE = re.compile(r'[A-Za-z0-9][A-Za-z0-9._-]*')
+
+# Sweeps evict down to this fraction of max_bytes so writes don't trigger one sweep each
+_LOW_WATERMARK = 0.9
+
+
+class StorageManager:
+    """
+    Bounded, sharded file store for uploads and generated charts.
+
+    Files live in subdirectories derived from the first characters of their
+    name (root/ab/cd/abcd...), keeping directories small. A background sweep
+    removes files older than the TTL and, when the store is over its size
+    cap, evicts the oldest files first. With the 'lru' policy reads refresh
+    a file's mtime, so eviction follows last access; with 'fifo' it follows
+    creation time. All state is kept in the filesystem, so several worker
+    processes can share one store.
+    """
+
+    def __init__(self, root, max_bytes=None, ttl=None, policy='lru', shard_depth=2,
+                 sweep_interval=60.0, max_pending_writes=64):
+        """
+        Args:
+            root: Directory of the store
+            max_bytes: Total size cap (None for unbounded)
+            ttl: Seconds after the last access (lru) or creation (fifo) a
+                file is kept (None keeps files until evicted for size)
+            policy: 'lru' or 'fifo'
+            shard_depth: Number of two-character directory levels
+            sweep_interval: Seconds between background sweeps
+            max_pending_writes: put_async() calls that may wait for the
+                writer threads before callers block
+        """
+        if policy not in ('lru', 'fifo'):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.policy = policy
+        self.shard_depth = shard_depth
+        self.sweep_interval = sweep_interval
+
+        self.files = 0
+        self.bytes = 0
+        self.writes = 0
+        self.dedup_hits = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.last_sweep = None
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._sweeper = None
+        self._pid = None
+        self._writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='storage-writer')
+        self._pending_writes = threading.BoundedSemaphore(max_pending_writes)
+
+        os.makedirs(self.root, exist_ok=True)
+        self._shard_legacy_files()
+        # The first full scan walks the whole store; keep it off the startup path
+        self._writer.submit(self._background_sweep)
+
+    # ---- naming ----
+
+    def path_for(self, name):
+        """
+        Sharded path of a stored file.
+
+        Raises:
+            ValueError: for names that are not plain file names
+        """
+        if not _SAFE_NAME_RE.fullmatch(name):
+            raise ValueError(f"Invalid file name: {name}")
+        stem = name.split('.', 1)[0].ljust(2 * self.shard_depth, '_')
+        shards = [stem[2 * i:2 * i + 2] for i in range(self.shard_depth)]
+        return os.path.join(self.root, *shards, name)
+
+    @staticmethod
+    def content_name(data, extension):
+        """Content-addressed file name, so identical uploads share one file"""
+        return f"{hashlib.sha256(data).hexdigest()}.{extension}"
+
+    # ---- reads and writes ----
+
+    def exists(self, name):
+        return os.path.exists(self.path_for(name))
+
+    def put(self, name, data, overwrite=False):
+        """
+        Atomically store bytes under name.
+
+        An existing file with the same name is kept (and counted as a
+        deduplicated write) unless overwrite is set.
+
+        Returns:
+            Path of the stored file
+        """
+        path = self.path_for(name)
+        if not overwrite and os.path.exists(path):
+            self.touch(name)
+            with self._lock:
+                self.dedup_hits += 1
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.files += 1
+            self.bytes += len(data)
+            self.writes += 1
+            over_cap = self.max_bytes is not None and self.bytes > self.max_bytes
+        self._ensure_sweeper()
+        if over_cap:
+            self._wakeup.set()
+        return path
+
+    def put_async(self, name, data):
+        """
+        put() on a background writer thread; returns a Future.
+
+        At most max_pending_writes writes are queued; beyond that the caller
+        blocks until one finishes, so a slow disk cannot grow memory without bound.
+        """
+        self._pending_writes.acquire()
+        try:
+            future = self._writer.submit(self.put, name, data)
+        except BaseException:
+            self._pending_writes.release()
+            raise
+        future.add_done_callback(lambda _: self._pending_writes.release())
+        return future
+
+    def touch(self, name):
+        """Record an access (refreshes the LRU position)"""
+        if self.policy != 'lru':
+            return
+        try:
+            os.utime(self.path_for(name))
+        except OSError:
+            pass
+
+    # ---- eviction ----
+
+    def sweep(self):
+        """Rescan the store, drop expired files and evict down to the size cap"""
+        entries = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        target = None if self.max_bytes is None else self.max_bytes * _LOW_WATERMARK
+        over_cap = self.max_bytes is not None and total > self.max_bytes
+        evicted_files = 0
+        evicted_bytes = 0
+        kept = len(entries)
+
+        for mtime, size, path in entries:
+            expired = self.ttl is not None and mtime < now - self.ttl
+            if not expired and not (over_cap and total > target):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            kept -= 1
+            evicted_files += 1
+            evicted_bytes += size
+
+        with self._lock:
+            self.files = kept
+            self.bytes = total
+            self.evicted_files += evicted_files
+            self.evicted_bytes += evicted_bytes
+            self.last_sweep = now
+
+    def stats(self):
+        """Usage and eviction counters for capacity planning"""
+        with self._lock:
+            return {
+                "root": self.root,
+                "files": self.files,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "utilization": self.bytes / self.max_bytes if self.max_bytes else None,
+                "ttl_seconds": self.ttl,
+                "policy": self.policy,
+                "writes": self.writes,
+                "dedup_hits": self.dedup_hits,
+                "evicted_files": self.evicted_files,
+                "evicted_bytes": self.evicted_bytes,
+                "last_sweep": self.last_sweep,
+            }
+
+    def _ensure_sweeper(self):
+        # Started lazily, and again in forked children where the thread is gone
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._wakeup = threading.Event()
+            self._sweeper = threading.Thread(target=self._run_sweeper, name='storage-sweeper', daemon=True)
+            self._sweeper.start()
+            self._pid = os.getpid()
+
+    def _run_sweeper(self):
+        while True:
+            self._wakeup.wait(self.sweep_interval)
+            self._wakeup.clear()
+            self._background_sweep()
+
+    def _background_sweep(self):
+        try:
+            self.sweep()
+        except Exception as e:
+            print(f"Storage sweep of {self.root} failed: {e}")
+
+    def _shard_legacy_files(self):
+        # Files written before sharding sit directly in root; move them into place
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isfile(path) and _SAFE_NAME_RE.fullmatch(name):
+                target = self.path_for(name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                try:
+                    os.replace(path, target)
+                except FileNotFoundError:
+                    continue  # moved by another worker starting at the same time
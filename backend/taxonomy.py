@@ -0,0 +1,105 @@
+# taxonomy.py
+import numpy as np
+
+
+class Taxonomy:
+    """
+    Precomputed class -> organ and malignancy lookups.
+
+    Built once from the label lists; per-class questions become dict
+    lookups and the organ/malignancy aggregates of a whole (N, num_classes)
+    probability matrix are computed with a handful of NumPy reductions.
+
+    Each class has one status:
+        'benign'         reported as benign/normal
+        'indeterminate'  reported as not benign, but not drawn as malignant
+                         (normal cell types outside the benign list)
+        'malignant'      everything else
+    """
+
+    def __init__(self, class_labels, organ_categories, benign_classes, indeterminate_classes=()):
+        """
+        Args:
+            class_labels: Model output order
+            organ_categories: Dict organ -> list of its classes
+            benign_classes: Classes reported as benign/normal
+            indeterminate_classes: Non-benign classes not counted as confirmed malignant
+        """
+        self.class_labels = list(class_labels)
+        self.class_index = {cls: i for i, cls in enumerate(self.class_labels)}
+        num_classes = len(self.class_labels)
+
+        class_organ = {cls: organ for organ, classes in organ_categories.items() for cls in classes}
+        # Organs ordered by their first class in the output order
+        self.organs = []
+        for cls in self.class_labels:
+            organ = class_organ.get(cls, 'Other')
+            if organ not in self.organs:
+                self.organs.append(organ)
+        self._organ_of = {cls: class_organ.get(cls, 'Other') for cls in self.class_labels}
+        self.organ_index = np.array([self.organs.index(self._organ_of[cls]) for cls in self.class_labels],
+                                    dtype=np.intp)
+
+        self.benign_mask = np.isin(self.class_labels, list(benign_classes))
+        self.malignant_mask = ~self.benign_mask
+        self.confirmed_malignant_mask = self.malignant_mask & ~np.isin(self.class_labels,
+                                                                       list(indeterminate_classes))
+
+        # Organ segments: classes regrouped by organ, then reduced per segment
+        self._order = np.argsort(self.organ_index, kind='stable')
+        counts = np.bincount(self.organ_index, minlength=len(self.organs))
+        self._segment_starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.intp)
+        # (organs, widest organ) gather matrix for per-organ argmax; padding points at a -inf column
+        self._organ_members = np.full((len(self.organs), counts.max()), num_classes, dtype=np.intp)
+        for organ, start in enumerate(self._segment_starts):
+            self._organ_members[organ, :counts[organ]] = self._order[start:start + counts[organ]]
+
+    def organ_of(self, class_name):
+        """Organ category of a class ('Other' for unknown classes)"""
+        return self._organ_of.get(class_name, 'Other')
+
+    def is_malignant(self, class_name):
+        """Whether a class is reported as malignant/abnormal"""
+        index = self.class_index.get(class_name)
+        return True if index is None else bool(self.malignant_mask[index])
+
+    def summarize(self, probabilities):
+        """
+        Derived fields for every row of a probability matrix.
+
+        Args:
+            probabilities: Array (N, num_classes), or a single vector
+
+        Returns:
+            Dict of arrays with a leading N axis:
+                top_index          (N,)   most likely class
+                top_organ          (N,)   organ index of top_index
+                top_is_malignant   (N,)   malignancy of top_index
+                organ_max          (N, O) highest class probability per organ
+                organ_argmax       (N, O) class index attaining organ_max
+                organ_sum          (N, O) total probability per organ
+                benign             (N,)   total benign probability
+                malignant          (N,)   total non-benign probability
+        """
+        probs = np.atleast_2d(np.asarray(probabilities, dtype=np.float32))
+        top_index = probs.argmax(axis=1)
+
+        padded = np.concatenate([probs, np.full((len(probs), 1), -np.inf, dtype=np.float32)], axis=1)
+        organ_scores = padded[:, self._organ_members]  # (N, O, widest organ)
+        organ_argmax = self._organ_members[np.arange(len(self.organs)), organ_scores.argmax(axis=2)]
+
+        return {
+            "top_index": top_index,
+            "top_organ": self.organ_index[top_index],
+            "top_is_malignant": self.malignant_mask[top_index],
+            "organ_max": organ_scores.max(axis=2),
+            "organ_argmax": organ_argmax,
+            "organ_sum": np.add.reduceat(probs[:, self._order], self._segment_starts, axis=1),
+            "benign": probs[:, self.benign_mask].sum(axis=1),
+            "malignant": probs[:, self.malignant_mask].sum(axis=1),
+        }
+
+    @staticmethod
+    def row(summary, i):
+        """The fields of row i of a summarize() result"""
+        return {key: values[i] for key, values in summary.items()}
@@ -0,0 +1,142 @@
+# test_app.py
+import importlib
+import io
+import json
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import backends
+
+NUM_CLASSES = 27
+
+
+class StubBackend:
+    """Stands in for the model: the predicted class is the mean red value modulo the class count"""
+
+    name = 'stub'
+    embedding_dim = None
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, batch):
+        self.calls += 1
+        probs = np.full((len(batch), NUM_CLASSES), 0.1 / (NUM_CLASSES - 1), dtype=np.float32)
+        probs[np.arange(len(batch)), self.top_class(batch)] = 0.9
+        return probs
+
+    @staticmethod
+    def top_class(batch):
+        return np.asarray(batch)[..., 0].reshape(len(batch), -1).mean(axis=1).astype(int) % NUM_CLASSES
+
+
+def png(red):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (red, 10, 10)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('app')
+    stub = StubBackend()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(workdir)  # uploads/ and visualizations/ are relative
+        for name, value in {
+            'MODEL_PATH': str(workdir / 'model.keras'), 'MODEL_VERSION': 'stub-1',
+            'INFERENCE_BACKEND': 'stub', 'MODEL_LOADING': 'eager', 'MODEL_STATE_FILE': '',
+            'SIMILAR_INDEX_DIR': '', 'PREDICTION_CACHE_DIR': '', 'JOB_STATE_DIR': '',
+            'RUNTIME_PROFILE': '', 'SERVER_TIMING': '1', 'MAX_BATCH_WAIT_MS': '1',
+        }.items():
+            patch.setenv(name, value)
+        patch.setattr(backends, 'load_backend', lambda *args, **kwargs: stub)
+        sys.modules.pop('App', None)
+        App = importlib.import_module('App')
+        App.stub_backend = stub
+        yield App
+    sys.modules.pop('App', None)
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def test_model_loads_on_the_stub(app_module, client):
+    assert len(app_module.class_labels) == NUM_CLASSES
+    response = client.get('/api/health/ready')
+    assert response.status_code == 200
+    assert response.headers['X-Model-Version'] == 'stub-1'
+
+
+def test_predict_returns_the_stub_class_and_timings(app_module, client):
+    response = client.post('/api/predict', data={'image': (io.BytesIO(png(31)), 'a.png')})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["prediction"]["class"] == app_module.class_labels[31 % NUM_CLASSES]
+    assert sum(body["all_confidences"].values()) == pytest.approx(1.0, rel=1e-4)
+
+    stages = [part.split(';')[0] for part in response.headers['Server-Timing'].split(', ')]
+    assert {'cache_lookup', 'preprocess', 'inference', 'total'} <= set(stages)
+
+
+def test_repeated_upload_is_served_from_the_cache(app_module, client):
+    data = png(77)
+    first = client.post('/api/predict', data={'image': (io.BytesIO(data), 'b.png')}).get_json()
+    calls = app_module.stub_backend.calls
+    second = client.post('/api/predict', data={'image': (io.BytesIO(data), 'b.png')}).get_json()
+
+    assert app_module.stub_backend.calls == calls
+    assert second["prediction"] == first["prediction"]
+    assert second["visualizations"] == first["visualizations"]
+
+
+def test_charts_render_from_the_registered_payload(client):
+    body = client.post('/api/predict', data={'image': (io.BytesIO(png(5)), 'c.png')}).get_json()
+    chart = client.get('/visualizations/' + body["visualizations"]["bar_chart"])
+    assert chart.status_code == 200
+    assert chart.mimetype == 'image/png'
+    assert client.get('/visualizations/' + '0' * 32 + '_bar.png').status_code == 404
+
+
+def test_predict_rejects_bad_uploads(client):
+    assert client.post('/api/predict', data={}).status_code == 400
+    assert client.post('/api/predict', data={'image': (io.BytesIO(b'text'), 'a.txt')}).status_code == 400
+    oversized = client.post('/api/predict', data={'image': (io.BytesIO(b'0' * (11 * 1024 * 1024)), 'a.png')})
+    assert oversized.status_code == 413
+    assert 'error' in oversized.get_json()
+
+
+def test_batch_streams_one_line_per_image(app_module, client):
+    response = client.post('/api/predict/batch', data={
+        'images': [(io.BytesIO(png(3)), 'a.png'), (io.BytesIO(b'broken'), 'b.png')]})
+    assert response.status_code == 200
+    # Lines arrive in completion order
+    lines = sorted((json.loads(line) for line in response.data.decode().splitlines()), key=lambda line: line["index"])
+    assert [line["index"] for line in lines] == [0, 1]
+    assert lines[0]["prediction"]["class"] == app_module.class_labels[3]
+    assert 'error' in lines[1]
+
+
+def test_classes_support_conditional_requests(client):
+    response = client.get('/api/classes')
+    assert response.status_code == 200
+    assert len(response.get_json()["class_labels"]) == NUM_CLASSES
+    cached = client.get('/api/classes', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+
+def test_metrics_endpoint_reports_requests_and_stages(client):
+    client.post('/api/predict', data={'image': (io.BytesIO(png(9)), 'd.png')})
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+    text = response.data.decode()
+    assert '# TYPE http_requests_total counter' in text
+    assert 'http_requests_total{method="POST",route="/api/predict",status="200"}' in text
+    assert 'stage="preprocess"' in text and 'stage="forward"' in text
+    assert 'process_resident_memory_bytes ' in text
@@ -0,0 +1,67 @@
+# test_batching.py
+import threading
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+def test_concurrent_submissions_share_batches():
+    batch_sizes = []
+
+    def predict(batch):
+        batch_sizes.append(len(batch))
+        return batch * 2
+
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(np.full(3, i, dtype=np.float32)) for i in range(8)]
+    rows = [future.result(timeout=5) for future in futures]
+    batcher.close()
+
+    for i, row in enumerate(rows):
+        np.testing.assert_array_equal(row, np.full(3, 2 * i))
+    assert max(batch_sizes) <= 4
+    assert sum(batch_sizes) == 8 and len(batch_sizes) < 8
+    assert batcher.items_run == 8
+
+
+def test_tuple_outputs_are_split_per_row():
+    batcher = MicroBatcher(lambda batch: (batch + 1, batch.sum(axis=1)), max_batch_size=8, max_wait_ms=50)
+    first, second = batcher.submit(np.ones(2)), batcher.submit(np.zeros(2))
+    shifted, total = first.result(timeout=5)
+    np.testing.assert_array_equal(shifted, [2.0, 2.0])
+    assert total == 2.0
+    assert second.result(timeout=5)[1] == 0.0
+    batcher.close()
+
+
+def test_predict_errors_reach_every_caller():
+    def predict(batch):
+        raise RuntimeError("model failed")
+
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(np.zeros(2)) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model failed"):
+            future.result(timeout=5)
+    batcher.close()
+
+
+def test_cancelled_requests_are_skipped():
+    release = threading.Event()
+    seen = []
+
+    def predict(batch):
+        release.wait(5)
+        seen.append(len(batch))
+        return batch
+
+    batcher = MicroBatcher(predict, max_batch_size=1, max_wait_ms=0)
+    running = batcher.submit(np.zeros(1))
+    cancelled = batcher.submit(np.ones(1))
+    assert cancelled.cancel()
+    release.set()
+    running.result(timeout=5)
+    batcher.close()
+    assert seen == [1]
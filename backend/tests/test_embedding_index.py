@@ -0,0 +1,86 @@
+# test_embedding_index.py
+import hashlib
+
+import numpy as np
+import pytest
+
+from embedding_index import EmbeddingIndex
+
+DIM = 8
+
+
+def key(i):
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+def brute_force(vectors, query, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(vectors @ (query / np.linalg.norm(query))), kind='stable')[:k])
+
+
+def test_add_and_lookup(tmp_path):
+    index = EmbeddingIndex(str(tmp_path), DIM, grow_rows=4)
+    vector = np.arange(1, DIM + 1, dtype=np.float32)
+    assert index.add(key(0), vector, class_index=3) == 0
+
+    assert len(index) == 1
+    np.testing.assert_allclose(index.vector_for(key(0)), vector / np.linalg.norm(vector), atol=1e-3)
+    assert index.vector_for(key(1)) is None
+    with pytest.raises(ValueError):
+        EmbeddingIndex(str(tmp_path), DIM + 1)
+
+
+def test_re_adding_a_key_overwrites_its_row(tmp_path):
+    index = EmbeddingIndex(str(tmp_path), DIM, grow_rows=4)
+    for i in range(6):
+        index.add(key(i), np.eye(DIM)[i], class_index=i)
+    assert index.add(key(2), np.eye(DIM)[7], class_index=7) == 2
+
+    assert len(index) == 6
+    np.testing.assert_allclose(index.vector_for(key(2)), np.eye(DIM)[7])
+    hits = index.search(np.eye(DIM)[7], k=6)
+    assert [hit["key"] for hit in hits].count(key(2)) == 1
+    assert hits[0]["key"] == key(2) and hits[0]["class_index"] == 7
+
+
+def test_chunked_search_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, DIM)).astype(np.float32)
+    # Three rows of float32 per search chunk, so the top k is merged across 17 chunks
+    index = EmbeddingIndex(str(tmp_path), DIM, grow_rows=16, search_chunk_bytes=3 * DIM * 4)
+    assert index.search_chunk_rows == 3
+    for i, vector in enumerate(vectors):
+        index.add(key(i), vector, class_index=i % 4)
+
+    query = rng.normal(size=DIM).astype(np.float32)
+    hits = index.search(query, k=5)
+    assert [hit["row"] for hit in hits] == brute_force(vectors, query, 5)
+    assert [hit["similarity"] for hit in hits] == sorted((hit["similarity"] for hit in hits), reverse=True)
+
+
+def test_search_filters(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(20, DIM)).astype(np.float32)
+    index = EmbeddingIndex(str(tmp_path), DIM, search_chunk_bytes=4 * DIM * 4)
+    for i, vector in enumerate(vectors):
+        index.add(key(i), vector, class_index=i % 2)
+
+    class_mask = np.zeros(256, dtype=bool)
+    class_mask[1] = True
+    hits = index.search(vectors[3], k=30, class_mask=class_mask, exclude_key=key(3))
+    assert len(hits) == 9
+    assert all(hit["class_index"] == 1 for hit in hits)
+    assert key(3) not in [hit["key"] for hit in hits]
+
+
+def test_rows_added_by_another_worker_are_deduplicated(tmp_path):
+    first = EmbeddingIndex(str(tmp_path), DIM, grow_rows=4)
+    second = EmbeddingIndex(str(tmp_path), DIM, grow_rows=4)
+    first.add(key(0), np.eye(DIM)[0], class_index=0)
+    for i in range(1, 6):
+        second.add(key(i), np.eye(DIM)[i], class_index=i)
+
+    assert first.add(key(4), np.eye(DIM)[0], class_index=0) == 4
+    assert second.add(key(0), np.eye(DIM)[1], class_index=1) == 0
+    assert len(first) == len(second) == 6
+    np.testing.assert_allclose(first.vector_for(key(0)), np.eye(DIM)[1])
@@ -0,0 +1,61 @@
+# test_inference.py
+import numpy as np
+import tensorflow as tf
+
+from backends import KerasBackend
+
+SHAPE = (16, 16, 3)
+NUM_CLASSES = 5
+
+
+def backbone(pooling):
+    inputs = tf.keras.Input(SHAPE)
+    x = tf.keras.layers.Conv2D(4, 3, activation='relu')(inputs)
+    if pooling:
+        x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    return tf.keras.Model(inputs, x, name='backbone')
+
+
+def classifier(trunk, *head):
+    inputs = tf.keras.Input(SHAPE)
+    x = trunk(inputs)
+    for layer in head:
+        x = layer(x)
+    return tf.keras.Model(inputs, tf.keras.layers.Dense(NUM_CLASSES, activation='softmax')(x))
+
+
+def batch(n=2):
+    return np.random.default_rng(0).integers(0, 256, (n,) + SHAPE, dtype=np.uint8)
+
+
+def test_embeddings_from_a_pooled_nested_backbone():
+    model = classifier(backbone(pooling=True))
+    backend = KerasBackend(model, SHAPE, with_embeddings=True)
+
+    assert backend.embedding_layer == 'backbone'
+    assert backend.embedding_dim == 4
+    softmax, embeddings = backend.predict(batch())
+    np.testing.assert_allclose(softmax, model(batch() / 255.0).numpy(), atol=1e-5)
+    assert embeddings.shape == (2, 4)
+
+
+def test_embeddings_after_a_nested_backbone():
+    model = classifier(backbone(pooling=False), tf.keras.layers.GlobalAveragePooling2D(name='pool'))
+    backend = KerasBackend(model, SHAPE, with_embeddings=True)
+
+    assert backend.embedding_layer == 'pool'
+    softmax, embeddings = backend.predict(batch())
+    assert softmax.shape == (2, NUM_CLASSES) and embeddings.shape == (2, 4)
+
+
+def test_embeddings_are_disabled_when_they_cannot_be_extracted(monkeypatch):
+    import inference
+
+    def no_embedding_layer(model):
+        raise ValueError("Could not find a pooled feature layer before the classifier.")
+
+    monkeypatch.setattr(inference, 'find_embedding_layer', no_embedding_layer)
+    backend = KerasBackend(classifier(backbone(pooling=True)), SHAPE, with_embeddings=True)
+
+    assert backend.embedding_layer is None and backend.embedding_dim is None
+    assert backend.predict(batch()).shape == (2, NUM_CLASSES)
@@ -0,0 +1,106 @@
+# test_jobs.py
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from jobs import JobQueue, QueueFull
+
+
+def test_job_runs_and_reports_stages():
+    def handler(payload, report):
+        report('inference')
+        return {"double": payload * 2}
+
+    jobs = JobQueue(handler, num_workers=1)
+    job_id = jobs.submit(21)
+    job = jobs.wait_for_update(job_id, -1, timeout=5)
+    while job["status"] not in ("done", "failed"):
+        job = jobs.wait_for_update(job_id, job["version"], timeout=5)
+
+    assert job["status"] == "done"
+    assert job["result"] == {"double": 42}
+    assert job["version"] == 3  # running, inference, done
+    assert jobs.get('0' * 32) is None
+
+
+def test_failed_job_keeps_the_error():
+    def handler(payload, report):
+        raise ValueError("unreadable image")
+
+    jobs = JobQueue(handler, num_workers=1)
+    job_id = jobs.submit(None)
+    job = jobs.get(job_id)
+    while job["status"] not in ("done", "failed"):
+        job = jobs.wait_for_update(job_id, job["version"], timeout=5)
+    assert job["status"] == "failed"
+    assert job["error"] == "unreadable image"
+
+
+def test_full_queue_rejects_with_retry_after():
+    release = threading.Event()
+    jobs = JobQueue(lambda payload, report: release.wait(5), num_workers=1, max_queue=1)
+    running = jobs.submit(1)
+    jobs.wait_for_update(running, 0, timeout=5)  # taken by the only worker
+    jobs.submit(2)  # waits in the queue
+
+    with pytest.raises(QueueFull) as excinfo:
+        jobs.submit(3)
+    release.set()
+    assert excinfo.value.retry_after >= 1
+
+
+def test_jobs_are_visible_to_workers_sharing_a_state_dir(tmp_path):
+    release = threading.Event()
+
+    def handler(payload, report):
+        release.wait(5)
+        return {"payload": payload}
+
+    accepting = JobQueue(handler, num_workers=1, state_dir=str(tmp_path))
+    other = JobQueue(handler, num_workers=1, state_dir=str(tmp_path), poll_interval=0.01)
+    job_id = accepting.submit('slide')
+
+    seen = other.get(job_id)
+    assert seen["id"] == job_id and seen["status"] in ("queued", "running")
+
+    release.set()
+    job = seen
+    while job["status"] != "done":
+        job = other.wait_for_update(job_id, job["version"], timeout=5)
+    assert job["result"] == {"payload": 'slide'}
+    assert other.get('not-a-job-id') is None
+
+
+def test_queued_state_never_overwrites_the_workers(tmp_path):
+    jobs = JobQueue(lambda payload, report: {"payload": payload}, num_workers=1, state_dir=str(tmp_path))
+    persist = jobs._persist
+
+    def slow_persist(job):
+        if job["status"] == "queued":
+            time.sleep(0.2)  # the worker would finish meanwhile if the job were already queued
+        persist(job)
+
+    jobs._persist = slow_persist
+    job_id = jobs.submit('x')
+    job = jobs.get(job_id)
+    while job["status"] != "done":
+        job = jobs.wait_for_update(job_id, job["version"], timeout=5)
+
+    with open(tmp_path / f"{job_id}.json") as f:
+        assert json.load(f)["status"] == "done"
+
+
+def test_rejected_job_leaves_no_state_file(tmp_path):
+    release = threading.Event()
+    jobs = JobQueue(lambda payload, report: release.wait(5), num_workers=1, max_queue=1, state_dir=str(tmp_path))
+    running = jobs.submit(1)
+    jobs.wait_for_update(running, 0, timeout=5)
+    jobs.submit(2)
+
+    with pytest.raises(QueueFull):
+        jobs.submit(3)
+    release.set()
+    assert len(os.listdir(tmp_path)) == 2
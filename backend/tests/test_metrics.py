@@ -0,0 +1,50 @@
+# test_metrics.py
+from metrics import MetricsRegistry, StageTimings, timed
+
+
+def test_histogram_buckets_are_cumulative_per_label():
+    registry = MetricsRegistry()
+    latency = registry.histogram('stage_seconds', 'Stage latency', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, 'forward')
+    latency.observe(0.01, 'decode')
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP stage_seconds Stage latency', '# TYPE stage_seconds histogram']
+    assert 'stage_seconds_bucket{stage="forward",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="forward",le="1.0"} 3' in lines
+    assert 'stage_seconds_bucket{stage="forward",le="+Inf"} 4' in lines
+    assert 'stage_seconds_sum{stage="forward"} 4.05' in lines
+    assert 'stage_seconds_count{stage="forward"} 4' in lines
+    assert 'stage_seconds_count{stage="decode"} 1' in lines
+
+
+def test_counter_labels_are_escaped():
+    registry = MetricsRegistry()
+    errors = registry.counter('errors_total', 'Errors', ('type',))
+    errors.inc('Value"Error')
+    errors.inc('Value"Error', amount=2)
+    registry.counter('plain_total', 'Unlabelled').inc()
+    registry.gauge('queue_depth', 'Queued images', lambda: 7)
+
+    lines = registry.render().splitlines()
+    assert 'errors_total{type="Value\\"Error"} 3' in lines
+    assert 'plain_total 1' in lines
+    assert 'queue_depth 7' in lines
+
+
+def test_timed_records_failures_and_server_timing():
+    registry = MetricsRegistry()
+    latency = registry.histogram('stage_seconds', 'Stage latency', ('stage',))
+    timings = StageTimings()
+    with timed(latency, 'decode', timings):
+        pass
+    try:
+        with timed(latency, 'forward', timings):
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    assert [stage for stage, _ in timings.stages] == ['decode', 'forward']
+    assert [part.split(';')[0] for part in timings.header().split(', ')] == ['decode', 'forward']
+    assert 'stage_seconds_count{stage="forward"} 1' in registry.render().splitlines()
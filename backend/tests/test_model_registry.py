@@ -0,0 +1,90 @@
+# test_model_registry.py
+import json
+import threading
+
+import pytest
+
+from model_registry import ModelRegistry, ModelVersion
+
+
+def make_registry(tmp_path, retired, **kwargs):
+    def loader(path, version, role):
+        return ModelVersion(version or path, path)
+
+    return ModelRegistry(loader, on_retire=lambda version: retired.put(version.version),
+                         state_path=str(tmp_path / 'state.json'), **kwargs)
+
+
+class Retired:
+    """Versions passed to on_retire, in order"""
+
+    def __init__(self):
+        self.versions = []
+        self._changed = threading.Condition()
+
+    def put(self, version):
+        with self._changed:
+            self.versions.append(version)
+            self._changed.notify_all()
+
+    def wait(self, version, timeout=5):
+        with self._changed:
+            return self._changed.wait_for(lambda: version in self.versions, timeout)
+
+
+def test_swap_returns_before_the_old_version_drains(tmp_path):
+    retired = Retired()
+    registry = make_registry(tmp_path, retired)
+    registry.load('a.keras', 'v1')
+
+    with registry.use() as served:
+        done = threading.Event()
+        registry.load_in_background('b.keras', 'v2', on_done=lambda: (registry.save_state(), done.set()))
+        # State is published and a second swap accepted while v1 still serves a request
+        assert done.wait(5)
+        assert json.loads((tmp_path / 'state.json').read_text())["active"]["version"] == 'v2'
+        registry.load_in_background('c.keras', 'v3').join(5)
+        assert registry.active.version == 'v3'
+        assert served.version == 'v1'
+        assert 'v1' not in retired.versions
+
+    assert retired.wait('v1')
+
+
+def test_second_load_while_loading_is_rejected(tmp_path):
+    release = threading.Event()
+
+    def slow_loader(path, version, role):
+        release.wait(5)
+        return ModelVersion(version, path)
+
+    registry = ModelRegistry(slow_loader)
+    thread = registry.load_in_background('a.keras', 'v1')
+    with pytest.raises(RuntimeError):
+        registry.load_in_background('b.keras', 'v2')
+    release.set()
+    thread.join(5)
+    assert registry.active.version == 'v1'
+
+
+def test_drain_timeout_retires_anyway(tmp_path):
+    retired = Retired()
+    registry = make_registry(tmp_path, retired, drain_timeout=0.05)
+    registry.load('a.keras', 'v1')
+    with registry.use():
+        registry.load('b.keras', 'v2')
+        assert retired.wait('v1')
+    assert retired.versions == ['v1']
+
+
+def test_shadow_comparisons(tmp_path):
+    registry = make_registry(tmp_path, Retired())
+    registry.load('a.keras', 'v1')
+    registry.load('b.keras', 'v2', role='shadow', fraction=1.0)
+
+    for served, shadow in (([0.9, 0.1], [0.8, 0.2]), ([0.9, 0.1], [0.1, 0.9])):
+        version = registry.sample_shadow()
+        registry.record_shadow('v1', version, served, shadow, key='k')
+    status = registry.snapshot()["shadow"]
+    assert (status["compared"], status["disagreements"]) == (2, 1)
+    assert status["in_flight"] == 0
@@ -0,0 +1,87 @@
+# test_prediction_cache.py
+import json
+import os
+import threading
+
+from prediction_cache import PredictionCache
+
+
+def result(i):
+    return {"prediction": {"class": f"class_{i}", "confidence": i / 10}, "filename": f"{i}.png"}
+
+
+def test_memory_lru_and_versions():
+    cache = PredictionCache(max_entries=2)
+    cache.put('a', result(1), 'v1')
+    cache.put('b', result(2), 'v1')
+    assert cache.get('a', 'v1') == result(1)
+    cache.put('c', result(3), 'v1')  # evicts b, the least recently used
+
+    assert cache.get('b', 'v1') is None
+    assert cache.get('a', 'v2') is None
+    assert cache.get('c', 'v1') == result(3)
+
+    cached = cache.get('a', 'v1')
+    cached["prediction"]["class"] = 'changed'
+    assert cache.get('a', 'v1') == result(1)
+
+
+def test_disk_tier_survives_restart_and_invalidation(tmp_path):
+    cache = PredictionCache(max_entries=0, disk_dir=str(tmp_path))
+    cache.put('ab' * 32, result(1), 'v1')
+    cache.put('cd' * 32, result(2), 'v2')
+
+    restarted = PredictionCache(max_entries=4, disk_dir=str(tmp_path))
+    assert restarted.stats()["disk_entries"] == 2
+    assert restarted.get('ab' * 32, 'v1') == result(1)
+    assert restarted.disk_hits == 1
+
+    restarted.invalidate('v1')
+    assert restarted.get('ab' * 32, 'v1') is None
+    assert restarted.get('cd' * 32, 'v2') == result(2)
+
+
+def test_disk_cap_evicts_oldest(tmp_path):
+    size = len(json.dumps(result(1)))
+    cache = PredictionCache(max_entries=0, disk_dir=str(tmp_path), disk_max_bytes=2 * size + 1)
+    for i, key in enumerate(['aa' * 32, 'bb' * 32, 'cc' * 32], start=1):
+        cache.put(key, result(i))
+    assert cache.get('aa' * 32) is None
+    assert cache.get('cc' * 32) == result(3)
+    assert cache.stats()["disk_bytes"] <= cache.disk_max_bytes
+
+
+def test_workers_sharing_a_disk_dir(tmp_path):
+    # Two instances stand in for two serve.py workers writing the same keys at once
+    workers = [PredictionCache(max_entries=0, disk_dir=str(tmp_path)) for _ in range(2)]
+    keys = [f"{i:02x}" * 32 for i in range(16)]
+    errors = []
+
+    def write(cache):
+        try:
+            for _ in range(5):
+                for i, key in enumerate(keys):
+                    cache.put(key, result(i))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(cache,)) for cache in workers for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    leftovers = [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith('.tmp')]
+    assert leftovers == []
+    for cache in workers:
+        assert [cache.get(key) for key in keys] == [result(i) for i in range(16)]
+
+
+def test_entries_of_another_worker_are_found(tmp_path):
+    writer = PredictionCache(max_entries=0, disk_dir=str(tmp_path))
+    reader = PredictionCache(max_entries=0, disk_dir=str(tmp_path))
+    writer.put('ef' * 32, result(5), 'v1')
+
+    assert reader.get('ef' * 32, 'v1') == result(5)
+    assert reader.stats()["disk_entries"] == 1
@@ -0,0 +1,67 @@
+# test_slides.py
+import numpy as np
+import pytest
+
+from slides import SlideReader, predict_slide
+
+tifffile = pytest.importorskip('tifffile')
+
+
+def write_slide(path, shape=(300, 500), **options):
+    pixels = np.random.default_rng(0).integers(0, 256, shape + (3,), dtype=np.uint8)
+    tifffile.imwrite(path, pixels, photometric='rgb', **options)
+    return pixels
+
+
+def count_decodes(reader):
+    calls = []
+    decode = reader._decode
+
+    def counting(page, index):
+        calls.append(index)
+        return decode(page, index)
+
+    reader._decode = counting
+    return calls
+
+
+@pytest.mark.parametrize('options', [
+    {'compression': 'zlib', 'rowsperstrip': 16},
+    {'compression': 'zlib', 'tile': (64, 64)},
+    {},
+])
+def test_read_region_matches_the_image(tmp_path, options):
+    path = str(tmp_path / 'slide.tif')
+    pixels = write_slide(path, **options)
+
+    with SlideReader(path) as reader:
+        np.testing.assert_array_equal(reader.read_region(30, 40, 100, 50), pixels[40:90, 30:130])
+        # Beyond the edge the region is white
+        region = reader.read_region(450, 280, 100, 50)
+        np.testing.assert_array_equal(region[:20, :50], pixels[280:, 450:])
+        assert (region[20:] == 255).all() and (region[:, 50:] == 255).all()
+
+
+def test_strips_are_decoded_once_per_block_row(tmp_path):
+    path = str(tmp_path / 'slide.tif')
+    write_slide(path, compression='zlib', rowsperstrip=16)
+
+    with SlideReader(path) as reader:
+        calls = count_decodes(reader)
+        predict_slide(reader, lambda tiles: np.ones((len(tiles), 2)) / 2, tile_size=32, target_size=(32, 32),
+                      min_tissue=0.0, block_tiles=4)
+
+    # 300 rows in 16-row strips; a strip shared by two block rows is still kept
+    assert sorted(calls) == list(range(19))
+
+
+def test_strips_over_the_cache_budget_are_decoded_again(tmp_path):
+    path = str(tmp_path / 'slide.tif')
+    pixels = write_slide(path, compression='zlib', rowsperstrip=16)
+
+    with SlideReader(path, strip_cache_bytes=0) as reader:
+        calls = count_decodes(reader)
+        np.testing.assert_array_equal(reader.read_region(0, 0, 100, 32), pixels[:32, :100])
+        np.testing.assert_array_equal(reader.read_region(100, 0, 100, 32), pixels[:32, 100:200])
+
+    assert calls == [0, 1, 0, 1]
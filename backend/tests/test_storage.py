@@ -0,0 +1,104 @@
+# test_storage.py
+import os
+import time
+
+import pytest
+
+from storage import StorageManager
+
+
+def make_store(root, **kwargs):
+    store = StorageManager(str(root), sweep_interval=3600, **kwargs)
+    store._writer.submit(lambda: None).result()  # wait for the initial background sweep
+    return store
+
+
+def age(store, name, seconds):
+    path = store.path_for(name)
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_put_is_sharded_and_deduplicated(tmp_path):
+    store = make_store(tmp_path)
+    name = StorageManager.content_name(b'image', 'png')
+    path = store.put(name, b'image')
+
+    assert path == os.path.join(str(tmp_path), name[:2], name[2:4], name)
+    assert store.put(name, b'image') == path
+    assert store.stats()["dedup_hits"] == 1
+    with pytest.raises(ValueError):
+        store.path_for('../escape.png')
+
+
+def test_sweep_drops_expired_files(tmp_path):
+    store = make_store(tmp_path, ttl=60)
+    store.put('old.npy', b'x' * 10)
+    store.put('new.npy', b'x' * 10)
+    age(store, 'old.npy', 120)
+
+    store.sweep()
+    assert not store.exists('old.npy')
+    assert store.exists('new.npy')
+    assert store.stats()["evicted_files"] == 1
+
+
+def test_sweep_evicts_least_recently_used_over_cap(tmp_path):
+    store = make_store(tmp_path)
+    for i, name in enumerate(['a.bin', 'b.bin', 'c.bin', 'd.bin']):
+        store.put(name, b'x' * 30)
+        age(store, name, 100 - i)
+    store.touch('a.bin')  # read recently, so b.bin is now the oldest
+
+    # Capped only now, so put() did not already wake the background sweeper
+    store.max_bytes = 100
+    store.sweep()
+    assert [store.exists(name) for name in ['a.bin', 'b.bin', 'c.bin', 'd.bin']] == [True, False, True, True]
+    assert store.stats()["bytes"] == 90
+
+
+def test_fifo_ignores_reads(tmp_path):
+    store = make_store(tmp_path, policy='fifo')
+    store.put('a.bin', b'x' * 30)
+    store.put('b.bin', b'x' * 30)
+    age(store, 'a.bin', 10)
+    store.touch('a.bin')
+
+    store.max_bytes = 50
+    store.sweep()
+    assert not store.exists('a.bin')
+    assert store.exists('b.bin')
+
+
+def test_first_sweep_runs_in_the_background(tmp_path):
+    (tmp_path / 'legacy.png').write_bytes(b'x' * 10)
+    store = make_store(tmp_path, ttl=3600)
+
+    assert store.exists('legacy.png')  # moved into its shard directory
+    assert store.stats()["files"] == 1
+    assert store.stats()["last_sweep"] is not None
+
+
+def test_legacy_files_moved_by_another_worker_are_skipped(tmp_path, monkeypatch):
+    (tmp_path / 'a.png').write_bytes(b'x')
+    (tmp_path / 'b.png').write_bytes(b'y')
+    replace = os.replace
+
+    def raced_replace(src, dst):
+        if src.endswith('a.png'):
+            replace(src, dst)  # a sibling worker starting at the same time wins
+            raise FileNotFoundError(src)
+        replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', raced_replace)
+    store = make_store(tmp_path)
+
+    assert store.exists('a.png') and store.exists('b.png')
+
+
+def test_put_async_writes_every_file(tmp_path):
+    store = make_store(tmp_path, max_pending_writes=2)
+    futures = [store.put_async(f'{i}.bin', b'x') for i in range(10)]
+    for future in futures:
+        future.result(timeout=5)
+    assert all(store.exists(f'{i}.bin') for i in range(10))
@@ -0,0 +1,49 @@
+# test_taxonomy.py
+import numpy as np
+import pytest
+
+from taxonomy import Taxonomy
+
+CLASS_LABELS = ['brain_glioma', 'lung_bnt', 'brain_notumor', 'lung_aca', 'oral_normal']
+ORGANS = {'Brain': ['brain_glioma', 'brain_notumor'], 'Lung': ['lung_aca', 'lung_bnt']}
+
+
+@pytest.fixture
+def taxonomy():
+    return Taxonomy(CLASS_LABELS, ORGANS, benign_classes=['brain_notumor', 'lung_bnt'],
+                    indeterminate_classes=['oral_normal'])
+
+
+def test_lookups(taxonomy):
+    assert taxonomy.organs == ['Brain', 'Lung', 'Other']
+    assert taxonomy.organ_of('lung_aca') == 'Lung'
+    assert taxonomy.organ_of('unknown') == 'Other'
+    assert taxonomy.is_malignant('brain_glioma')
+    assert not taxonomy.is_malignant('lung_bnt')
+    assert taxonomy.is_malignant('unknown')
+    assert list(taxonomy.confirmed_malignant_mask) == [True, False, False, True, False]
+
+
+def test_summarize_matches_per_row_loops(taxonomy):
+    rng = np.random.default_rng(0)
+    probs = rng.dirichlet(np.ones(len(CLASS_LABELS)), size=6).astype(np.float32)
+    summary = taxonomy.summarize(probs)
+
+    for i, row in enumerate(probs):
+        assert summary["top_index"][i] == row.argmax()
+        for o, organ in enumerate(taxonomy.organs):
+            members = [c for c, cls in enumerate(CLASS_LABELS) if taxonomy.organ_of(cls) == organ]
+            assert summary["organ_sum"][i, o] == pytest.approx(row[members].sum(), rel=1e-5)
+            assert summary["organ_max"][i, o] == pytest.approx(row[members].max())
+            assert summary["organ_argmax"][i, o] == members[int(row[members].argmax())]
+        benign = [CLASS_LABELS.index('brain_notumor'), CLASS_LABELS.index('lung_bnt')]
+        assert summary["benign"][i] == pytest.approx(row[benign].sum(), rel=1e-5)
+        assert summary["benign"][i] + summary["malignant"][i] == pytest.approx(1.0, rel=1e-5)
+
+
+def test_summarize_single_vector(taxonomy):
+    summary = taxonomy.summarize([0.1, 0.1, 0.6, 0.1, 0.1])
+    row = Taxonomy.row(summary, 0)
+    assert row["top_index"] == 2
+    assert row["top_organ"] == 0
+    assert not row["top_is_malignant"]
@@ -33,6 +33,13 @@ interface CancerInfo {
   common_treatments: string;
 }
 
+// Raw numbers behind the result charts (used when the server skips rendering)
+interface ChartData {
+  top5: { class: string; readable_name: string; confidence: number }[];
+  organs: { organ: string; class: string; confidence: number; is_malignant: boolean }[];
+  benign_vs_malignant: { benign: number; malignant: number };
+}
+
 // Interface for Flask backend response aligned with the Python implementation
 interface PredictionResult {
   prediction: {
@@ -47,11 +54,12 @@ interface PredictionResult {
     organ: string;
     is_malignant: boolean;
   };
-  visualizations: {
+  visualizations?: {
     bar_chart: string;
     organ_chart: string;
     pie_chart: string;
   };
+  chart_data?: ChartData;
   cancer_info?: CancerInfo;
   alternatives_info?: AlternativePrediction[];
 }
@@ -115,6 +123,47 @@ const getOrganFromClass = (className: string): string => {
   return organLookupMap.get(className) || "Other";
 };
 
+// Client-side horizontal bar chart drawn from the returned numbers
+const ClientBarChart = memo(({ rows }: {
+  rows: { label: string; value: number; color: string }[];
+}) => {
+  const maxValue = Math.max(...rows.map(row => row.value), 1e-9);
+  return (
+    <div className="viz-client-chart">
+      {rows.map(row => (
+        <div key={row.label} className="viz-client-row">
+          <span className="viz-client-label">{row.label}</span>
+          <div className="viz-client-track">
+            <div
+              className="viz-client-bar"
+              style={{ width: `${(row.value / maxValue) * 100}%`, backgroundColor: row.color }}
+            ></div>
+          </div>
+          <span className="viz-client-value">{(row.value * 100).toFixed(1)}%</span>
+        </div>
+      ))}
+    </div>
+  );
+});
+
+ClientBarChart.displayName = 'ClientBarChart';
+
+// Client-side benign vs malignant pie drawn with a conic gradient
+const ClientPieChart = memo(({ benign, malignant }: { benign: number; malignant: number }) => (
+  <div className="viz-client-chart">
+    <div
+      className="viz-client-pie"
+      style={{ background: `conic-gradient(forestgreen 0 ${benign * 100}%, crimson ${benign * 100}% 100%)` }}
+    ></div>
+    <div className="viz-client-legend">
+      <span style={{ color: 'forestgreen' }}>Benign {(benign * 100).toFixed(1)}%</span>
+      <span style={{ color: 'crimson' }}>Malignant/Abnormal {(malignant * 100).toFixed(1)}%</span>
+    </div>
+  </div>
+));
+
+ClientPieChart.displayName = 'ClientPieChart';
+
 // Component for visualization tabs - memoized
 interface VisualizationTabsProps {
   prediction: PredictionResult;
@@ -128,20 +177,36 @@ const VisualizationTabs: React.FC<VisualizationTabsProps> = memo(({ prediction,
   const setOrganTab = useCallback(() => setActiveTab('organ'), [setActiveTab]);
   const setPieTab = useCallback(() => setActiveTab('pie'), [setActiveTab]);
   
-  // Pre-calculate image URLs
-  const barChartUrl = useMemo(() => 
-    `http://localhost:5000/visualizations/${prediction.visualizations.bar_chart}`,
-    [prediction.visualizations.bar_chart]
+  // Pre-calculate image URLs (absent when charts are drawn client-side)
+  const barChartUrl = useMemo(() =>
+    prediction.visualizations && `http://localhost:5000/visualizations/${prediction.visualizations.bar_chart}`,
+    [prediction.visualizations]
   );
-  
-  const organChartUrl = useMemo(() => 
-    `http://localhost:5000/visualizations/${prediction.visualizations.organ_chart}`,
-    [prediction.visualizations.organ_chart]
+
+  const organChartUrl = useMemo(() =>
+    prediction.visualizations && `http://localhost:5000/visualizations/${prediction.visualizations.organ_chart}`,
+    [prediction.visualizations]
   );
-  
-  const pieChartUrl = useMemo(() => 
-    `http://localhost:5000/visualizations/${prediction.visualizations.pie_chart}`,
-    [prediction.visualizations.pie_chart]
+
+  const pieChartUrl = useMemo(() =>
+    prediction.visualizations && `http://localhost:5000/visualizations/${prediction.visualizations.pie_chart}`,
+    [prediction.visualizations]
+  );
+
+  // Rows for client-side charts, highest confidence first
+  const chartData = prediction.chart_data;
+  const topRows = useMemo(() =>
+    chartData ? [...chartData.top5].reverse().map(entry => ({
+      label: entry.readable_name, value: entry.confidence, color: 'skyblue'
+    })) : [],
+    [chartData]
+  );
+
+  const organRows = useMemo(() =>
+    chartData ? chartData.organs.map(entry => ({
+      label: entry.organ, value: entry.confidence, color: entry.is_malignant ? 'crimson' : 'forestgreen'
+    })) : [],
+    [chartData]
   );
 
   return (
@@ -170,34 +235,49 @@ const VisualizationTabs: React.FC<VisualizationTabsProps> = memo(({ prediction,
       <div className="viz-tab-content">
         {activeTab === 'bar' && (
           <div className="viz-image-container">
-            <img
-              src={barChartUrl}
-              alt="Top 5 Predictions Chart"
-              className="viz-chart-image"
-              loading="lazy"
-            />
+            {barChartUrl ? (
+              <img
+                src={barChartUrl}
+                alt="Top 5 Predictions Chart"
+                className="viz-chart-image"
+                loading="lazy"
+              />
+            ) : (
+              <ClientBarChart rows={topRows} />
+            )}
             <p className="viz-chart-caption">Top 5 classification results by confidence</p>
           </div>
         )}
         {activeTab === 'organ' && (
           <div className="viz-image-container">
-            <img
-              src={organChartUrl}
-              alt="Organ Analysis Chart"
-              className="viz-chart-image"
-              loading="lazy"
-            />
+            {organChartUrl ? (
+              <img
+                src={organChartUrl}
+                alt="Organ Analysis Chart"
+                className="viz-chart-image"
+                loading="lazy"
+              />
+            ) : (
+              <ClientBarChart rows={organRows} />
+            )}
             <p className="viz-chart-caption">Highest confidence prediction by organ/region</p>
           </div>
         )}
         {activeTab === 'pie' && (
           <div className="viz-image-container">
-            <img
-              src={pieChartUrl}
-              alt="Benign vs Malignant Chart"
-              className="viz-chart-image"
-              loading="lazy"
-            />
+            {pieChartUrl ? (
+              <img
+                src={pieChartUrl}
+                alt="Benign vs Malignant Chart"
+                className="viz-chart-image"
+                loading="lazy"
+              />
+            ) : chartData && (
+              <ClientPieChart
+                benign={chartData.benign_vs_malignant.benign}
+                malignant={chartData.benign_vs_malignant.malignant}
+              />
+            )}
             <p className="viz-chart-caption">Aggregate benign vs malignant probability assessment</p>
           </div>
         )}
@@ -23,7 +23,7 @@ interface PredictionResult {
     organ: string;
     is_malignant: boolean;
   };
-  visualizations: {
+  visualizations?: {
     bar_chart: string;
     organ_chart: string;
     pie_chart: string;